@@ -0,0 +1,91 @@
+"""
+Compare the throughput and recall of the face detectors on the same synthetic group photos.
+
+Each image is a grid of copies of the demo portrait at random sizes on a noisy background,
+so every cell holds exactly one face; a cell counts as found if the center of a detected face lies in it.
+Detectors that cannot be created, e.g., YuNet without its model file, are skipped.
+
+Usage: python benchmarks/bench_face_detectors.py [--detectors haar yunet] [--model face_detection_yunet_2023mar.onnx]
+       [--n_images 10] [--grid 3 4] [--cell 160] [--scale 1.1] [--min_nbrs 5]
+"""
+
+import argparse
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from stone.detector import get_face_detector
+from stone.utils import ArgumentError
+
+DEMO_IMAGE = Path(__file__).parents[1] / "docs" / "demo.png"
+
+
+def group_photos(n_images, rows, cols, cell, seed=0):
+    """
+    :return: The images and, for each image, the cells as (x1, y1, x2, y2).
+    """
+    rng = np.random.default_rng(seed)
+    portrait = cv2.imread(str(DEMO_IMAGE))
+    images, cells = [], []
+    for _ in range(n_images):
+        image = rng.normal(120, 40, (rows * cell, cols * cell, 3)).clip(0, 255).astype(np.uint8)
+        image = cv2.GaussianBlur(image, (9, 9), 0)
+        boxes = []
+        for r in range(rows):
+            for c in range(cols):
+                size = int(rng.uniform(0.5, 1.0) * cell)
+                x = c * cell + int(rng.integers(0, cell - size + 1))
+                y = r * cell + int(rng.integers(0, cell - size + 1))
+                image[y : y + size, x : x + size] = cv2.resize(portrait, (size, size), interpolation=cv2.INTER_AREA)
+                boxes.append((c * cell, r * cell, (c + 1) * cell, (r + 1) * cell))
+        images.append(image)
+        cells.append(boxes)
+    return images, cells
+
+
+def recall(faces, cells) -> int:
+    """
+    :return: The number of cells that hold the center of a detected face.
+    """
+    centers = [((x1 + x2) / 2, (y1 + y2) / 2) for x1, y1, x2, y2 in faces]
+    return sum(any(x1 <= cx < x2 and y1 <= cy < y2 for cx, cy in centers) for x1, y1, x2, y2 in cells)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--detectors", nargs="+", default=["haar", "yunet"])
+    parser.add_argument("--model", default=None, help="The model file of the detectors other than 'haar'.")
+    parser.add_argument("--n_images", type=int, default=10)
+    parser.add_argument("--grid", type=int, nargs=2, default=(3, 4), metavar=("ROWS", "COLS"))
+    parser.add_argument("--cell", type=int, default=160)
+    parser.add_argument("--scale", type=float, default=1.1)
+    parser.add_argument("--min_nbrs", type=int, default=5)
+    args = parser.parse_args()
+
+    images, cells = group_photos(args.n_images, *args.grid, args.cell)
+    n_faces = sum(len(boxes) for boxes in cells)
+    h, w = images[0].shape[:2]
+    print(f"Images: {args.n_images} of {w}x{h} with {n_faces} faces in total")
+    for name in args.detectors:
+        try:
+            model = None if name == "haar" else args.model
+            detector = get_face_detector(name, model=model, scale_factor=args.scale, min_neighbors=args.min_nbrs)
+        except ArgumentError as e:
+            print(f"{name:>8}: skipped, {e}")
+            continue
+        grays = [cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) for image in images]
+        # Warm up, e.g., the first inference of a network allocates its buffers
+        detector.detect(images[0], grays[0], (30, 30), False)
+        found = 0
+        start = time.perf_counter()
+        results = [detector.detect(image, gray, (30, 30), False) for image, gray in zip(images, grays)]
+        seconds = time.perf_counter() - start
+        for faces, boxes in zip(results, cells):
+            found += recall(faces, boxes)
+        print(f"{name:>8}: {args.n_images / seconds:8.2f} images/s, recall {found / n_faces:6.1%}")
+
+
+if __name__ == "__main__":
+    main()
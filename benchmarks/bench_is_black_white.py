@@ -0,0 +1,44 @@
+"""
+Compare the black/white detection with the previous implementation, which computed the per-pixel standard deviation.
+
+Usage: python benchmarks/bench_is_black_white.py [--width 6000] [--height 4000] [--repeat 5]
+"""
+
+import argparse
+import timeit
+
+import numpy as np
+
+from stone.image import is_black_white
+
+
+def legacy_is_black_white(image, threshold=192) -> bool:
+    if len(image.shape) == 2:
+        return True
+    h, w, *_ = image.shape
+    std = np.std(image, axis=2)
+    below_t = np.sum(np.where(std <= 25))
+    prob_bt = below_t / (h * w)
+    return prob_bt >= threshold
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--width", type=int, default=6000)
+    parser.add_argument("--height", type=int, default=4000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 255, (args.height, args.width, 3), dtype=np.uint8)
+    print(f"Image: {args.width}x{args.height}")
+    timings = {}
+    for name, func in [("legacy", legacy_is_black_white), ("subsampled", is_black_white)]:
+        seconds = min(timeit.repeat(lambda: func(image), number=1, repeat=args.repeat))
+        timings[name] = seconds
+        print(f"{name:>12}: {seconds * 1000:9.2f} ms")
+    print(f"     speedup: {timings['legacy'] / timings['subsampled']:9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
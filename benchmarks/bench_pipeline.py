@@ -0,0 +1,305 @@
+"""
+Time each stage of the image pipeline separately on deterministic synthetic images, and catch the regressions.
+
+The images are generated from a seed, so they are the same on every run: a noisy background with 0 or more drawn faces
+(skin-colored ovals with eyes, brows, a nose and a mouth, which the Haar cascade detects), in color or black and white.
+The cases cover every combination of `--resolutions`, `--faces` and `--image_types`.
+Besides the stages, the whole classification is timed with the default settings and with the fast ones,
+i.e., the reduced JPEG decoding, the tone lookup table and the face detection at `--detect_width`.
+
+The results are written as JSON. Pass the file of a previous run to `--compare` to print the speedup of each stage;
+the script exits with status 1 if any stage is slower than the baseline by more than `--max_slowdown`.
+
+Usage: python benchmarks/bench_pipeline.py [--resolutions 320x240 640x480 1280x960] [--faces 0 1 3]
+       [--image_types color bw] [--stages resize detect_faces] [--repeat 3] [--threads 1]
+       [--output results.json] [--compare baseline.json] [--max_slowdown 1.25]
+"""
+
+import argparse
+import json
+import platform
+import sys
+import tempfile
+import time
+import timeit
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from stone.image import (
+    ImageContext,
+    create_report_image,
+    detect_faces,
+    detect_skin_in_bw,
+    detect_skin_in_color,
+    dominant_colors,
+    is_black_white,
+    load_face_cascade,
+    load_image,
+    resize,
+    scale_boxes,
+    skin_tone,
+)
+from stone.lut import get_tone_lut
+from stone.palette import get_palette
+from stone.session import Session
+from stone.utils import __version__
+
+DEFAULT_RESOLUTIONS = ["320x240", "640x480", "1280x960"]
+DEFAULT_FACES = [0, 1, 3]
+DEFAULT_IMAGE_TYPES = ["color", "bw"]
+DEFAULT_NEW_WIDTH = 250
+DEFAULT_DETECT_WIDTH = 160
+# Skin colors in BGR, one is picked for each face. The drawn features of darker faces are too faint for the cascade
+SKIN_COLORS = [(150, 180, 225), (120, 150, 200), (100, 135, 185), (90, 120, 170)]
+
+
+def draw_face(image, x, y, size, skin_color):
+    """
+    Draw a frontal face in the square of the given size at (x, y).
+    """
+    s = size
+
+    def point(fx, fy):
+        return x + int(s * fx), y + int(s * fy)
+
+    def axes(fx, fy):
+        return max(int(s * fx), 1), max(int(s * fy), 1)
+
+    cv2.ellipse(image, point(0.5, 0.5), axes(0.36, 0.46), 0, 0, 360, skin_color, -1)
+    for eye in (0.35, 0.65):
+        cv2.ellipse(image, point(eye, 0.42), axes(0.08, 0.04), 0, 0, 360, (40, 40, 40), -1)
+        cv2.line(image, point(eye - 0.1, 0.33), point(eye + 0.1, 0.33), (50, 50, 60), max(1, s // 30))
+    cv2.line(image, point(0.5, 0.45), point(0.5, 0.6), tuple(c * 3 // 4 for c in skin_color), max(1, s // 40))
+    cv2.ellipse(image, point(0.5, 0.72), axes(0.14, 0.04), 0, 0, 360, (60, 60, 130), -1)
+
+
+def synthetic_image(width, height, n_faces=1, image_type="color", seed=0):
+    """
+    :return: A BGR image with a noisy background and `n_faces` faces side by side,
+             as large as the image allows up to 60% of its height. A black and white image has 3 equal channels.
+    """
+    rng = np.random.default_rng(seed)
+    image = rng.normal(120, 40, (height, width, 3)).clip(0, 255).astype(np.uint8)
+    image = cv2.GaussianBlur(image, (9, 9), 0)
+    if n_faces:
+        size = min(int(height * 0.6), int(width / n_faces * 0.8))
+        gap = (width - n_faces * size) // (n_faces + 1)
+        for i in range(n_faces):
+            skin_color = SKIN_COLORS[rng.integers(len(SKIN_COLORS))]
+            draw_face(image, gap + i * (size + gap), (height - size) // 2, size, skin_color)
+        image = cv2.GaussianBlur(image, (3, 3), 0)
+    if image_type == "bw":
+        image = cv2.cvtColor(cv2.cvtColor(image, cv2.COLOR_BGR2GRAY), cv2.COLOR_GRAY2BGR)
+    return image
+
+
+class Stages:
+    """
+    The inputs of all stages for one image, computed once, so each stage is timed alone.
+    Each method returns the function that is timed.
+    """
+
+    def __init__(self, image, is_bw, directory: Path, name: str, detect_width=DEFAULT_DETECT_WIDTH):
+        self.image = image
+        self.is_bw = is_bw
+        self.detect_width = detect_width
+        self.filename = directory / f"{name}.jpg"
+        cv2.imwrite(str(self.filename), image)
+        self.cascade = load_face_cascade()
+        self.palette = get_palette("bw" if is_bw else "perla")
+        self.lut = get_tone_lut(self.palette)
+        self.min_size = (image.shape[0] // 8,) * 2
+        self.faces = detect_faces(image, minSize=self.min_size, biggest_only=False, is_bw=is_bw, cascade=self.cascade)
+        if self.faces:
+            x1, y1, x2, y2 = self.faces[0]
+            self.face = image[y1:y2, x1:x2]
+        else:
+            # Without a face, the skin of the whole image is classified
+            self.face = image
+        self.skin, self.skin_mask = self.detect_skin()()
+        self.colors, self.percents = dominant_colors(self.skin, False)
+        self.tone_id, _, _, self.distance = skin_tone(self.colors, self.percents, self.palette)
+        image_type = "bw" if is_bw else "color"
+        self.session = Session(image_type=image_type, new_width=DEFAULT_NEW_WIDTH, min_size=(30, 30))
+        self.fast_session = Session(
+            image_type=image_type,
+            new_width=DEFAULT_NEW_WIDTH,
+            min_size=(30, 30),
+            use_lut=True,
+            detect_width=detect_width,
+        )
+        self.fast_session.palette_for(image_type)
+
+    def load_image(self):
+        return lambda: load_image(self.filename)
+
+    def load_image_reduced(self):
+        # A large JPEG image is decoded at 1/2, 1/4 or 1/8 of its resolution
+        return lambda: load_image(self.filename, target_width=DEFAULT_NEW_WIDTH)
+
+    def is_black_white(self):
+        return lambda: is_black_white(self.image)
+
+    def resize(self):
+        return lambda: resize(self.image, DEFAULT_NEW_WIDTH)
+
+    def detect_faces(self):
+        return lambda: detect_faces(
+            self.image, minSize=self.min_size, biggest_only=False, is_bw=self.is_bw, cascade=self.cascade
+        )
+
+    def detect_faces_detect_width(self):
+        def detect():
+            small = resize(self.image, self.detect_width)
+            ratio = small.shape[1] / self.image.shape[1]
+            min_size = tuple(max(round(size * ratio), 1) for size in self.min_size)
+            faces = detect_faces(small, minSize=min_size, biggest_only=False, is_bw=self.is_bw, cascade=self.cascade)
+            return scale_boxes(faces, small.shape, self.image.shape)
+
+        return detect
+
+    def detect_skin(self):
+        if self.is_bw:
+            return lambda: detect_skin_in_bw(self.face)
+        return lambda: detect_skin_in_color(self.face)
+
+    def dominant_colors(self):
+        return lambda: dominant_colors(self.skin, False)
+
+    def dominant_colors_histogram(self):
+        return lambda: dominant_colors(self.skin, False, method="histogram")
+
+    def skin_tone(self):
+        return lambda: skin_tone(self.colors, self.percents, self.palette)
+
+    def skin_tone_lut(self):
+        return lambda: skin_tone(self.colors, self.percents, self.palette, lut=self.lut)
+
+    def report(self):
+        def render():
+            context = ImageContext(self.image, self.is_bw)
+            # Without a face, the skin mask is already the one of the whole image
+            face_mask = context.face_mask(self.faces[0]) if self.faces else self.skin_mask
+            args = self.colors, self.percents, self.palette, self.tone_id, self.distance
+            return create_report_image(self.image, self.image, face_mask, False, False, *args)
+
+        return render
+
+    def classify(self):
+        return lambda: self.session.classify(self.image)
+
+    def classify_fast(self):
+        return lambda: self.fast_session.classify(self.image)
+
+
+STAGES = [name for name in vars(Stages) if not name.startswith("_")]
+
+
+def time_stage(func, repeat):
+    """
+    Time a function with `timeit`, calling it enough times per round to last about 0.2 seconds.
+    :return: The statistics of the time per call in milliseconds.
+    """
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    number = max(1, number // 2)
+    times = np.array(timer.repeat(repeat=repeat, number=number)) / number * 1000
+    return {
+        "min_ms": float(times.min()),
+        "median_ms": float(np.median(times)),
+        "mean_ms": float(times.mean()),
+        "number": number,
+        "repeat": repeat,
+    }
+
+
+def environment() -> dict:
+    return {
+        "stone": __version__,
+        "python": platform.python_version(),
+        "opencv": cv2.__version__,
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "system": platform.system(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+
+def compare(results, baseline_file, max_slowdown) -> list:
+    """
+    Print the speedup of each stage over a previous run.
+    :return: The (stage, case, slowdown) of the stages slower than the baseline by more than `max_slowdown`.
+    """
+    baseline = json.loads(Path(baseline_file).read_text())
+    before = {(item["stage"], item.get("case")): item["min_ms"] for item in baseline["results"]}
+    print(f"\nCompared with {baseline_file} ({baseline['environment']['time']}):")
+    regressions = []
+    for item in results:
+        key = item["stage"], item["case"]
+        if key not in before:
+            continue
+        slowdown = item["min_ms"] / before[key]
+        flag = "  REGRESSION" if slowdown > max_slowdown else ""
+        print(f"{item['stage']:>26} {item['case']:>22}: {1 / slowdown:6.2f}x{flag}")
+        if flag:
+            regressions.append((*key, slowdown))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--resolutions", nargs="+", default=DEFAULT_RESOLUTIONS, metavar="WIDTHxHEIGHT")
+    parser.add_argument("--faces", nargs="+", type=int, default=DEFAULT_FACES, help="The numbers of faces.")
+    parser.add_argument("--image_types", nargs="+", default=DEFAULT_IMAGE_TYPES, choices=DEFAULT_IMAGE_TYPES)
+    parser.add_argument("--stages", nargs="+", default=STAGES, choices=STAGES)
+    parser.add_argument("--detect_width", type=int, default=DEFAULT_DETECT_WIDTH)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--threads", type=int, default=1, help="The number of threads of OpenCV.")
+    parser.add_argument("--output", help="The JSON file the results are written to.")
+    parser.add_argument("--compare", metavar="BASELINE", help="The JSON file of a previous run.")
+    parser.add_argument(
+        "--max_slowdown",
+        type=float,
+        default=1.25,
+        help="With --compare, fail if a stage takes longer than this multiple of its baseline time.",
+    )
+    args = parser.parse_args()
+
+    # The workers of the command line run one image each, so a single thread is the representative default
+    cv2.setNumThreads(args.threads)
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for resolution in args.resolutions:
+            width, height = (int(v) for v in resolution.lower().split("x"))
+            for n_faces in args.faces:
+                for image_type in args.image_types:
+                    case = f"{resolution}/{n_faces}f/{image_type}"
+                    image = synthetic_image(width, height, n_faces, image_type, args.seed)
+                    name = case.replace("/", "_")
+                    stages = Stages(image, image_type == "bw", Path(directory), name, args.detect_width)
+                    if len(stages.faces) != n_faces:
+                        print(f"Warning: {len(stages.faces)} faces detected in {case}, expected {n_faces}")
+                    for stage in args.stages:
+                        stats = time_stage(getattr(stages, stage)(), args.repeat)
+                        results.append({"stage": stage, "case": case, **stats})
+                        print(f"{stage:>26} {case:>22}: {stats['min_ms']:10.3f} ms (median {stats['median_ms']:.3f})")
+
+    if args.output:
+        report = {"environment": environment(), "seed": args.seed, "results": results}
+        Path(args.output).write_text(json.dumps(report, indent=2))
+        print(f"\nThe results are written to {args.output}")
+    if args.compare:
+        regressions = compare(results, args.compare, args.max_slowdown)
+        if regressions:
+            print(f"\n{len(regressions)} stages are slower than the baseline by more than {args.max_slowdown}x:")
+            for stage, case, slowdown in regressions:
+                print(f"{stage:>26} {case:>22}: {slowdown:6.2f}x slower")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
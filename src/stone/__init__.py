@@ -1,10 +1,20 @@
-import numpy as np
-from stone.api import process
+from stone.aio import aprocess, aprocess_many, aiter_process
+from stone.api import process, process_batch, iter_process
 from stone.image import DEFAULT_TONE_PALETTE, show
+from stone.session import Session
 from stone.utils import __version__, check_version
 
-setattr(np, "asscalar", lambda x: np.asarray(x).item())
-
-__all__ = ["process", "DEFAULT_TONE_PALETTE", "show", "__version__"]
+__all__ = [
+    "process",
+    "process_batch",
+    "iter_process",
+    "aprocess",
+    "aprocess_many",
+    "aiter_process",
+    "Session",
+    "DEFAULT_TONE_PALETTE",
+    "show",
+    "__version__",
+]
 
 check_version()
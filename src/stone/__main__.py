@@ -1,19 +1,18 @@
-import functools
 import logging
 import os
 import shutil
 import sys
-import threading
 from datetime import datetime
-from multiprocessing import freeze_support, cpu_count, Pool
+from multiprocessing import freeze_support, cpu_count
 from typing import List
 
-import cv2
-import numpy as np
 from tqdm import tqdm
 from tqdm.contrib.logging import logging_redirect_tqdm
 
-from stone.api import process
+from stone.api import iter_process
+from stone.writer import RESULT_WRITERS, csv_header
+from stone.session import Session
+from stone.stream import classify_stream
 from stone.package import (
     __app_name__,
     __version__,
@@ -27,77 +26,19 @@ from stone.package import (
     __package_name__,
 )
 from stone.utils import (
+    ArgumentError,
+    ResultRecords,
     build_arguments,
-    build_image_paths,
+    iter_image_paths,
     is_windows,
-    ArgumentError,
-    is_debugging,
     resolve_labels,
 )
 
 LOG = logging.getLogger(__name__)
-lock = threading.Lock()
 
 use_cli = len(sys.argv) > 1 and "--gui" not in sys.argv
 
 
-def process_in_main(
-    filename_or_url,
-    image_type,
-    tone_palette,
-    tone_labels,
-    convert_to_black_white,
-    n_dominant_colors=2,
-    new_width=250,
-    scale=1.1,
-    min_nbrs=5,
-    min_size=(90, 90),
-    threshold=0.3,
-    return_report_image=False,
-):
-    """
-    This is a wrapper function that calls process() in the main process to avoid pickling error.
-    :param filename_or_url:
-    :param image_type:
-    :param tone_palette:
-    :param tone_labels:
-    :param convert_to_black_white:
-    :param n_dominant_colors:
-    :param new_width:
-    :param scale:
-    :param min_nbrs:
-    :param min_size:
-    :param threshold:
-    :param return_report_image:
-    :return:
-    """
-    try:
-        return process(
-            filename_or_url,
-            image_type=image_type,
-            tone_palette=tone_palette,
-            tone_labels=tone_labels,
-            convert_to_black_white=convert_to_black_white,
-            n_dominant_colors=n_dominant_colors,
-            new_width=new_width,
-            scale=scale,
-            min_nbrs=min_nbrs,
-            min_size=min_size,
-            threshold=threshold,
-            return_report_image=return_report_image,
-        )
-    except ArgumentError as e:
-        # Abort the app if any argument error occurs
-        raise e
-    except Exception as e:
-        msg = f"Error processing image {filename_or_url}: {str(e)}"
-        LOG.error(msg)
-        return {
-            "filename": filename_or_url,
-            "message": msg,
-        }
-
-
 def main():
     args = build_arguments()
     # Setup logger
@@ -113,8 +54,6 @@ def main():
         datefmt="%H:%M:%S",
     )
 
-    image_paths = build_image_paths(args.images, args.recursive)
-
     debug: bool = args.debug
     to_bw: bool = args.black_white
 
@@ -129,33 +68,12 @@ def main():
     min_nbrs = args.min_nbrs
 
     os.makedirs(output_dir, exist_ok=True)
-    result_filename = os.path.join(output_dir, "./result.csv")
+    writer_class = RESULT_WRITERS[args.output_format]
+    result_filename = os.path.join(output_dir, f"./result{writer_class.extension}")
     image_type_setting = args.image_type
     threshold = args.threshold
 
-    def write_to_csv(row: list):
-        with lock:
-            with open(result_filename, "a", newline="", encoding="UTF8") as f:
-                f.write(",".join(map(str, row)) + "\n")
-
-    num_workers = cpu_count() if args.n_workers == 0 else args.n_workers
-
-    pool = Pool(processes=num_workers)
-
-    # Backup result.csv if exists
-    if os.path.exists(result_filename):
-        renamed_file = os.path.join(output_dir, now.strftime("./result_bak_%y%m%d%H%M.csv"))
-        shutil.move(result_filename, renamed_file)
-    header = (
-        "file,image type,face id,"
-        + ",".join([f"dominant {i + 1},percent {i + 1}" for i in range(n_dominant_colors)])
-        + ",skin tone,tone label,accuracy(0-100)"
-    )
-    write_to_csv(header.split(","))
-
-    # Start
-    process_wrapper = functools.partial(
-        process if is_debugging() else process_in_main,
+    session_params = dict(
         image_type=image_type_setting,
         tone_palette=specified_palette,
         tone_labels=specified_tone_labels,
@@ -167,14 +85,75 @@ def main():
         min_size=min_size,
         threshold=threshold,
         return_report_image=debug,
+        # The workers save the report images themselves and only return their filenames
+        report_image_dir=os.path.join(output_dir, "debug") if debug else None,
+        use_lut=args.use_lut,
+        dominant_color_method=args.color_method,
+        kmeans_attempts=args.kmeans_attempts,
+        kmeans_max_iter=args.kmeans_max_iter,
+        seed=args.seed if args.seed >= 0 else None,
+        warm_start=args.warm_start,
+        frame_stride=args.frame_stride,
+        detect_interval=args.detect_interval,
+        face_detector=args.face_detector,
+        face_detector_model=args.detector_model,
+        detect_width=args.detect_width,
+        max_face_pixels=args.max_face_pixels,
+        reduced_decode=not args.full_decode,
+        cache_dir=None if args.no_cache else args.cache_dir or os.path.join(output_dir, "cache"),
+        cache_size=args.cache_size * 1024 * 1024,
     )
+    if getattr(args, "stream", None):
+        return run_stream(args, session_params)
+    # Validate the arguments before starting the workers
+    Session(**session_params)
+
+    # The paths are listed upfront, in a single walk of the directories, so the progress bar has a total
+    image_paths = list(iter_image_paths(args.images, args.recursive, args.include_videos))
+    if len(image_paths) == 0:
+        raise FileNotFoundError("No valid images in the specified path.")
+
+    num_workers = cpu_count() if args.n_workers == 0 else args.n_workers
+
+    records = None
+    writer_options = {}
+    if args.resume and os.path.exists(result_filename):
+        records = ResultRecords.read(result_filename)
+        if records.header == csv_header(n_dominant_colors, with_path=False):
+            # Written by an older version: the new rows keep its layout, and the images are matched by filename
+            LOG.warning(f"{result_filename} has no path column, the images are matched by their filenames.")
+            writer_options["with_path"] = False
+        elif records.header is not None and records.header != csv_header(n_dominant_colors):
+            raise ArgumentError(
+                f"Cannot resume from {result_filename}: its columns do not match the current settings, "
+                f"e.g., --n_colors is different."
+            )
+        retried = args.retry_errors and records.failed
+        if records.truncated or retried:
+            records.write(result_filename, include_failed=not args.retry_errors)
+        LOG.info(
+            f"Resuming from {result_filename}: "
+            f"{len(records.processed)} images processed, {len(records.failed)} images failed."
+        )
+    elif os.path.exists(result_filename):
+        # Backup the result file if exists
+        renamed_file = os.path.join(output_dir, now.strftime(f"./result_bak_%y%m%d%H%M{writer_class.extension}"))
+        shutil.move(result_filename, renamed_file)
+
+    # Start
     print("The program is processing your images...")
     print("Please wait for the program to finish.")
     with logging_redirect_tqdm():
-        with tqdm(image_paths, desc="Processing images", unit="images") as pbar:
-            for result in pool.imap(process_wrapper, image_paths):
+        with writer_class(
+            result_filename, n_dominant_colors=n_dominant_colors, append=records is not None, **writer_options
+        ) as writer, tqdm(total=len(image_paths), desc="Processing images", unit="images") as pbar:
+            if records is not None:
+                image_paths = skip_recorded(image_paths, records, not args.retry_errors, pbar)
+            # Results are written as soon as they finish, so the rows are not in the order of the inputs
+            results = iter_process(image_paths, n_workers=num_workers, ordered=False, **session_params)
+            for path, result in results:
+                writer.write(result, path)
                 if "message" in result:
-                    write_to_csv([result["filename"], result["message"]])
                     pbar.update()
                     continue
 
@@ -182,7 +161,6 @@ def main():
                 extension = result["extension"]
                 image_type = result["image_type"]
                 faces = result["faces"]
-                report_images = result["report_images"]
 
                 pbar.set_description(f"Processing {basename}")
                 n_faces = len(faces)
@@ -191,14 +169,6 @@ def main():
                     face_id = face_record["face_id"]
                     if face_id == "NA":
                         n_faces = 0  # Did not detect any faces
-                    dominant_colors = [[item["color"], item["percent"]] for item in face_record["dominant_colors"]]
-                    record = (
-                        [f"{basename}{extension}", image_type, face_id]
-                        + np.hstack(dominant_colors).tolist()
-                        + [face_record["skin_tone"], face_record["tone_label"], face_record["accuracy"]]
-                    )
-
-                    write_to_csv(record)
                     pbar.set_postfix(
                         {
                             "Image Type": image_type,
@@ -209,17 +179,43 @@ def main():
                             "Accuracy": face_record["accuracy"],
                         }
                     )
-                if debug:
-                    debug_dir = os.path.join(output_dir, f"./debug/{image_type}/faces_{n_faces}")
-                    os.makedirs(debug_dir, exist_ok=True)
-                    for face_id, report_image in report_images.items():
-                        image_name = f"{basename}-{face_id}"
-                        report_filename = os.path.join(debug_dir, f"{image_name}{extension}")
-                        with lock:
-                            cv2.imwrite(report_filename, report_image)
                 pbar.update()
-    pool.close()
-    pool.join()
+
+
+def skip_recorded(image_paths, records: ResultRecords, include_failed: bool, pbar: tqdm):
+    """
+    Skip the images recorded in the result file, counting them in the progress bar.
+    :param image_paths:
+    :param records:
+    :param include_failed: Whether to skip the images recorded with an error as well.
+    :param pbar:
+    :return:
+    """
+    n_skipped = 0
+    for path in image_paths:
+        if records.contains(path, include_failed):
+            n_skipped += 1
+            pbar.set_postfix({"Skipped": n_skipped})
+            pbar.update()
+            continue
+        yield path
+
+
+def run_stream(args, session_params: dict):
+    """
+    Classify the raw frames of `--stream` in this process, see `stone.stream`.
+    """
+    if not args.frame_size:
+        raise ArgumentError("--frame_size is required by --stream")
+    width, height = args.frame_size
+    # The frames are only classified once, so there is no report image or cache
+    session = Session(**{**session_params, "return_report_image": False, "report_image_dir": None, "cache_dir": None})
+    LOG.info(f"Classifying a stream of {width}x{height} frames from {args.stream}")
+    if args.stream == "-":
+        classify_stream(session, sys.stdin.buffer, width, height, drop_stale=not args.keep_all_frames)
+    else:
+        with open(args.stream, "rb", buffering=0) as stream:
+            classify_stream(session, stream, width, height, drop_stale=not args.keep_all_frames)
 
 
 sys.argv.remove("--gui") if "--gui" in sys.argv else None
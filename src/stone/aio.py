@@ -0,0 +1,126 @@
+import asyncio
+import functools
+import itertools
+import logging
+from concurrent.futures import Executor
+from pathlib import Path
+from typing import Union, Iterable, AsyncIterator, Tuple
+
+from stone.api import get_session, error_result
+from stone.image import read_url
+from stone.utils import ArgumentError, is_url, extract_filename_and_extension, is_debugging
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_MAX_CONCURRENCY = 16
+
+
+def _process_file(params: dict, filename):
+    return get_session(**params).process(filename)
+
+
+def _process_encoded(params: dict, data: bytes, basename: str, extension: str):
+    return get_session(**params).process_encoded(data, basename, extension)
+
+
+async def aprocess(filename_or_url: Union[str, Path], executor: Executor = None, **params) -> dict:
+    """
+    Coroutine version of `stone.process`, which never blocks the event loop.
+    A URL is downloaded in a background thread, then the image is decoded and classified in the `executor`.
+    Each thread or process of the executor keeps its own `Session` for the given parameters.
+    :param filename_or_url: The filename (in local devices) or URL (in Internet) of the image.
+    :param executor: The executor running the CPU-bound work, e.g., a `concurrent.futures.ProcessPoolExecutor`.
+           Defaults to the default executor of the event loop (a thread pool).
+    :param params: The same parameters as `stone.process`.
+    :return: The same result as `stone.process`.
+    """
+    loop = asyncio.get_running_loop()
+    if isinstance(filename_or_url, str) and is_url(filename_or_url):
+        data = await asyncio.to_thread(read_url, filename_or_url)
+        basename, extension = extract_filename_and_extension(filename_or_url)
+        call = functools.partial(_process_encoded, params, data, basename, extension)
+    else:
+        call = functools.partial(_process_file, params, filename_or_url)
+    return await loop.run_in_executor(executor, call)
+
+
+async def _as_completed(items: Iterable[tuple], max_concurrency: int, executor: Executor, params: dict):
+    """
+    Process the images of the (key, filename or URL) items concurrently, see `aiter_process`.
+    :return: An async iterator of (key, result) tuples in the order they finish.
+    """
+    # Validate the parameters once before starting any download
+    await asyncio.to_thread(functools.partial(get_session, **params))
+    max_concurrency = max(max_concurrency, 1)
+
+    async def process_safely(key, filename_or_url):
+        if is_debugging():
+            return key, await aprocess(filename_or_url, executor, **params)
+        try:
+            return key, await aprocess(filename_or_url, executor, **params)
+        except ArgumentError as e:
+            raise e
+        except Exception as e:
+            return key, error_result(filename_or_url, e)
+
+    items = iter(items)
+    pending = set()
+    try:
+        while True:
+            # The items are consumed on demand, so at most `max_concurrency` images are in flight
+            for key, filename_or_url in itertools.islice(items, max_concurrency - len(pending)):
+                pending.add(asyncio.ensure_future(process_safely(key, filename_or_url)))
+            if not pending:
+                return
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield task.result()
+    finally:
+        # The consumer stopped early or an error was raised
+        for task in pending:
+            task.cancel()
+
+
+async def aiter_process(
+    inputs: Iterable[Union[str, Path]],
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    executor: Executor = None,
+    **params,
+) -> AsyncIterator[Tuple[Union[str, Path], dict]]:
+    """
+    Process a (lazy) stream of images concurrently and yield the results as soon as they finish,
+    overlapping the downloads with the classification of downloaded images.
+    The inputs are consumed on demand, so at most `max_concurrency` images are in flight at any time.
+    :param inputs: An iterable of filenames or URLs, e.g., a generator over millions of paths.
+    :param max_concurrency: The maximum number of images being downloaded or classified at the same time.
+           It should be larger than the number of workers of the `executor` to keep them busy.
+    :param executor: The executor running the CPU-bound work, see `aprocess`.
+    :param params: The same parameters as `stone.process`.
+    :return: An async iterator of (input, result) tuples in the order they finish.
+             The result of an image that failed is a dict with its "filename" and the error "message".
+    :raise ArgumentError: If the parameters are invalid.
+    """
+    async for item in _as_completed(((x, x) for x in inputs), max_concurrency, executor, params):
+        yield item
+
+
+async def aprocess_many(
+    inputs: Iterable[Union[str, Path]],
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    executor: Executor = None,
+    **params,
+) -> list:
+    """
+    Process many images concurrently and collect the results, see `aiter_process`.
+    :param inputs: The filenames or URLs of the images.
+    :param max_concurrency: The maximum number of images being downloaded or classified at the same time.
+    :param executor: The executor running the CPU-bound work, see `aprocess`.
+    :param params: The same parameters as `stone.process`.
+    :return: The results in the same order as `inputs`.
+             The result of an image that failed is a dict with its "filename" and the error "message".
+    :raise ArgumentError: If the parameters are invalid.
+    """
+    results = {}
+    async for index, result in _as_completed(enumerate(inputs), max_concurrency, executor, params):
+        results[index] = result
+    return [results[i] for i in range(len(results))]
@@ -1,21 +1,36 @@
+import collections
+import functools
 import logging
+import queue
+import threading
+import time
+from multiprocessing import cpu_count, Pool
 from pathlib import Path
-from typing import Union, Literal, List
+from typing import Union, Literal, List, Iterable, Iterator, Tuple
 
-import cv2
-
-from stone.image import (
-    load_image,
-    is_black_white,
-    build_full_palette,
-    process_image,
-    normalize_palette,
-    default_tone_labels,
+from stone import download
+from stone.scheduler import ChunkScheduler
+from stone.session import Session
+from stone.cache import DEFAULT_CACHE_SIZE
+from stone.detector import DEFAULT_FACE_DETECTOR
+from stone.dominant import (
+    DEFAULT_DOMINANT_COLOR_METHOD,
+    DEFAULT_KMEANS_ATTEMPTS,
+    DEFAULT_KMEANS_MAX_ITER,
+    DEFAULT_SEED,
 )
-from stone.utils import ArgumentError
+from stone.utils import ArgumentError, is_debugging, freeze
+from stone.video import DEFAULT_FRAME_STRIDE, DEFAULT_DETECT_INTERVAL
 
 LOG = logging.getLogger(__name__)
 
+_local = threading.local()
+
+# The session held by each worker process, created once by `init_worker`.
+_worker_session = None
+# Marks the end of the inputs in `iter_process`
+_END = object()
+
 
 def process(
     filename_or_url: Union[str, Path],
@@ -30,10 +45,27 @@ def process(
     min_size=(90, 90),
     threshold=0.15,
     return_report_image=False,
+    use_lut=False,
+    dominant_color_method: Literal["kmeans", "histogram"] = DEFAULT_DOMINANT_COLOR_METHOD,
+    kmeans_attempts=DEFAULT_KMEANS_ATTEMPTS,
+    kmeans_max_iter=DEFAULT_KMEANS_MAX_ITER,
+    seed=DEFAULT_SEED,
+    warm_start=False,
+    frame_stride=DEFAULT_FRAME_STRIDE,
+    detect_interval=DEFAULT_DETECT_INTERVAL,
+    face_detector: str = DEFAULT_FACE_DETECTOR,
+    face_detector_model: Union[str, Path] = None,
+    detect_width=-1,
+    max_face_pixels=-1,
+    reduced_decode=True,
+    report_image_dir: Union[str, Path] = None,
+    cache_dir: Union[str, Path] = None,
+    cache_size: int = DEFAULT_CACHE_SIZE,
 ):
     """
     Process the image and return the result.
-    :param filename_or_url: The filename (in local devices) or URL (in Internet) of the image.
+    :param filename_or_url: The filename (in local devices) or URL (in Internet) of the image,
+           or the filename of a local video, whose faces are tracked over the frames (see `stone.video`).
     :param image_type: Specify whether the input image(s) is/are colored or black/white.
            Valid choices are: "auto", "color" or "bw", Defaults to "auto", which will be detected automatically.
     :param tone_palette: Skin tone palette; Valid choices can be `perla`, `yadon-ostfeld`, `proder`;
@@ -50,60 +82,264 @@ def process(
     :param min_size: Minimum possible face size. Faces smaller than that are ignored, defaults to (90, 90).
     :param threshold: What percentage of the skin area is required to identify the face, defaults to 0.15.
     :param return_report_image: Whether to return the report image(s) in the result. Defaults to False.
+    :param use_lut: Whether to assign the skin tone with a precomputed nearest-tone lookup table of the palette.
+           The table is built once per palette and cached on disk (see `stone.lut`). Defaults to False.
+    :param dominant_color_method: How the dominant colors are extracted from the skin pixels, see `stone.dominant`.
+           "kmeans" (default) clusters all the pixels with `cv2.kmeans`;
+           "histogram" clusters the bins of a color histogram, which is deterministic and much faster on large faces.
+    :param kmeans_attempts: The number of k-means runs from different initial centers, the most compact result is kept.
+           Only used by the "kmeans" method, defaults to 10.
+    :param kmeans_max_iter: The maximum number of iterations of each k-means run, defaults to 10.
+    :param seed: The seed of the k-means++ initialization, so the results are reproducible. Defaults to 0;
+           None gives different results on each run.
+    :param warm_start: Whether to start the k-means from the tones of the palette (the most populated ones)
+           instead of the k-means++ centers. Defaults to False.
+    :param frame_stride: For video files, only every `frame_stride`-th frame is classified, defaults to 1.
+    :param detect_interval: For video files, the faces are detected every `detect_interval` classified frames
+           and tracked in between, see `stone.video`. Defaults to 10.
+    :param face_detector: The face detector, see `stone.detector`. "haar" (default) is the Haar cascade of OpenCV;
+           "yunet" is a CNN detector that needs its model file; other detectors can be registered by name.
+    :param face_detector_model: The model file of the face detector, defaults to the builtin Haar cascade
+           or the YuNet model in `~/.cache/stone/models` (or `$STONE_MODEL_DIR`).
+    :param detect_width: If smaller than `new_width`, the faces are detected on the image resized to this width
+           and classified on the image resized to `new_width`, so a large `new_width` costs little for the detection.
+           Negative value will be ignored (the faces are detected at `new_width`), defaults to -1.
+    :param max_face_pixels: If positive, the image is downscaled for the classification
+           until the biggest face has at most about this number of pixels. Defaults to -1 (no limit).
+    :param reduced_decode: Whether to decode large JPEG images at a reduced resolution (1/2, 1/4 or 1/8)
+           that is still larger than `new_width`, which is much faster than decoding them in full. Defaults to True.
+    :param report_image_dir: If specified, the report images are saved into this directory
+           and the result contains their filenames instead of the images, see `stone.image.save_report_images`.
+    :param cache_dir: The directory of the result cache (see `stone.cache`). If set, the result of an image
+           that was already processed with the same parameters is read from the cache instead. Defaults to None (no cache).
+    :param cache_size: The maximum disk usage of the result cache in bytes, defaults to 1 GiB.
     :return:
     """
-    image, basename, extension = load_image(filename_or_url, flags=cv2.IMREAD_COLOR)
-    if image is None:
-        msg = f"{basename}{extension} is not found or is not a valid image."
-        LOG.error(msg)
-        return {
-            "filename": basename,
-            "message": msg,
-        }
-
-    is_bw = is_black_white(image)
-    decoded_image_type = image_type
-    if image_type == "auto":
-        decoded_image_type = "bw" if convert_to_black_white or is_bw else "color"
-    else:
-        is_bw = image_type == "bw"
-
-    if not tone_palette:
-        tone_palette = "bw" if decoded_image_type == "bw" else "perla"
-    if len(tone_palette) == 1:
-        tone_palette = tone_palette[0]
-
-    default_tone_palette = build_full_palette()
-    if isinstance(tone_palette, str):
-        tone_palette = tone_palette.lower()
-        if tone_palette not in default_tone_palette:
-            raise ArgumentError(f"Invalid `tone_palette`: {tone_palette}, valid choices are: {default_tone_palette.keys()}")
-        skin_tone_palette = default_tone_palette[tone_palette]
-    else:
-        skin_tone_palette = normalize_palette(tone_palette)
-
-    skin_tone_labels = tone_labels or default_tone_labels(skin_tone_palette, "C" if decoded_image_type == "color" else "B")
-    if len(skin_tone_palette) != len(skin_tone_labels):
-        raise ArgumentError("Argument -p/--palette and -l/--labels must have the same length.")
-
-    records, report_images = process_image(
-        image,
-        is_bw,
-        convert_to_black_white,
-        skin_tone_palette,
-        skin_tone_labels,
-        new_width=new_width,
+    session = get_session(
+        image_type=image_type,
+        tone_palette=tone_palette,
+        tone_labels=tone_labels,
+        convert_to_black_white=convert_to_black_white,
         n_dominant_colors=n_dominant_colors,
-        scaleFactor=scale,
-        minNeighbors=min_nbrs,
-        minSize=min_size,
+        new_width=new_width,
+        scale=scale,
+        min_nbrs=min_nbrs,
+        min_size=min_size,
         threshold=threshold,
-        verbose=return_report_image,
+        return_report_image=return_report_image,
+        use_lut=use_lut,
+        dominant_color_method=dominant_color_method,
+        kmeans_attempts=kmeans_attempts,
+        kmeans_max_iter=kmeans_max_iter,
+        seed=seed,
+        warm_start=warm_start,
+        frame_stride=frame_stride,
+        detect_interval=detect_interval,
+        face_detector=face_detector,
+        face_detector_model=face_detector_model,
+        detect_width=detect_width,
+        max_face_pixels=max_face_pixels,
+        reduced_decode=reduced_decode,
+        report_image_dir=report_image_dir,
+        cache_dir=cache_dir,
+        cache_size=cache_size,
     )
+    return session.process(filename_or_url)
+
+
+def get_session(**params) -> Session:
+    """
+    Return a `Session` for the given parameters, reusing the one created by the last call in the current thread
+    if the parameters are unchanged. This keeps repeated `process` calls from reloading the face detector and palettes.
+    :param params: The parameters of `Session`.
+    :return:
+    """
+    key = tuple((name, freeze(value)) for name, value in sorted(params.items()))
+    cached = getattr(_local, "session", None)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    session = Session(**params)
+    _local.session = key, session
+    return session
+
+
+def process_safely(session: Session, filename_or_url):
+    """
+    Process the image with the given session.
+    Errors are reported in the result instead of being raised, except argument errors, which abort the caller.
+    :param session:
+    :param filename_or_url:
+    :return: The result of `Session.process`, or a dict with the "filename" and the error "message".
+    """
+    if is_debugging():
+        return session.process(filename_or_url)
+    try:
+        return session.process(filename_or_url)
+    except ArgumentError as e:
+        # Abort the app if any argument error occurs
+        raise e
+    except Exception as e:
+        return error_result(filename_or_url, e)
+
+
+def error_result(filename_or_url, error: Exception) -> dict:
+    """
+    Log the error and build the result of an image that failed.
+    :param filename_or_url:
+    :param error:
+    :return: A dict with the "filename" and the error "message".
+    """
+    msg = f"Error processing image {filename_or_url}: {str(error)}"
+    LOG.error(msg)
     return {
-        "basename": basename,
-        "extension": extension,
-        "image_type": decoded_image_type,
-        "faces": records,
-        "report_images": report_images,
+        "filename": filename_or_url,
+        "message": msg,
     }
+
+
+def init_worker(params: dict, download_options: dict = None):
+    """
+    Initialize a worker process with its own `Session`,
+    so the face detector and palettes are loaded once per worker instead of once per image.
+    :param params: The parameters of `Session`.
+    :param download_options: The options of the downloader in the parent process, see `stone.download.configure`.
+           They are passed explicitly, since a spawned worker does not inherit them.
+    :return:
+    """
+    global _worker_session
+    if download_options is not None:
+        download.configure(**download_options)
+    _worker_session = Session(**params)
+
+
+def process_in_worker(filename_or_url):
+    """
+    Process the image with the session of the current worker, see `process_safely`.
+    :param filename_or_url:
+    :return:
+    """
+    return process_safely(_worker_session, filename_or_url)
+
+
+def process_chunk_in_worker(chunk: list):
+    """
+    Process a chunk of images with the session of the current worker.
+    :param chunk: The filenames or URLs of the images.
+    :return: The results and the processing time of the chunk in seconds.
+    """
+    start = time.perf_counter()
+    results = [process_safely(_worker_session, filename_or_url) for filename_or_url in chunk]
+    return results, time.perf_counter() - start
+
+
+def _on_done(done: queue.SimpleQueue, chunk_id, result):
+    done.put((chunk_id, result, None))
+
+
+def _on_error(done: queue.SimpleQueue, chunk_id, error):
+    done.put((chunk_id, None, error))
+
+
+def iter_process(
+    inputs: Iterable[Union[str, Path]],
+    n_workers: int = 0,
+    ordered: bool = True,
+    max_in_flight: int = None,
+    scheduler: ChunkScheduler = None,
+    **params,
+) -> Iterator[Tuple[Union[str, Path], dict]]:
+    """
+    Process a (lazy) stream of images and yield the results as soon as they are available.
+    The inputs are consumed on demand and at most `max_in_flight` images are submitted or buffered at any time,
+    so the memory usage does not grow with the number of images.
+    The images are sent to the workers in chunks sized by the `scheduler`, and the parameters are sent only once
+    when the workers start.
+    :param inputs: An iterable of filenames or URLs, e.g., a generator over millions of paths.
+    :param n_workers: The number of worker processes, 0 means the number of CPUs; 1 processes the images in the current process.
+    :param ordered: Whether to yield the results in the same order as `inputs`.
+           If False, the results are yielded in the order they finish, which keeps all workers busy.
+    :param max_in_flight: The maximum number of images read from `inputs` but not yielded yet,
+           defaults to enough images to fill two full chunks per worker.
+    :param scheduler: The `ChunkScheduler` cutting the inputs into chunks, defaults to one with the default settings.
+    :param params: The same parameters as `stone.process`.
+    :return: An iterator of (input, result) tuples, see `process_batch` for the results.
+    :raise ArgumentError: If the parameters are invalid.
+    """
+    session = Session(**params)
+    n_workers = cpu_count() if n_workers <= 0 else n_workers
+    if n_workers == 1:
+        for filename_or_url in inputs:
+            yield filename_or_url, process_safely(session, filename_or_url)
+        return
+
+    scheduler = scheduler or ChunkScheduler(n_workers)
+    max_in_flight = max(max_in_flight or 2 * n_workers * scheduler.max_chunk_size, 1)
+    # Keep a few chunks queued per worker, so the idle workers never wait for the parent
+    max_queued_chunks = 2 * n_workers
+    inputs = iter(inputs)
+    exhausted = False
+    n_in_flight = 0  # The number of images read from the inputs but not yielded yet
+    pending = collections.deque()  # (input, file size), for the images not submitted yet
+    submitted = {}  # chunk id -> (index of the first image, chunk)
+    finished = {}  # index -> (input, result), for the images waiting for their predecessors (ordered only)
+    next_chunk_id = next_index = next_yield = 0
+    done = queue.SimpleQueue()
+
+    initargs = (params, download.get_options())
+    with Pool(processes=n_workers, initializer=init_worker, initargs=initargs) as pool:
+        while True:
+            while not exhausted and n_in_flight < max_in_flight:
+                filename_or_url = next(inputs, _END)
+                if filename_or_url is _END:
+                    exhausted = True
+                    break
+                pending.append((filename_or_url, scheduler.file_size(filename_or_url)))
+                n_in_flight += 1
+            while pending and len(submitted) < max_queued_chunks:
+                chunk = scheduler.cut(pending, exhausted)
+                submitted[next_chunk_id] = next_index, chunk
+                pool.apply_async(
+                    process_chunk_in_worker,
+                    ([filename_or_url for filename_or_url, _ in chunk],),
+                    callback=functools.partial(_on_done, done, next_chunk_id),
+                    error_callback=functools.partial(_on_error, done, next_chunk_id),
+                )
+                next_chunk_id += 1
+                next_index += len(chunk)
+            if not submitted:
+                break
+
+            chunk_id, result, error = done.get()
+            if error is not None:
+                raise error
+            start, chunk = submitted.pop(chunk_id)
+            results, seconds = result
+            scheduler.observe([size for _, size in chunk], seconds)
+            if not ordered:
+                n_in_flight -= len(chunk)
+                for (filename_or_url, _), result in zip(chunk, results):
+                    yield filename_or_url, result
+                continue
+            for index, ((filename_or_url, _), result) in enumerate(zip(chunk, results), start):
+                finished[index] = filename_or_url, result
+            while next_yield in finished:
+                n_in_flight -= 1
+                yield finished.pop(next_yield)
+                next_yield += 1
+
+
+def process_batch(inputs: Iterable[Union[str, Path]], n_workers: int = 0, **params) -> list:
+    """
+    Process many images with the same settings.
+    The parameters are validated once, then the images are distributed over a pool of worker processes,
+    each of which holds its own `Session`.
+    :param inputs: The filenames or URLs of the images.
+    :param n_workers: The number of worker processes, 0 means the number of CPUs; 1 processes the images in the current process.
+    :param params: The same parameters as `stone.process`.
+    :return: The results in the same order as `inputs`.
+             The result of an image that failed is a dict with its "filename" and the error "message".
+    :raise ArgumentError: If the parameters are invalid.
+    """
+    inputs = list(inputs)
+    n_workers = min(cpu_count() if n_workers <= 0 else n_workers, max(len(inputs), 1))
+    return [result for _, result in iter_process(inputs, n_workers=n_workers, ordered=True, **params)]
@@ -0,0 +1,159 @@
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Union, Optional
+
+LOG = logging.getLogger(__name__)
+
+# 1 GiB of disk space. An entry is a few hundred bytes but takes a whole block, i.e., usually 4 KiB,
+# so this is about 250 thousand cached images.
+DEFAULT_CACHE_SIZE = 1 << 30
+# After pruning, the cache is shrunk to this fraction of its maximum size, so it is not pruned again right away
+_PRUNE_TARGET = 0.9
+# The entries are spread over the shards by the first 2 hex digits of the image hash, see `ResultCache._path`
+_SHARDS = [f"{i:02x}" for i in range(256)]
+
+
+def content_hash(data) -> str:
+    """
+    Hash the content of an image file.
+    :param data: A bytes-like object, e.g., the bytes of a JPEG file.
+    :return: The hex digest.
+    """
+    return hashlib.blake2b(data, digest_size=20).hexdigest()
+
+
+def disk_usage(stat: os.stat_result) -> int:
+    """
+    The disk space taken by a file, which is usually more than its size for small files.
+    :param stat: The result of `os.stat`.
+    :return: The size in bytes.
+    """
+    # st_blocks counts 512-byte units, and it does not exist on Windows
+    return max(stat.st_size, getattr(stat, "st_blocks", 0) * 512)
+
+
+def params_hash(params: dict) -> str:
+    """
+    Hash the effective parameters of a classification, see `Session.cache_params`.
+    :param params: A dict of plain values (str, numbers, tuples, None).
+    :return: The hex digest.
+    """
+    text = repr(sorted(params.items()))
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=8).hexdigest()
+
+
+class ResultCache:
+    """
+    An on-disk cache of classification results, addressed by the content of the image and the parameters.
+
+    The results of one set of parameters are stored as small JSON files in `<directory>/<params hash>/`,
+    so the same image is recognized under any name or path, and changing any parameter never reuses stale results.
+    The cache is shared safely by concurrent processes: files are replaced atomically and
+    the least recently used entries are evicted when the total disk usage exceeds `max_bytes`.
+
+    The entries are sharded by their image hash, which is uniformly distributed, so each of the 256 shards
+    holds about the same share of the cache. A shard is pruned against its share of `max_bytes`
+    once enough has been written to it, which only lists and stats the entries of that shard.
+    """
+
+    def __init__(self, directory: Union[str, Path], max_bytes: int = DEFAULT_CACHE_SIZE):
+        """
+        :param directory: The cache directory, created on demand.
+        :param max_bytes: The maximum total size of the cached results in bytes.
+        """
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        # The disk usage written to each shard since it was last pruned
+        self._written = dict.fromkeys(_SHARDS, 0)
+
+    def _path(self, image_hash: str, fingerprint: str) -> Path:
+        return self.directory / fingerprint / image_hash[:2] / f"{image_hash}.json"
+
+    def get(self, image_hash: str, fingerprint: str) -> Optional[dict]:
+        """
+        Read a cached result.
+        :param image_hash: The `content_hash` of the image.
+        :param fingerprint: The `params_hash` of the parameters.
+        :return: The cached result, or None if it is not cached.
+        """
+        path = self._path(image_hash, fingerprint)
+        try:
+            with open(path, encoding="utf-8") as f:
+                result = json.load(f)
+            # Mark as recently used for the eviction
+            os.utime(path)
+            return result
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            LOG.warning(f"Ignoring the invalid cache entry {path}: {e}")
+            return None
+
+    def put(self, image_hash: str, fingerprint: str, result: dict):
+        """
+        Store a result, which must be serializable to JSON.
+        :param image_hash: The `content_hash` of the image.
+        :param fingerprint: The `params_hash` of the parameters.
+        :param result:
+        :return:
+        """
+        path = self._path(image_hash, fingerprint)
+        text = json.dumps(result, separators=(",", ":"))
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(tmp_path, path)
+            usage = disk_usage(os.stat(path))
+        except OSError as e:
+            LOG.warning(f"Failed to write the cache entry {path}: {e}")
+            return
+        shard = image_hash[:2]
+        self._written[shard] += usage
+        # Amortize the cost of scanning a shard over many writes
+        if self._written[shard] > self.max_bytes / len(_SHARDS) * (1 - _PRUNE_TARGET):
+            self.prune(shard)
+
+    def prune(self, shard: str = None) -> int:
+        """
+        Evict the least recently used entries until each shard is smaller than its share of `max_bytes`.
+        :param shard: The shard to prune, i.e., 2 hex digits. Defaults to None, which prunes all shards.
+        :return: The number of evicted entries.
+        """
+        return sum(self._prune_shard(shard) for shard in ([shard] if shard is not None else _SHARDS))
+
+    def _prune_shard(self, shard: str) -> int:
+        self._written[shard] = 0
+        max_bytes = self.max_bytes / len(_SHARDS)
+        entries = []
+        total = 0
+        # The shard is split over the directories of the parameters, see `_path`
+        for path in self.directory.glob(f"*/{shard}/*.json"):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            usage = disk_usage(stat)
+            entries.append((stat.st_mtime, usage, path))
+            total += usage
+        if total <= max_bytes:
+            return 0
+
+        entries.sort()
+        target = max_bytes * _PRUNE_TARGET
+        n_evicted = 0
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            n_evicted += 1
+        LOG.info(f"Evicted {n_evicted} entries from the shard {shard} of the result cache {self.directory}")
+        return n_evicted
@@ -0,0 +1,180 @@
+"""
+Face detectors.
+
+A detector finds the candidate faces of an image; `stone.image.detect_faces` then keeps the candidates with enough skin.
+The Haar cascade of OpenCV is the default; YuNet, a small CNN run by `cv2.FaceDetectorYN` on the CPU,
+is usually both faster and more accurate, but its model file must be downloaded first.
+Other detectors can be added with `register_face_detector` and selected by name like the builtin ones.
+"""
+
+import abc
+import logging
+import os
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from stone.utils import ArgumentError
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_FACE_DETECTOR = "haar"
+FACE_CASCADE_FILE = "haarcascade_frontalface_default.xml"
+YUNET_MODEL_FILE = "face_detection_yunet_2023mar.onnx"
+YUNET_MODEL_URL = "https://github.com/opencv/opencv_zoo/tree/main/models/face_detection_yunet"
+# The minimum confidence of a YuNet face and the overlap above which the less confident of two faces is removed
+YUNET_SCORE_THRESHOLD = 0.9
+YUNET_NMS_THRESHOLD = 0.3
+
+
+def default_model_dir() -> Path:
+    """
+    The directory where the model files of the detectors are looked up.
+    It can be changed with the `STONE_MODEL_DIR` environment variable, defaults to `~/.cache/stone/models`.
+    :return:
+    """
+    return Path(os.environ.get("STONE_MODEL_DIR") or Path.home() / ".cache" / "stone" / "models")
+
+
+def load_face_cascade(filename=FACE_CASCADE_FILE):
+    """
+    Load the Haar cascade used for face detection.
+    Parsing the XML file is expensive, so callers processing many images should load it once and reuse it,
+    e.g., via `stone.Session`.
+    :param filename: The cascade filename, relative to `cv2.data.haarcascades` unless it is an existing path.
+    :return: The loaded `cv2.CascadeClassifier`.
+    """
+    path = filename if Path(filename).is_file() else cv2.data.haarcascades + filename
+    cascade = cv2.CascadeClassifier(path)
+    if cascade.empty():
+        raise ArgumentError(f"Failed to load the face cascade: {path}")
+    return cascade
+
+
+class FaceDetector(abc.ABC):
+    """
+    The interface of the face detectors. A detector loads its model once and is reused for many images,
+    it is not required to be thread-safe.
+    """
+
+    @abc.abstractmethod
+    def detect(self, image: np.ndarray, gray: np.ndarray, min_size=(30, 30), biggest_only=True) -> np.ndarray:
+        """
+        Detect the faces of an image.
+        :param image: The BGR image.
+        :param gray: The gray image, computed once for all the stages, see `stone.image.ImageContext`.
+        :param min_size: The minimum face size as (width, height), smaller faces are ignored.
+        :param biggest_only: Whether to return the biggest face only.
+        :return: The faces as an integer array of (x1, y1, x2, y2) rows.
+        """
+
+
+class HaarFaceDetector(FaceDetector):
+    """
+    The Haar cascade of OpenCV, a multi-scale sliding window over the equalized gray image.
+    """
+
+    def __init__(self, model=FACE_CASCADE_FILE, scale_factor=1.1, min_neighbors=5, cascade=None):
+        """
+        :param model: The cascade file, see `load_face_cascade`.
+        :param scale_factor: How much the image size is reduced at each image scale.
+        :param min_neighbors: How many neighbors each candidate rectangle should have to retain it.
+        :param cascade: An already loaded `cv2.CascadeClassifier`, used instead of loading `model`.
+        """
+        self.cascade = cascade if cascade is not None else load_face_cascade(model or FACE_CASCADE_FILE)
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+
+    def detect(self, image, gray, min_size=(30, 30), biggest_only=True):
+        flags = (cv2.CASCADE_SCALE_IMAGE | cv2.CASCADE_FIND_BIGGEST_OBJECT) if biggest_only else cv2.CASCADE_SCALE_IMAGE
+        faces = self.cascade.detectMultiScale(
+            cv2.equalizeHist(gray),
+            scaleFactor=self.scale_factor,
+            minNeighbors=self.min_neighbors,
+            minSize=tuple(min_size),
+            flags=flags,
+        )
+        if len(faces) == 0:
+            return np.empty((0, 4), dtype=np.int32)
+        # Change the format of faces from (x, y, w, h) to (x, y, x+w, y+h)
+        faces[:, 2:] += faces[:, :2]
+        return faces
+
+
+class YuNetFaceDetector(FaceDetector):
+    """
+    The YuNet CNN face detector, run by `cv2.FaceDetectorYN` on the CPU.
+    """
+
+    def __init__(
+        self,
+        model=None,
+        scale_factor=None,
+        min_neighbors=None,
+        score_threshold=YUNET_SCORE_THRESHOLD,
+        nms_threshold=YUNET_NMS_THRESHOLD,
+    ):
+        """
+        :param model: The ONNX model file, defaults to `YUNET_MODEL_FILE` in `default_model_dir`.
+        :param scale_factor: Unused, the settings of the Haar cascade are accepted so detectors are interchangeable.
+        :param min_neighbors: Unused, see `scale_factor`.
+        :param score_threshold: See `YUNET_SCORE_THRESHOLD`.
+        :param nms_threshold: See `YUNET_NMS_THRESHOLD`.
+        :raise ArgumentError: If the model file does not exist.
+        """
+        path = Path(model) if model else default_model_dir() / YUNET_MODEL_FILE
+        if not path.is_file():
+            raise ArgumentError(f"The YuNet model is not found: {path}, it can be downloaded from {YUNET_MODEL_URL}")
+        self.model = cv2.FaceDetectorYN.create(str(path), "", (320, 320), score_threshold, nms_threshold)
+        self._input_size: Optional[Tuple[int, int]] = None
+
+    def detect(self, image, gray, min_size=(30, 30), biggest_only=True):
+        h, w = image.shape[:2]
+        if self._input_size != (w, h):
+            self.model.setInputSize((w, h))
+            self._input_size = (w, h)
+        _, detections = self.model.detect(image)
+        if detections is None or len(detections) == 0:
+            return np.empty((0, 4), dtype=np.int32)
+        # Each detection is (x, y, w, h), 5 landmarks and the score
+        x1, y1 = np.floor(detections[:, 0]), np.floor(detections[:, 1])
+        x2, y2 = np.ceil(detections[:, 0] + detections[:, 2]), np.ceil(detections[:, 1] + detections[:, 3])
+        faces = np.stack([x1.clip(0, w), y1.clip(0, h), x2.clip(0, w), y2.clip(0, h)], axis=1).astype(np.int32)
+        sizes = faces[:, 2:] - faces[:, :2]
+        faces = faces[(sizes[:, 0] >= min_size[0]) & (sizes[:, 1] >= min_size[1])]
+        if biggest_only and len(faces) > 1:
+            areas = (faces[:, 2] - faces[:, 0]) * (faces[:, 3] - faces[:, 1])
+            faces = faces[[np.argmax(areas)]]
+        return faces
+
+
+FACE_DETECTORS: Dict[str, Callable[..., FaceDetector]] = {
+    "haar": HaarFaceDetector,
+    "yunet": YuNetFaceDetector,
+}
+
+
+def register_face_detector(name: str, factory: Callable[..., FaceDetector]):
+    """
+    Register a face detector, so it can be selected by name, e.g., by `stone.Session(face_detector=name)`.
+    Register it at import time of a module that the worker processes also import.
+    :param name: The name of the detector, an existing one is replaced.
+    :param factory: A `FaceDetector` subclass or a function creating one,
+           which takes the settings `model`, `scale_factor` and `min_neighbors` as keyword arguments.
+    :return:
+    """
+    FACE_DETECTORS[name] = factory
+
+
+def get_face_detector(name: str = DEFAULT_FACE_DETECTOR, **options) -> FaceDetector:
+    """
+    :param name: The name of the detector, see `FACE_DETECTORS`.
+    :param options: The settings of the detector, see `register_face_detector`.
+    :return: A new detector.
+    :raise ArgumentError: If the name is unknown.
+    """
+    if name not in FACE_DETECTORS:
+        raise ArgumentError(f"Invalid face detector: {name}, valid choices are: {list(FACE_DETECTORS)}")
+    return FACE_DETECTORS[name](**options)
@@ -0,0 +1,283 @@
+"""
+Dominant color extractors.
+
+An extractor takes the skin pixels of a face as an (n, 3) uint8 array and returns the dominant colors in BGR,
+ordered by their percents, and the percents.
+"""
+
+import cv2
+import numpy as np
+
+from stone.utils import ArgumentError
+
+DEFAULT_DOMINANT_COLOR_METHOD = "kmeans"
+# Number of bits kept per channel by the histogram extractor, i.e., a 32x32x32 histogram.
+DEFAULT_HISTOGRAM_BITS = 5
+# The histogram extractor uses at most this number of pixels (evenly strided) of a face.
+DEFAULT_PIXEL_BUDGET = 1 << 18
+# The number of times the k-means is run from different initial centers, keeping the most compact result.
+DEFAULT_KMEANS_ATTEMPTS = 10
+# A k-means run stops after this number of iterations, or when no center moves by more than `KMEANS_EPS`.
+DEFAULT_KMEANS_MAX_ITER = 10
+KMEANS_EPS = 1.0
+# The seed of the k-means++ initialization, so the results are reproducible.
+DEFAULT_SEED = 0
+# The initial centers are chosen among at most this number of pixels (evenly strided), which is much cheaper
+# than choosing them among all the pixels and hardly changes their quality.
+_SEED_SAMPLE_SIZE = 1 << 14
+
+
+def nearest_labels(points: np.ndarray, centers: np.ndarray) -> np.ndarray:
+    """
+    :param points: An (n, d) array.
+    :param centers: A (k, d) array.
+    :return: The (n,) indices of the nearest center of each point.
+    """
+    points = np.asarray(points, dtype=np.float32)
+    centers = np.asarray(centers, dtype=np.float32)
+    # |p - c|^2 = |p|^2 - 2 p.c + |c|^2, where |p|^2 is the same for all centers
+    dists = np.sum(centers**2, axis=1) - 2 * points @ centers.T
+    return np.argmin(dists, axis=1)
+
+
+def seed_centers(points: np.ndarray, weights=None, n_clusters: int = 2, rng=None, centers=None) -> np.ndarray:
+    """
+    Choose the initial centers of a k-means among the points.
+    With a random generator, this is the k-means++ seeding: each center is drawn with a probability proportional to
+    the weighted squared distance to the nearest chosen center.
+    Without one, the point with the largest weighted squared distance is chosen instead (the heaviest point first),
+    which is deterministic.
+    :param points: An (n, d) array.
+    :param weights: The (n,) weights of the points, defaults to 1.
+    :param n_clusters: The number of centers.
+    :param rng: A `numpy.random.Generator`, or None.
+    :param centers: Already chosen centers to complete, if any.
+    :return: An (n_clusters, d) float64 array.
+    """
+    points = np.asarray(points)
+    if not np.issubdtype(points.dtype, np.floating):
+        points = points.astype(np.float64)
+    weights = np.ones(len(points)) if weights is None else np.asarray(weights, dtype=np.float64)
+    chosen = [] if centers is None else list(np.asarray(centers, dtype=points.dtype))
+    min_dists = None
+    for center in chosen:
+        min_dists = _nearer(min_dists, _squared_distances(points, center))
+    while len(chosen) < n_clusters:
+        scores = weights if min_dists is None else weights * min_dists
+        if rng is None:
+            index = np.argmax(scores)
+        else:
+            cumulative = np.cumsum(scores)
+            if cumulative[-1] > 0:
+                index = min(np.searchsorted(cumulative, rng.random() * cumulative[-1], side="right"), len(points) - 1)
+            else:
+                # All the points are already centers
+                index = rng.integers(len(points))
+        chosen.append(points[index])
+        min_dists = _nearer(min_dists, _squared_distances(points, points[index]))
+    return np.array(chosen, dtype=np.float64).reshape(n_clusters, points.shape[1])
+
+
+def _squared_distances(points: np.ndarray, center: np.ndarray) -> np.ndarray:
+    diffs = points - center
+    return np.einsum("ij,ij->i", diffs, diffs)
+
+
+def _nearer(min_dists, dists):
+    return dists if min_dists is None else np.minimum(min_dists, dists, out=min_dists)
+
+
+def warm_start_centers(points: np.ndarray, weights, init_centers, n_clusters: int, rng=None) -> np.ndarray:
+    """
+    Choose the initial centers of a k-means from the supplied ones, e.g., the colors of the previous video frame
+    or the tones of the palette.
+    The (at most `n_clusters`) ones with the largest weights of nearest points are kept, ignoring those without any,
+    and completed by `seed_centers` if needed.
+    :param points: An (n, d) array.
+    :param weights: The (n,) weights of the points, defaults to 1.
+    :param init_centers: An (m, d) array.
+    :param n_clusters:
+    :param rng: See `seed_centers`.
+    :return: An (n_clusters, d) float64 array.
+    """
+    init_centers = np.asarray(init_centers, dtype=np.float64).reshape(-1, np.shape(points)[1])
+    totals = np.bincount(nearest_labels(points, init_centers), weights=weights, minlength=len(init_centers))
+    # A center without any nearest point would give an empty cluster
+    keep = np.argsort(-totals, kind="stable")[:n_clusters]
+    keep = np.sort(keep[totals[keep] > 0])
+    init_centers = init_centers[keep]
+    return seed_centers(points, weights, n_clusters, rng, centers=init_centers)
+
+
+def kmeans_dominant_colors(
+    pixels: np.ndarray,
+    n_clusters: int = 2,
+    attempts: int = DEFAULT_KMEANS_ATTEMPTS,
+    max_iter: int = DEFAULT_KMEANS_MAX_ITER,
+    seed=DEFAULT_SEED,
+    init_centers=None,
+):
+    """
+    Cluster all the pixels with `cv2.kmeans`.
+    Each attempt starts from the k-means++ centers drawn from a generator seeded with `seed`,
+    so the results are reproducible, and the most compact result is kept.
+    The centers are drawn from a subsample of the pixels, see `_SEED_SAMPLE_SIZE`.
+    :param pixels: An (n, 3) array of BGR colors.
+    :param n_clusters:
+    :param attempts: The number of k-means runs.
+    :param max_iter: The maximum number of iterations of each run.
+    :param seed: The seed of the initialization, or None to seed it randomly.
+    :param init_centers: The BGR colors the first run starts from, see `warm_start_centers`.
+    :return: The colors as an (m, 3) float32 array and their percents, ordered by the percents.
+             There are fewer than `n_clusters` colors if a cluster is empty.
+    """
+    data = np.float32(pixels)
+    sample = data[:: -(-len(data) // _SEED_SAMPLE_SIZE)] if len(data) > _SEED_SAMPLE_SIZE else data
+    rng = np.random.default_rng(seed)
+    criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, max_iter, KMEANS_EPS)
+    best = None
+    for attempt in range(max(attempts, 1)):
+        if attempt == 0 and init_centers is not None:
+            centers = warm_start_centers(sample, None, init_centers, n_clusters, rng)
+        else:
+            centers = seed_centers(sample, None, n_clusters, rng)
+        labels = nearest_labels(data, centers).astype(np.int32).reshape(-1, 1)
+        compactness, labels, colors = cv2.kmeans(data, n_clusters, labels, criteria, 1, cv2.KMEANS_USE_INITIAL_LABELS)
+        if best is None or compactness < best[0]:
+            best = compactness, labels, colors
+    compactness, labels, colors = best
+    labels, counts = np.unique(labels, return_counts=True)
+
+    order = (-counts).argsort(kind="stable")
+    colors = colors[labels[order]]
+    counts = counts[order]
+
+    percents = counts / counts.sum()
+
+    return colors, percents
+
+
+def color_histogram(pixels: np.ndarray, bits: int = DEFAULT_HISTOGRAM_BITS):
+    """
+    Quantize the colors into a 3D histogram.
+    :param pixels: An (n, 3) uint8 array of BGR colors.
+    :param bits: The number of bits kept per channel.
+    :return: The mean color of the pixels in each non-empty bin as an (m, 3) float64 array, and the pixel counts.
+    """
+    shift = 8 - bits
+    pixels = np.asarray(pixels, dtype=np.uint8)
+    q = (pixels >> shift).astype(np.intp)
+    bins = (q[:, 0] << (2 * bits)) | (q[:, 1] << bits) | q[:, 2]
+    n_bins = 1 << (3 * bits)
+    counts = np.bincount(bins, minlength=n_bins)
+    sums = np.stack([np.bincount(bins, weights=pixels[:, c], minlength=n_bins) for c in range(3)], axis=1)
+    non_empty = counts > 0
+    counts = counts[non_empty]
+    return sums[non_empty] / counts[:, np.newaxis], counts
+
+
+def weighted_kmeans(
+    points: np.ndarray,
+    weights: np.ndarray,
+    n_clusters: int,
+    max_iter: int = DEFAULT_KMEANS_MAX_ITER,
+    init_centers=None,
+):
+    """
+    Lloyd's k-means of weighted points, started from the deterministic centers of `seed_centers`
+    or from `init_centers`, see `warm_start_centers`.
+    :param points: An (m, 3) float array.
+    :param weights: The (m,) weights of the points.
+    :param n_clusters:
+    :param max_iter:
+    :param init_centers: The initial centers, if any.
+    :return: The (k, 3) centers and the (m,) labels of the points, where k = min(n_clusters, m).
+    """
+    n_clusters = min(n_clusters, len(points))
+    weights = np.asarray(weights, dtype=np.float64)
+    if init_centers is None:
+        centers = seed_centers(points, weights, n_clusters)
+    else:
+        centers = warm_start_centers(points, weights, init_centers, n_clusters)
+
+    labels = np.zeros(len(points), dtype=np.intp)
+    for _ in range(max_iter):
+        dists = np.sum((points[:, np.newaxis, :] - centers[np.newaxis, :, :]) ** 2, axis=2)
+        labels = np.argmin(dists, axis=1)
+        totals = np.bincount(labels, weights=weights, minlength=n_clusters)
+        new_centers = centers.copy()
+        for c in range(points.shape[1]):
+            sums = np.bincount(labels, weights=weights * points[:, c], minlength=n_clusters)
+            np.divide(sums, totals, out=new_centers[:, c], where=totals > 0)
+        shift = np.max(np.abs(new_centers - centers))
+        centers = new_centers
+        if shift <= KMEANS_EPS:
+            break
+    return centers, labels
+
+
+def histogram_dominant_colors(
+    pixels: np.ndarray,
+    n_clusters: int = 2,
+    attempts: int = 1,
+    max_iter: int = DEFAULT_KMEANS_MAX_ITER,
+    seed=None,
+    init_centers=None,
+    bits: int = DEFAULT_HISTOGRAM_BITS,
+    pixel_budget: int = DEFAULT_PIXEL_BUDGET,
+):
+    """
+    Cluster the bins of a color histogram with a weighted k-means.
+    The pixels are subsampled to `pixel_budget` and there are at most `2 ** (3 * bits)` bins,
+    so the cost is bounded whatever the face size, and the result is deterministic.
+    :param pixels: An (n, 3) uint8 array of BGR colors.
+    :param n_clusters:
+    :param attempts: Unused, for compatibility with `kmeans_dominant_colors`; the initialization is deterministic.
+    :param max_iter: The maximum number of iterations of the k-means.
+    :param seed: Unused, for compatibility with `kmeans_dominant_colors`.
+    :param init_centers: The BGR colors the k-means starts from, see `warm_start_centers`.
+    :param bits: The number of bits kept per channel of the histogram.
+    :param pixel_budget: The maximum number of pixels used.
+    :return: The colors as an (m, 3) float32 array and their percents, ordered by the percents.
+             There are fewer than `n_clusters` colors if a cluster is empty.
+    """
+    if len(pixels) == 0:
+        raise ValueError("No skin pixels to extract the dominant colors from")
+    if len(pixels) > pixel_budget:
+        pixels = pixels[:: -(-len(pixels) // pixel_budget)]
+    bin_colors, bin_counts = color_histogram(pixels, bits)
+    centers, labels = weighted_kmeans(bin_colors, bin_counts, n_clusters, max_iter, init_centers)
+    counts = np.bincount(labels, weights=bin_counts, minlength=len(centers))
+    # The exact mean color of the pixels of each cluster
+    sums = np.stack(
+        [np.bincount(labels, weights=bin_counts * bin_colors[:, c], minlength=len(centers)) for c in range(3)],
+        axis=1,
+    )
+
+    order = (-counts).argsort(kind="stable")
+    order = order[counts[order] > 0]
+    colors = np.float32(sums[order] / counts[order, np.newaxis])
+    counts = counts[order]
+
+    percents = counts / counts.sum()
+
+    return colors, percents
+
+
+DOMINANT_COLOR_EXTRACTORS = {
+    "kmeans": kmeans_dominant_colors,
+    "histogram": histogram_dominant_colors,
+}
+
+
+def get_dominant_color_extractor(method: str):
+    """
+    :param method: The name of the extractor, one of the keys of `DOMINANT_COLOR_EXTRACTORS`.
+    :return: The extractor function.
+    """
+    try:
+        return DOMINANT_COLOR_EXTRACTORS[method]
+    except KeyError:
+        raise ArgumentError(
+            f"Invalid dominant color method: {method}, valid choices are {list(DOMINANT_COLOR_EXTRACTORS)}"
+        ) from None
@@ -0,0 +1,197 @@
+import logging
+import os
+import threading
+import time
+from typing import Tuple, Union
+
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ProtocolError, ReadTimeoutError
+
+LOG = logging.getLogger(__name__)
+
+# (connect, read) timeouts in seconds
+DEFAULT_TIMEOUT = (5.0, 30.0)
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 0.5
+DEFAULT_MAX_BACKOFF = 10.0
+DEFAULT_MAX_BYTES = 50 * 1024 * 1024
+# The number of hosts whose connections are kept and the number of connections kept per host
+DEFAULT_POOL_SIZE = 16
+RETRY_STATUSES = frozenset({408, 429, 500, 502, 503, 504})
+NOT_FOUND_STATUSES = frozenset({404, 410})
+
+_CHUNK_SIZE = 64 * 1024
+# Errors worth retrying, including the ones raised by urllib3 while reading the raw body
+_RETRY_ERRORS = (
+    requests.ConnectionError,
+    requests.Timeout,
+    requests.exceptions.ChunkedEncodingError,
+    ProtocolError,
+    ReadTimeoutError,
+)
+
+_default_options = {}
+_default = None  # (pid, downloader)
+_default_lock = threading.Lock()
+
+
+class DownloadError(IOError):
+    """
+    Raised when a URL cannot be downloaded, e.g., the server keeps failing or the content is too large.
+    """
+
+    pass
+
+
+class Downloader:
+    """
+    An HTTP(S) client for downloading images.
+
+    Connections are kept alive and pooled per host, so downloading many images from the same host
+    pays the TCP/TLS setup only once. Failed requests are retried with exponential backoff
+    and the body is read into a single buffer, which can be decoded by `cv2.imdecode` without another copy.
+    The connection pools are thread-safe, so one downloader can be shared by many threads.
+    """
+
+    def __init__(
+        self,
+        timeout: Union[float, Tuple[float, float]] = DEFAULT_TIMEOUT,
+        retries: int = DEFAULT_RETRIES,
+        backoff_factor: float = DEFAULT_BACKOFF,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        pool_size: int = DEFAULT_POOL_SIZE,
+        headers: dict = None,
+    ):
+        """
+        Create a downloader.
+        :param timeout: The timeout in seconds, either one value or a (connect, read) tuple.
+        :param retries: How many times a failed request is retried.
+               Connection errors, timeouts and the statuses in `RETRY_STATUSES` are retried.
+        :param backoff_factor: The delay before the n-th retry is `backoff_factor * 2 ** (n - 1)` seconds.
+        :param max_bytes: The maximum size of a response body, larger ones raise a `DownloadError`.
+        :param pool_size: The number of hosts to keep connections to, and of connections kept per host.
+        :param headers: Extra headers sent with every request.
+        """
+        self.timeout = timeout
+        self.retries = max(retries, 0)
+        self.backoff_factor = backoff_factor
+        self.max_bytes = max_bytes
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        if headers:
+            self.session.headers.update(headers)
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def download(self, url: str) -> np.ndarray:
+        """
+        Download the content of the url.
+        :param url:
+        :return: A uint8 array viewing the downloaded bytes.
+        :raise FileNotFoundError: If the server responds with 404 or 410.
+        :raise DownloadError: If the download still fails after retrying, or the content is too large.
+        """
+        for attempt in range(self.retries + 1):
+            if attempt > 0:
+                delay = min(self.backoff_factor * 2 ** (attempt - 1), DEFAULT_MAX_BACKOFF)
+                LOG.debug(f"Retrying {url} in {delay:.2f}s ({attempt}/{self.retries})")
+                time.sleep(delay)
+            try:
+                with self.session.get(url, timeout=self.timeout, stream=True) as resp:
+                    if resp.status_code in NOT_FOUND_STATUSES:
+                        raise FileNotFoundError(f"{url} is not found.")
+                    if resp.status_code in RETRY_STATUSES and attempt < self.retries:
+                        continue
+                    if resp.status_code >= 400:
+                        raise DownloadError(f"Failed to download {url}: HTTP {resp.status_code}.")
+                    return self._read_body(url, resp)
+            except _RETRY_ERRORS as e:
+                if attempt == self.retries:
+                    raise DownloadError(f"Failed to download {url}: {e}") from e
+
+    def _read_body(self, url, resp: requests.Response) -> np.ndarray:
+        length = resp.headers.get("Content-Length")
+        encoded = resp.headers.get("Content-Encoding", "identity").lower() != "identity"
+        if length is not None and length.isdigit() and not encoded:
+            length = int(length)
+            self._check_size(url, length)
+            # Read straight into a buffer of the announced size
+            buffer = np.empty(length, dtype=np.uint8)
+            view = memoryview(buffer)
+            n_read = 0
+            while n_read < length:
+                n = resp.raw.readinto(view[n_read:])
+                if not n:
+                    raise requests.exceptions.ChunkedEncodingError(
+                        f"Incomplete response: {n_read} of {length} bytes received."
+                    )
+                n_read += n
+            return buffer
+
+        buffer = bytearray()
+        for chunk in resp.iter_content(_CHUNK_SIZE):
+            buffer += chunk
+            self._check_size(url, len(buffer))
+        return np.frombuffer(buffer, dtype=np.uint8)
+
+    def _check_size(self, url, size):
+        if self.max_bytes and size > self.max_bytes:
+            raise DownloadError(f"Failed to download {url}: the content is larger than {self.max_bytes} bytes.")
+
+
+def configure(**options):
+    """
+    Set the options of the default downloader used by `get_downloader`, e.g., `configure(timeout=10, retries=5)`.
+    It affects the downloaders created afterwards in the current process.
+    The worker processes of `stone.iter_process` and `stone.process_batch` receive these options when they start,
+    see `get_options`; other worker processes have to call `configure` themselves, e.g., in their initializer.
+    :param options: The parameters of `Downloader`.
+    :return:
+    """
+    global _default
+    with _default_lock:
+        _default_options.clear()
+        _default_options.update(options)
+        _default = None
+
+
+def get_options() -> dict:
+    """
+    The options set by `configure`, to be passed on to the worker processes.
+    :return:
+    """
+    with _default_lock:
+        return dict(_default_options)
+
+
+def get_downloader() -> Downloader:
+    """
+    Return the default downloader of the current process, shared by all its threads,
+    so the connections are reused by all downloads but never shared with forked processes.
+    :return:
+    """
+    global _default
+    with _default_lock:
+        if _default is None or _default[0] != os.getpid():
+            _default = os.getpid(), Downloader(**_default_options)
+        return _default[1]
+
+
+def download(url: str) -> np.ndarray:
+    """
+    Download the content of the url with the default downloader, see `Downloader.download`.
+    :param url:
+    :return:
+    """
+    return get_downloader().download(url)
@@ -1,170 +1,201 @@
 import functools
 import logging
 import math
-import re
-import urllib.error
 from pathlib import Path
-from urllib.request import urlopen
+from typing import Optional, Tuple
 
 import cv2
 import numpy as np
-from colormath.color_conversions import convert_color
-from colormath.color_diff import delta_e_cie2000
-from colormath.color_objects import sRGBColor, LabColor
 
-from stone.utils import is_url, extract_filename_and_extension, alphabet_id, ArgumentError
+from stone.detector import FACE_CASCADE_FILE, HaarFaceDetector, load_face_cascade  # noqa: F401, re-exported
+from stone.dominant import DEFAULT_DOMINANT_COLOR_METHOD, get_dominant_color_extractor
+from stone.download import download
+from stone.color import color_distances, bgr_to_lab, delta_e_cie2000
+from stone.palette import (  # noqa: F401, re-exported for backward compatibility
+    DEFAULT_TONE_PALETTE,
+    TONE_ALIAS,
+    build_full_palette,
+    default_tone_labels,
+    normalize_color,
+    normalize_palette,
+    get_palette,
+)
+from stone.utils import ArgumentError, is_url, extract_filename_and_extension
 
 LOG = logging.getLogger(__name__)
 
-DEFAULT_TONE_PALETTE = {
-    # Default skin tone palette
-    "perla": [
-        "#373028",
-        "#422811",
-        "#513b2e",
-        "#6f503c",
-        "#81654f",
-        "#9d7a54",
-        "#bea07e",
-        "#e5c8a6",
-        "#e7c1b8",
-        "#f3dad6",
-        "#fbf2f3",
-    ],
-    # Refer to this paper:
-    # Monk, Ellis. "Monk Skin Tone Scale," 2019. https://skintone.google.
-    "monk": [
-        "#f6ede4",
-        "#f3e7db",
-        "#f7ead0",
-        "#eadaba",
-        "#d7bd96",
-        "#a07e56",
-        "#825c43",
-        "#604134",
-        "#3a312a",
-        "#292420"
-    ],
-    # Refer to this paper:
-    # Ostfeld, M. C., & Yadon, N. (2022). Skin color, power, and politics in America. Russell Sage Foundation.
-    "yadon-ostfeld": [
-        "#36251d",
-        "#48352c",
-        "#614539",
-        "#755848",
-        "#886958",
-        "#9b7966",
-        "#b18972",
-        "#c29c88",
-        "#d4afa3",
-        "#e6c6bf",
-    ],
-    # Refer to this paper:
-    # Proyecto sobre discriminación étnico-racial en México (PRODER). El Colegio de México. https://discriminacion.colmex.mx/encuesta-proder/
-    "proder": [
-        "#654d3e",
-        "#775741",
-        "#876249",
-        "#946c51",
-        "#a0765a",
-        "#a87f64",
-        "#b1886c",
-        "#b69279",
-        "#be9d86",
-        "#c5a691",
-        "#c8ac99",
-    ],
-    # Refer to this paper:
-    # Leigh, A., & Susilo, T. (2009). Is voting skin-deep? Estimating the effect of candidate ballot photographs on election outcomes.
-    # Journal of Economic Psychology, 30(1), 61-70.
-    "bw": [
-        "#FFFFFF",
-        "#F0F0F0",
-        "#E0E0E0",
-        "#D0D0D0",
-        "#C0C0C0",
-        "#B0B0B0",
-        "#A0A0A0",
-        "#909090",
-        "#808080",
-        "#707070",
-        "#606060",
-        "#505050",
-        "#404040",
-        "#303030",
-        "#202020",
-        "#101010",
-        "#000000",
-    ],
-}
-
-TONE_ALIAS = {
-    "monk": ["mst", "google"],
-    "yadon-ostfeld": ["yo", "ostfeld", "yadon"],
-    "bw": ["black-white"],
-}
-
-def build_full_palette():
-    return {alias: palette for name, palette in DEFAULT_TONE_PALETTE.items() for alias in [name] + TONE_ALIAS.get(name, [])}
-
-def default_tone_labels(tone_palette, prefix:str=""):
-    prefix = prefix or ""
-    return [f"{prefix}{alphabet_id(i)}" for i in range(len(tone_palette))]
-
-@functools.lru_cache(maxsize=128)  # Python 3.2+
-def normalize_color(color):
-    hex_color_pattern = re.compile(r"^#([A-Fa-f0-9]{6}|[A-Fa-f0-9]{3})$")
-    decimal_color_pattern = re.compile(
-        r"^(25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)"
-        r",\s*(25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)"
-        r",\s*(25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)$"
-    )
-    if decimal_color_pattern.match(color):
-        r, g, b = map(int, color.split(","))
-        color = "#{:02X}{:02X}{:02X}".format(r, g, b)
-        return color
-    if hex_color_pattern.match(color):
-        return color.upper()
-    raise ArgumentError(f"Invalid color code: {color}")
-
-
-# @functools.lru_cache(maxsize=128)  # Python 3.2+
-def normalize_palette(palette):
-    return [normalize_color(color) for color in palette]
-
-
-def load_image(filename_or_url, flags=cv2.IMREAD_COLOR):
+# Structuring elements and thresholds used by the skin detectors.
+# They are built once at import time instead of on every call.
+BW_SKIN_KERNEL = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5))
+COLOR_SKIN_KERNEL = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))
+SKIN_LOW_HSV = np.array([0, 48, 80], dtype=np.uint8)
+SKIN_HIGH_HSV = np.array([20, 255, 255], dtype=np.uint8)
+
+# The number of bytes read from a file to find the size of a JPEG image
+JPEG_HEADER_SIZE = 128 * 1024
+# The start of frame markers of JPEG images, which hold the image size
+JPEG_SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+# The reduction factors from the largest, and their decoding flags
+REDUCED_COLOR_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+
+# The black/white detection checks about this number of pixels, whatever the image size
+BW_SAMPLE_SIZE = 64 * 1024
+# A pixel is gray if its channels differ by at most this value
+BW_MAX_SPREAD = 32
+# An image is black/white if at least this fraction of its pixels are gray
+BW_MIN_FRACTION = 0.9
+# A face is classified on its box plus this margin of masked pixels, which covers the reach of the
+# morphological operations and the blur of the skin detectors, so the skin mask of the box is the same as
+# that of the whole image with the other areas masked
+FACE_ROI_PADDING = 8
+
+
+def load_image(filename_or_url, flags=cv2.IMREAD_COLOR, target_width=-1):
+    """
+    Load the image from a local file or URL.
+    :param filename_or_url: The filename (in local devices) or URL (in Internet) of the image.
+    :param flags: The flags of `cv2.imread`.
+    :param target_width: The width the image will be resized to, if positive,
+           a large JPEG image is decoded at a reduced resolution that is still larger, see `reduced_decode_flags`.
+    :return: The image, the base filename and the extension.
+    """
     if isinstance(filename_or_url, str):
         if is_url(filename_or_url):
             base_filename, extension = extract_filename_and_extension(filename_or_url)
-            image = image_from_url(filename_or_url, flags)
+            image = image_from_url(filename_or_url, flags, target_width)
             return image, base_filename, extension
         filename_or_url = Path(filename_or_url)
     if not Path(filename_or_url).exists():
         raise FileNotFoundError(f"{filename_or_url} is not found.")
     base_filename, extension = filename_or_url.stem, filename_or_url.suffix
     filename = str(filename_or_url.resolve())
+    if target_width > 0:
+        with open(filename, "rb") as f:
+            flags = reduced_decode_flags(f.read(JPEG_HEADER_SIZE), target_width, flags)
     image = cv2.imread(filename, flags)
     return image, base_filename, extension
 
 
-def image_from_url(url, flags=cv2.IMREAD_COLOR):
+def read_image_file(filename_or_url):
+    """
+    Read the (encoded) content of an image file without decoding it.
+    :param filename_or_url: The filename (in local devices) or URL (in Internet) of the image.
+    :return: The content as a uint8 array, the base filename and the extension.
+    """
+    if isinstance(filename_or_url, str) and is_url(filename_or_url):
+        base_filename, extension = extract_filename_and_extension(filename_or_url)
+        return read_url(filename_or_url), base_filename, extension
+    filename_or_url = Path(filename_or_url)
+    if not filename_or_url.exists():
+        raise FileNotFoundError(f"{filename_or_url} is not found.")
+    return np.fromfile(filename_or_url, dtype=np.uint8), filename_or_url.stem, filename_or_url.suffix
+
+
+def image_from_url(url, flags=cv2.IMREAD_COLOR, target_width=-1):
     """
     Read image from url.
     Refer to https://stackoverflow.com/a/55026951/8860079
     :param url:
     :param flags:
+    :param target_width: See `load_image`.
     :return:
     """
+    return decode_image(read_url(url), flags, url, target_width)
+
+
+def read_url(url) -> np.ndarray:
+    """
+    Download the (encoded) content of the url with the pooled downloader of the current process.
+    :param url:
+    :return: A uint8 array viewing the downloaded bytes.
+    :raise FileNotFoundError: If the server responds with 404 or 410.
+    :raise DownloadError: If the download fails, see `stone.download.Downloader.download`.
+    """
+    return download(url)
+
+
+def decode_image(data, flags=cv2.IMREAD_COLOR, name="The data", target_width=-1):
+    """
+    Decode an image from the bytes of an encoded image file, e.g., the content of a JPEG file.
+    :param data: A bytes-like object.
+    :param flags: The flags of `cv2.imdecode`.
+    :param name: The name of the image used in the log message, e.g., its url.
+    :param target_width: See `load_image`.
+    :return: The decoded image, or None if the data is empty, corrupt or not a supported image,
+             like `cv2.imread`, so the caller reports the image as invalid instead of aborting.
+    """
     try:
-        resp = urlopen(url)
-        image = np.asarray(bytearray(resp.read()), dtype="uint8")
-        image = cv2.imdecode(image, flags)
-    except urllib.error.HTTPError as e:
-        raise FileNotFoundError(f"{url} is not found.") from e
-    except Exception as e:
-        raise ArgumentError(f"{url} is not a valid image.") from e
-    return image
+        data = np.frombuffer(data, dtype=np.uint8)
+        if target_width > 0:
+            flags = reduced_decode_flags(data, target_width, flags)
+        return cv2.imdecode(data, flags)
+    except (cv2.error, TypeError, ValueError) as e:
+        LOG.debug(f"{name} cannot be decoded: {e}")
+        return None
+
+
+def jpeg_size(header) -> Optional[Tuple[int, int]]:
+    """
+    Read the size of a JPEG image from its frame header, without decoding it.
+    :param header: The beginning of the file as a bytes-like object; the frame header usually lies in the first few KB,
+           after the metadata segments (e.g., EXIF).
+    :return: The (width, height) of the image, or None if it is not a JPEG image or the frame header is not found.
+    """
+    header = memoryview(header).cast("B")
+    if bytes(header[:2]) != b"\xff\xd8":
+        return None
+    pos = 2
+    while pos + 4 <= len(header):
+        if header[pos] != 0xFF:
+            return None
+        marker = header[pos + 1]
+        if marker == 0xFF:
+            # Fill byte
+            pos += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD7:
+            # Markers without payload
+            pos += 2
+            continue
+        if marker in JPEG_SOF_MARKERS:
+            if pos + 9 > len(header):
+                return None
+            height = int.from_bytes(header[pos + 5 : pos + 7], "big")
+            width = int.from_bytes(header[pos + 7 : pos + 9], "big")
+            return width, height
+        if marker == 0xDA:
+            # Start of scan, i.e., no frame header before the image data
+            return None
+        pos += 2 + int.from_bytes(header[pos + 2 : pos + 4], "big")
+    return None
+
+
+def reduced_decode_flags(header, target_width: int, flags=cv2.IMREAD_COLOR) -> int:
+    """
+    Choose the decoding flags of an image that will be resized to `target_width`.
+    JPEG images can be decoded at 1/2, 1/4 or 1/8 of their resolution at a fraction of the cost,
+    so the largest reduction whose result is still at least `target_width` wide is chosen.
+    The shorter side is used as the width, so the choice is also valid if the image is rotated by its EXIF orientation.
+    :param header: The beginning of the file, see `jpeg_size`.
+    :param target_width: The width the image will be resized to.
+    :param flags: The requested flags, only `cv2.IMREAD_COLOR` can be reduced.
+    :return: The flags for `cv2.imread` or `cv2.imdecode`.
+    """
+    if flags != cv2.IMREAD_COLOR or target_width <= 0:
+        return flags
+    size = jpeg_size(header)
+    if size is None:
+        return flags
+    width = min(size)
+    for factor, reduced_flags in REDUCED_COLOR_FLAGS:
+        # libjpeg rounds the scaled size up
+        if -(-width // factor) >= target_width:
+            return reduced_flags
+    return flags
 
 
 def create_color_bar(height, width, color):
@@ -173,24 +204,28 @@ def create_color_bar(height, width, color):
     return bar
 
 
-def is_black_white(image, threshold=192) -> bool:
+def is_black_white(image, threshold=BW_MIN_FRACTION, max_spread=BW_MAX_SPREAD) -> bool:
     """
-    Check if the image is black and white
+    Check if the image is black and white, i.e., if most of its pixels are gray.
+    A pixel is gray if its channels differ by at most `max_spread`.
+    The check runs on a strided subsample of about `BW_SAMPLE_SIZE` pixels, so its cost does not grow with the image.
     :param image:
-    :param threshold:
+    :param threshold: The minimum fraction of gray pixels, in [0, 1].
+    :param max_spread: The maximum difference between the channels of a gray pixel.
     :return:
+    :raise ArgumentError: If the threshold is not a fraction, e.g., a number of pixels.
     """
-    # Reading Images
-    if len(image.shape) == 2:
+    if not 0 <= threshold <= 1:
+        raise ArgumentError(f"The threshold of black/white images is a fraction in [0, 1], got {threshold}")
+    if len(image.shape) == 2 or image.shape[2] == 1:
         return True
-    h, w, *_ = image.shape
-
-    # Extracting Standard Deviation
-    std = np.std(image, axis=2)
-    below_t = np.sum(np.where(std <= 25))
-    prob_bt = below_t / (h * w)
-
-    return prob_bt >= threshold
+    h, w = image.shape[:2]
+    step = max(1, int(math.sqrt(h * w / BW_SAMPLE_SIZE)))
+    sample = image[::step, ::step, :3]
+    # `max - min` never overflows in uint8
+    spread = sample.max(axis=2) - sample.min(axis=2)
+    n_gray = np.count_nonzero(spread <= max_spread)
+    return n_gray >= threshold * spread.size
 
 
 def resize(image, width: int = -1, height: int = -1):
@@ -213,6 +248,24 @@ def resize(image, width: int = -1, height: int = -1):
     return cv2.resize(image, (width, height))
 
 
+def scale_boxes(boxes, from_shape, to_shape) -> list:
+    """
+    Map boxes to a resized version of their image, rounding them outwards.
+    :param boxes: The boxes as (x1, y1, x2, y2).
+    :param from_shape: The shape of the image of the boxes.
+    :param to_shape: The shape of the resized image.
+    :return: The boxes in the resized image.
+    """
+    if len(boxes) == 0:
+        return []
+    h, w = to_shape[:2]
+    scale = np.array([w / from_shape[1], h / from_shape[0]] * 2)
+    boxes = np.asarray(boxes, dtype=np.float64) * scale
+    boxes[:, :2], boxes[:, 2:] = np.floor(boxes[:, :2]), np.ceil(boxes[:, 2:])
+    boxes = boxes.clip(0, [w, h, w, h]).astype(np.int32)
+    return list(boxes)
+
+
 def detect_faces(
     image,
     scaleFactor=1.1,
@@ -221,45 +274,39 @@ def detect_faces(
     biggest_only=True,
     is_bw=False,
     threshold=0.3,
+    cascade=None,
+    context=None,
+    detector=None,
 ):
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    gray = cv2.equalizeHist(gray)
-
-    cascade = cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_frontalface_default.xml")
-
-    flags = (cv2.CASCADE_SCALE_IMAGE | cv2.CASCADE_FIND_BIGGEST_OBJECT) if biggest_only else cv2.CASCADE_SCALE_IMAGE
-    faces = cascade.detectMultiScale(
-        gray,
-        scaleFactor=scaleFactor,
-        minNeighbors=minNeighbors,
-        minSize=minSize,
-        flags=flags,
-    )
+    """
+    Detect the faces with a face detector and keep those with enough skin, see `is_face`.
+    :param context: The `ImageContext` of the image, created if not given.
+    :param detector: A `stone.detector.FaceDetector`, which has its own settings;
+           defaults to the Haar cascade with `scaleFactor`, `minNeighbors` and `cascade` (loaded if not given).
+    :return: The faces as (x1, y1, x2, y2).
+    """
+    context = context or ImageContext(image, is_bw)
+    if detector is None:
+        detector = HaarFaceDetector(scale_factor=scaleFactor, min_neighbors=minNeighbors, cascade=cascade)
+    faces = detector.detect(image, context.gray, minSize, biggest_only)
     if len(faces) == 0:
         return []
-    # Change the format of faces from (x, y, w, h) to (x, y, x+w, y+h)
-    faces[:, 2:] += faces[:, :2]
-    return [face for face in faces if is_face(face, image, is_bw, threshold)]
+    return list(faces[context.skin_ratios(faces) >= threshold])
 
 
-def is_face(face_coord, image, is_bw, threshold=0.3):
+def is_face(face_coord, image, is_bw, threshold=0.3, context=None):
     """
     Check if the face is a real face.
-    Method: detect the skin area in the "face" and check if the skin area is larger than the threshold
+    Method: check if the skin area in the "face" is larger than the threshold, see `ImageContext.skin_ratios`
     :param face_coord:
     :param image:
     :param is_bw:
     :param threshold:
+    :param context: The `ImageContext` of the image, created if not given.
     :return:
     """
-    x1, y1, x2, y2 = face_coord
-    face_image = image[y1:y2, x1:x2]
-    detect_skin_fn = detect_skin_in_bw if is_bw else detect_skin_in_color
-    _, skin_mask = detect_skin_fn(face_image)
-    skin_pixels = cv2.countNonZero(skin_mask)
-    total_pixels = face_image.shape[0] * face_image.shape[1]
-    skin_ratio = skin_pixels / total_pixels
-    return skin_ratio >= threshold
+    context = context or ImageContext(image, is_bw)
+    return context.skin_ratios([face_coord])[0] >= threshold
 
 
 def mask_face(image, face):
@@ -270,35 +317,202 @@ def mask_face(image, face):
     return image
 
 
-def detect_skin_in_bw(image):
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    _, threshold = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5))
-    skin_mask = cv2.morphologyEx(threshold, cv2.MORPH_CLOSE, kernel)
+def face_roi(image, face, padding=FACE_ROI_PADDING):
+    """
+    Crop the region of a face with the same content as `mask_face` would give there,
+    so the face is processed at a cost that depends on its size instead of the image size.
+    :param image: The entire image.
+    :param face: The face as (x1, y1, x2, y2).
+    :param padding: The margin of masked pixels around the face box, see `FACE_ROI_PADDING`.
+           The region is clipped to the image, so the borders of the image are also the same.
+    :return: The region, and the number of masked pixels of `mask_face` outside it.
+    """
+    x1, y1, x2, y2 = face
+    h, w = image.shape[:2]
+    rx1, ry1 = max(x1 - padding, 0), max(y1 - padding, 0)
+    rx2, ry2 = min(x2 + padding, w), min(y2 + padding, h)
+    roi = np.zeros((ry2 - ry1, rx2 - rx1) + image.shape[2:], dtype=image.dtype)
+    roi[y1 - ry1 : y2 - ry1, x1 - rx1 : x2 - rx1] = image[y1:y2, x1:x2]
+    return roi, h * w - roi.shape[0] * roi.shape[1]
+
 
+def otsu_threshold(hist) -> int:
+    """
+    The Otsu threshold of a gray-level histogram, computed exactly as `cv2.threshold` with `cv2.THRESH_OTSU` does.
+    :param hist: The counts of the 256 gray levels.
+    :return: The threshold.
+    """
+    scale = 1.0 / float(np.sum(hist))
+    counts = [float(count) for count in hist]
+    mu = 0.0
+    for i, count in enumerate(counts):
+        mu += i * count
+    mu *= scale
+    mu1 = q1 = max_sigma = 0.0
+    max_val = 0
+    eps = float(np.finfo(np.float32).eps)
+    for i, count in enumerate(counts):
+        p_i = count * scale
+        mu1 *= q1
+        q1 += p_i
+        q2 = 1.0 - q1
+        if min(q1, q2) < eps or max(q1, q2) > 1.0 - eps:
+            continue
+        mu1 = (mu1 + i * p_i) / q1
+        mu2 = (mu - q1 * mu1) / q2
+        sigma = q1 * q2 * (mu1 - mu2) * (mu1 - mu2)
+        if sigma > max_sigma:
+            max_sigma, max_val = sigma, i
+    return max_val
+
+
+def bw_skin_mask(gray, n_masked=0):
+    """
+    :param gray: The gray image.
+    :param n_masked: The number of masked (black) pixels outside the image, see `face_roi`.
+           They count in the Otsu threshold as if the image were the entire masked one.
+    :return: The skin mask of a black and white image.
+    """
+    if n_masked:
+        hist = np.bincount(gray.ravel(), minlength=256)
+        hist[0] += n_masked
+        _, threshold = cv2.threshold(gray, otsu_threshold(hist), 255, cv2.THRESH_BINARY)
+    else:
+        _, threshold = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    return cv2.morphologyEx(threshold, cv2.MORPH_CLOSE, BW_SKIN_KERNEL)
+
+
+def color_skin_mask(skin_range):
+    """
+    :param skin_range: The pixels in the HSV skin range, see `ImageContext.skin_range`.
+    :return: The skin mask of a color image.
+    """
+    skin_mask = cv2.morphologyEx(skin_range, cv2.MORPH_OPEN, COLOR_SKIN_KERNEL)
+    skin_mask = cv2.morphologyEx(skin_mask, cv2.MORPH_CLOSE, COLOR_SKIN_KERNEL)
+    return cv2.GaussianBlur(skin_mask, ksize=(3, 3), sigmaX=0)
+
+
+def apply_skin_mask(image, skin_mask):
+    """
+    :return: The image with the non-skin areas masked, or the image itself if it has no skin.
+    """
     skin = cv2.bitwise_and(image, image, mask=skin_mask)
-    all_0 = np.isclose(skin, 0).all()
-    return image if all_0 else skin, skin_mask
+    return skin if skin.any() else image
+
+
+def detect_skin_in_bw(image, n_masked=0):
+    """
+    :param image:
+    :param n_masked: See `bw_skin_mask`.
+    :return: The skin image and the skin mask.
+    """
+    skin_mask = bw_skin_mask(cv2.cvtColor(image, cv2.COLOR_BGR2GRAY), n_masked)
+    return apply_skin_mask(image, skin_mask), skin_mask
 
 
 def detect_skin_in_color(image):
     # Converting from BGR Colors Space to HSV
     img = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+    skin_mask = color_skin_mask(cv2.inRange(img, SKIN_LOW_HSV, SKIN_HIGH_HSV))
+    return apply_skin_mask(image, skin_mask), skin_mask
 
-    # Defining skin Thresholds
-    low_hsv = np.array([0, 48, 80], dtype=np.uint8)
-    high_hsv = np.array([20, 255, 255], dtype=np.uint8)
 
-    skin_mask = cv2.inRange(img, low_hsv, high_hsv)
-    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))
-    skin_mask = cv2.morphologyEx(skin_mask, cv2.MORPH_OPEN, kernel)
-    skin_mask = cv2.morphologyEx(skin_mask, cv2.MORPH_CLOSE, kernel)
-    skin_mask = cv2.GaussianBlur(skin_mask, ksize=(3, 3), sigmaX=0)
-
-    skin = cv2.bitwise_and(image, image, mask=skin_mask)
+class ImageContext:
+    """
+    The intermediate planes of an image: the gray and HSV images, the pixels in the skin range and the skin mask.
+    Each plane is computed once on first use, and the stages (face detection, face checking, skin detection
+    and the report) share it by slicing instead of converting the image again for every face.
+    """
 
-    all_0 = np.isclose(skin, 0).all()
-    return image if all_0 else skin, skin_mask
+    def __init__(self, image, is_bw):
+        """
+        :param image: The BGR image.
+        :param is_bw: Whether the image is black and white, which selects the skin detector.
+        """
+        self.image = image
+        self.is_bw = is_bw
+
+    @functools.cached_property
+    def gray(self):
+        return cv2.cvtColor(self.image, cv2.COLOR_BGR2GRAY)
+
+    @functools.cached_property
+    def hsv(self):
+        return cv2.cvtColor(self.image, cv2.COLOR_BGR2HSV)
+
+    @functools.cached_property
+    def skin_range(self):
+        return cv2.inRange(self.hsv, SKIN_LOW_HSV, SKIN_HIGH_HSV)
+
+    @functools.cached_property
+    def skin_mask(self):
+        """
+        The skin mask of the entire image.
+        """
+        return bw_skin_mask(self.gray) if self.is_bw else color_skin_mask(self.skin_range)
+
+    @functools.cached_property
+    def skin_integral(self):
+        """
+        The summed-area table of the skin pixels, i.e., the number of skin pixels above and left of each position.
+        """
+        return cv2.integral(cv2.threshold(self.skin_mask, 0, 1, cv2.THRESH_BINARY)[1], sdepth=cv2.CV_32S)
+
+    def skin_ratios(self, boxes) -> np.ndarray:
+        """
+        The fractions of skin pixels in boxes.
+        For color images, they come from the skin mask of the entire image,
+        so each box costs 4 lookups in `skin_integral` whatever its size.
+        For black and white images, the skin is detected in the crop of each box,
+        as the Otsu threshold of the detector depends on the pixels of the box.
+        :param boxes: The boxes as (x1, y1, x2, y2).
+        :return: The ratio of each box, 0 for empty boxes.
+        """
+        boxes = np.asarray(boxes, dtype=np.int64).reshape(-1, 4)
+        if self.is_bw:
+            return np.array([self._crop_skin_ratio(box) for box in boxes], dtype=np.float64)
+        x1, y1, x2, y2 = boxes.T
+        table = self.skin_integral
+        skin = table[y2, x2] - table[y1, x2] - table[y2, x1] + table[y1, x1]
+        area = (x2 - x1) * (y2 - y1)
+        return np.divide(skin, area, out=np.zeros(len(area)), where=area > 0)
+
+    def _crop_skin_ratio(self, box) -> float:
+        x1, y1, x2, y2 = box
+        if x2 <= x1 or y2 <= y1:
+            return 0.0
+        _, skin_mask = self.detect_skin(box, masked=False)
+        return cv2.countNonZero(skin_mask) / skin_mask.size
+
+    def detect_skin(self, face=None, masked=True):
+        """
+        Detect the skin like `detect_skin_in_bw` and `detect_skin_in_color`, from the shared planes.
+        :param face: The face as (x1, y1, x2, y2), or None for the entire image.
+        :param masked: Whether to detect the skin of the face as in `mask_face(image, face)`, on the region of
+               `face_roi`, or in the crop of the face box.
+        :return: The skin image and the skin mask of the region.
+        """
+        if face is None:
+            return apply_skin_mask(self.image, self.skin_mask), self.skin_mask
+        # Masked pixels are black, i.e., dark gray and out of the skin range, as the zeros of the regions
+        plane = self.gray if self.is_bw else self.skin_range
+        if masked:
+            image, n_masked = face_roi(self.image, face)
+            plane, _ = face_roi(plane, face)
+        else:
+            x1, y1, x2, y2 = face
+            image, plane, n_masked = self.image[y1:y2, x1:x2], plane[y1:y2, x1:x2], 0
+        skin_mask = bw_skin_mask(plane, n_masked) if self.is_bw else color_skin_mask(plane)
+        return apply_skin_mask(image, skin_mask), skin_mask
+
+    def face_mask(self, face):
+        """
+        :return: The mask of the non-black pixels of `mask_face(image, face)`.
+        """
+        x1, y1, x2, y2 = face
+        mask = np.zeros(self.gray.shape, dtype=np.uint8)
+        mask[y1:y2, x1:x2] = cv2.threshold(self.gray[y1:y2, x1:x2], 1, 255, cv2.THRESH_BINARY)[1]
+        return mask
 
 
 def draw_rects(image, *rects, color=(255, 0, 0), thickness=2):
@@ -307,7 +521,18 @@ def draw_rects(image, *rects, color=(255, 0, 0), thickness=2):
     return image
 
 
-def dominant_colors(image, to_bw, n_clusters=2):
+def dominant_colors(image, to_bw, n_clusters=2, method=DEFAULT_DOMINANT_COLOR_METHOD, **options):
+    """
+    Extract the dominant colors of the skin pixels, i.e., the pixels that are not masked out (non-zero).
+    :param image: The skin image, see `detect_skin_in_color` and `detect_skin_in_bw`.
+    :param to_bw: Whether to convert the image to black and white first.
+    :param n_clusters: The number of dominant colors.
+    :param method: The extractor, see `stone.dominant.DOMINANT_COLOR_EXTRACTORS`.
+    :param options: The options of the extractor, e.g., `attempts`, `max_iter`, `seed` and `init_centers`,
+           see `stone.dominant.kmeans_dominant_colors`.
+    :return: The colors in BGR and their percents, ordered by the percents.
+    """
+    extract = get_dominant_color_extractor(method)
     if to_bw:
         data = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
         data = cv2.cvtColor(data, cv2.COLOR_GRAY2BGR)
@@ -315,20 +540,7 @@ def dominant_colors(image, to_bw, n_clusters=2):
         data = image
     data = np.reshape(data, (-1, 3))
     data = data[np.all(data != 0, axis=1)]
-    data = np.float32(data)
-
-    criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 10, 1.0)
-    flags = cv2.KMEANS_RANDOM_CENTERS
-    compactness, labels, colors = cv2.kmeans(data, n_clusters, None, criteria, 10, flags)
-    labels, counts = np.unique(labels, return_counts=True)
-
-    order = (-counts).argsort()
-    colors = colors[order]
-    counts = counts[order]
-
-    percents = counts / counts.sum()
-
-    return colors, percents
+    return extract(data, n_clusters, **options)
 
 
 def blur(image, degree=25):
@@ -342,14 +554,37 @@ def blur(image, degree=25):
     return cv2.blur(image, ksize)
 
 
-def skin_tone(colors, percents, skin_tone_palette, tone_labels):
-    lab_tones = [convert_color(sRGBColor.new_from_rgb_hex(rgb), LabColor) for rgb in skin_tone_palette]
-    lab_colors = [convert_color(sRGBColor(rgb_r=r, rgb_g=g, rgb_b=b, is_upscaled=True), LabColor) for b, g, r in colors]
-    distances = [np.sum([delta_e_cie2000(c, label) * p for c, p in zip(lab_colors, percents)]) for label in lab_tones]
+def skin_tone(colors, percents, skin_tone_palette, tone_labels=None, backend="numpy", lut=None):
+    """
+    Find the palette tone closest to the dominant colors.
+    The distance to each tone is the sum of the CIEDE2000 differences to the dominant colors, weighted by their percents.
+    :param colors: The dominant colors in BGR.
+    :param percents: The percents of the dominant colors.
+    :param skin_tone_palette: The skin tone palette, a `Palette` or a list of RGB hex strings.
+    :param tone_labels: The labels of the palette tones, defaults to the labels of the palette.
+    :param backend: The color difference backend, "numpy" (default) or "colormath".
+    :param lut: An optional `stone.lut.ToneLUT` of the palette.
+           If all dominant colors share the same nearest tone in the table, that tone minimizes the weighted distance,
+           so only its distance is computed. Otherwise, the distances to all tones are computed.
+    :return: The tone index, hex value, label and distance.
+    """
+    palette = get_palette(skin_tone_palette, tone_labels)
+    if lut is not None:
+        tone_ids = lut.lookup(colors)
+        if tone_ids[0] != lut.AMBIGUOUS and np.all(tone_ids == tone_ids[0]):
+            tone_id = int(tone_ids[0])
+            color_diffs = delta_e_cie2000(bgr_to_lab(np.asarray(colors).reshape(-1, 3)), palette.lab[tone_id])
+            distance: float = np.asarray(percents, dtype=np.float64) @ color_diffs[:, 0]
+            return tone_id, palette.hex[tone_id], palette.labels[tone_id], distance
+    if backend == "numpy":
+        color_diffs = delta_e_cie2000(bgr_to_lab(np.asarray(colors).reshape(-1, 3)), palette.lab)
+    else:
+        color_diffs = color_distances(colors, palette.hex, backend)
+    distances = np.asarray(percents, dtype=np.float64) @ color_diffs
     tone_id = np.argmin(distances)
     distance: float = distances[tone_id]
-    tone_hex = skin_tone_palette[tone_id].upper()
-    tone_label = tone_labels[tone_id]
+    tone_hex = palette.hex[tone_id]
+    tone_label = palette.labels[tone_id]
     return tone_id, tone_hex, tone_label, distance
 
 
@@ -363,6 +598,11 @@ def classify(
     verbose=False,
     report_image=None,
     use_face=True,
+    lut=None,
+    dominant_color_method=DEFAULT_DOMINANT_COLOR_METHOD,
+    dominant_color_options=None,
+    face_coord=None,
+    context=None,
 ):
     """
     Classify the skin tone of the image
@@ -375,17 +615,26 @@ def classify(
     :param verbose: Whether to output the report image
     :param report_image: The image to draw the report on
     :param use_face: whether to use face area for detection
+    :param lut: An optional nearest-tone lookup table of the palette, see `skin_tone`
+    :param dominant_color_method: The dominant color extractor, see `dominant_colors`
+    :param dominant_color_options: The options of the extractor, see `dominant_colors`
+    :param face_coord: The face in the entire image. If given, only the region of the face is processed,
+           with the same result as classifying `mask_face(image, face_coord)` (see `face_roi`),
+           and the report is drawn on `image` unless `report_image` is given
+    :param context: The `ImageContext` of `image`, created if not given
     :return:
     """
-    detect_skin_fn = detect_skin_in_bw if is_bw else detect_skin_in_color
-    skin, skin_mask = detect_skin_fn(image)
-    dmnt_colors, dmnt_pcts = dominant_colors(skin, to_bw, n_dominant_colors)
+    context = context or ImageContext(image, is_bw)
+    skin, skin_mask = context.detect_skin(face_coord)
+    dmnt_colors, dmnt_pcts = dominant_colors(
+        skin, to_bw, n_dominant_colors, dominant_color_method, **(dominant_color_options or {})
+    )
     # Generate readable strings
     hex_colors = ["#%02X%02X%02X" % tuple(np.around([r, g, b]).astype(int)) for b, g, r in dmnt_colors]
     pct_strs = ["%.2f" % p for p in dmnt_pcts]
     result = {"dominant_colors": [{"color": color, "percent": pct} for color, pct in zip(hex_colors, pct_strs)]}
     # Calculate skin tone
-    tone_id, tone_hex, tone_label, distance = skin_tone(dmnt_colors, dmnt_pcts, skin_tone_palette, tone_labels)
+    tone_id, tone_hex, tone_label, distance = skin_tone(dmnt_colors, dmnt_pcts, skin_tone_palette, tone_labels, lut=lut)
     accuracy = round(100 - distance, 2)
     result["skin_tone"] = tone_hex
     result["tone_label"] = tone_label
@@ -394,7 +643,36 @@ def classify(
         return result, None
 
     # 0. Create initial report image
-    report_image = initial_report_image(image, report_image, skin_mask, use_face, to_bw)
+    if report_image is None and to_bw:
+        report_image, to_bw = cv2.cvtColor(context.gray, cv2.COLOR_GRAY2BGR), False
+    if face_coord is not None:
+        # The mask of `use_face`, without masking the image
+        skin_mask, use_face = context.face_mask(face_coord), False
+    report_image = create_report_image(
+        image, report_image, skin_mask, use_face, to_bw, dmnt_colors, dmnt_pcts, skin_tone_palette, tone_id, distance
+    )
+    return result, report_image
+
+
+def create_report_image(
+    face_image, report_image, skin_mask, use_face, to_bw, dmnt_colors, dmnt_pcts, skin_tone_palette, tone_id, distance
+):
+    """
+    Draw the report of a classification: the image with the skin (or face) highlighted,
+    the bars of the dominant colors and of the palette, and the message bar.
+    :param face_image: See `initial_report_image`.
+    :param report_image: See `initial_report_image`.
+    :param skin_mask: See `initial_report_image`.
+    :param use_face: See `initial_report_image`.
+    :param to_bw: See `initial_report_image`.
+    :param dmnt_colors: The dominant colors in BGR.
+    :param dmnt_pcts: The percents of the dominant colors.
+    :param skin_tone_palette: The skin tone palette.
+    :param tone_id: The index of the skin tone in the palette, see `skin_tone`.
+    :param distance: The distance to the skin tone, see `skin_tone`.
+    :return: The report image.
+    """
+    report_image = initial_report_image(face_image, report_image, skin_mask, use_face, to_bw)
     bar_width = 100
 
     # 1. Create color bar for dominant colors
@@ -405,9 +683,9 @@ def classify(
 
     # 3. Combine all bars and report image
     report_image = np.hstack([report_image, color_bars, palette_bars])
+    tone_hex = get_palette(skin_tone_palette).hex[tone_id]
     msg_bar = create_message_bar(dmnt_colors, dmnt_pcts, tone_hex, distance, report_image.shape[1])
-    report_image = np.vstack([report_image, msg_bar])
-    return result, report_image
+    return np.vstack([report_image, msg_bar])
 
 
 def initial_report_image(face_image, report_image, skin_mask, use_face, to_bw):
@@ -456,20 +734,13 @@ def rgb_to_hex(rgb_color):
 
 
 def create_tone_palette_bar(report_image, tone_id, skin_tone_palette, bar_width):
-    palette_bars = []
-    tone_height = report_image.shape[0] // len(skin_tone_palette)
-    tone_bgrs = []
-    for tone in skin_tone_palette:
-        hex_value = tone.lstrip("#")
-        r, g, b = [int(hex_value[i : i + 2], 16) for i in (0, 2, 4)]
-        tone_bgrs.append([b, g, r])
-        bar = create_color_bar(tone_height, bar_width, [b, g, r])
-        palette_bars.append(bar)
-    padding_height = report_image.shape[0] - tone_height * len(skin_tone_palette)
-    if padding_height > 0:
-        padding = create_color_bar(padding_height, bar_width, (255, 255, 255))
-        palette_bars.append(padding)
-    bar = np.vstack(palette_bars)
+    palette = get_palette(skin_tone_palette)
+    tone_height = report_image.shape[0] // len(palette)
+    bar = np.empty((report_image.shape[0], bar_width, 3), dtype=np.uint8)
+    # Each tone is a block of `tone_height` rows; the remaining rows are padded with white
+    n_rows = tone_height * len(palette)
+    bar[:n_rows] = np.repeat(palette.bgr, tone_height, axis=0)[:, np.newaxis, :]
+    bar[n_rows:] = 255
 
     padding = 1
     start_point = (padding, tone_id * tone_height + padding)
@@ -516,7 +787,7 @@ def process_image(
     image: np.ndarray,
     is_bw: bool,
     to_bw: bool,
-    skin_tone_palette: list,
+    skin_tone_palette,
     tone_labels: list = None,
     new_width=-1,
     n_dominant_colors=2,
@@ -526,12 +797,55 @@ def process_image(
     biggest_only=True,
     threshold=0.3,
     verbose=False,
+    cascade=None,
+    lut=None,
+    dominant_color_method=DEFAULT_DOMINANT_COLOR_METHOD,
+    dominant_color_options=None,
+    detector=None,
+    detect_width=-1,
+    max_face_pixels=-1,
 ):
+    """
+    Resize the image to `new_width`, detect the faces and classify the skin tone of each face
+    (or of the whole image if there is no face).
+    :param detect_width: If smaller than `new_width`, the faces are detected on the image resized to this width,
+           which is much cheaper, and their boxes are mapped back; `minSize` is scaled accordingly.
+    :param max_face_pixels: If positive, the image is downscaled for the classification
+           until the biggest face has at most about this number of pixels.
+    :return: The face records and the report images (None unless `verbose`), by face id.
+    """
     image = resize(image, new_width)
+    context = ImageContext(image, is_bw)
 
     records, report_images = [], {}
-    face_coords = detect_faces(image, scaleFactor, minNeighbors, minSize, biggest_only, is_bw, threshold)
+    if 0 < detect_width < image.shape[1]:
+        detect_image = resize(image, detect_width)
+        ratio = detect_image.shape[1] / image.shape[1]
+        detect_size = tuple(max(round(size * ratio), 1) for size in minSize)
+        face_coords = detect_faces(
+            detect_image,
+            scaleFactor,
+            minNeighbors,
+            detect_size,
+            biggest_only,
+            is_bw,
+            threshold,
+            cascade,
+            detector=detector,
+        )
+        face_coords = scale_boxes(face_coords, detect_image.shape, image.shape)
+    else:
+        face_coords = detect_faces(
+            image, scaleFactor, minNeighbors, minSize, biggest_only, is_bw, threshold, cascade, context, detector
+        )
     n_faces = len(face_coords)
+    if n_faces and max_face_pixels > 0:
+        biggest = max((x2 - x1) * (y2 - y1) for x1, y1, x2, y2 in face_coords)
+        if biggest > max_face_pixels:
+            width = max(int(image.shape[1] * math.sqrt(max_face_pixels / biggest)), 1)
+            classify_image = resize(image, width)
+            face_coords = scale_boxes(face_coords, image.shape, classify_image.shape)
+            image, context = classify_image, ImageContext(classify_image, is_bw)
 
     if n_faces == 0:
         # If no face is detected, find skin area in the whole image and classify.
@@ -544,23 +858,30 @@ def process_image(
             n_dominant_colors,
             verbose=verbose,
             use_face=False,
+            lut=lut,
+            dominant_color_method=dominant_color_method,
+            dominant_color_options=dominant_color_options,
+            context=context,
         )
         record["face_id"] = "NA"
         records.append(record)
         report_images["NA"] = report_image
     # Otherwise, detect skin tone for each face
     for idx, face_coord in enumerate(face_coords):
-        face_image = mask_face(image, face_coord)
         record, report_image = classify(
-            face_image,
+            image,
             is_bw,
             to_bw,
             skin_tone_palette,
             tone_labels,
             n_dominant_colors,
             verbose=verbose,
-            report_image=image,
             use_face=True,
+            lut=lut,
+            dominant_color_method=dominant_color_method,
+            dominant_color_options=dominant_color_options,
+            face_coord=face_coord,
+            context=context,
         )
         record["face_id"] = idx + 1
         records.append(record)
@@ -570,6 +891,30 @@ def process_image(
     return records, report_images
 
 
+def save_report_images(report_images: dict, directory, basename: str, extension: str, image_type: str) -> dict:
+    """
+    Save the report images of an image into `<directory>/<image_type>/faces_<number of faces>/`.
+    :param report_images: The report images returned by `process_image`, indexed by the face ids.
+    :param directory:
+    :param basename: The name of the image without extension.
+    :param extension: The extension of the image, ".png" is used if OpenCV cannot write it, e.g., ".gif".
+    :param image_type: The (detected) image type, "color" or "bw".
+    :return: The filenames of the saved images, indexed by the face ids.
+    """
+    n_faces = 0 if "NA" in report_images else len(report_images)
+    debug_dir = Path(directory) / image_type / f"faces_{n_faces}"
+    debug_dir.mkdir(parents=True, exist_ok=True)
+    filenames = {}
+    for face_id, report_image in report_images.items():
+        image_name = f"{basename}-{face_id}"
+        if not extension or not cv2.haveImageWriter(f"{image_name}{extension}"):
+            extension = ".png"
+        report_filename = str(debug_dir / f"{image_name}{extension}")
+        cv2.imwrite(report_filename, report_image)
+        filenames[face_id] = report_filename
+    return filenames
+
+
 def show(image, title=None):
     title = f" - {title}" if title else ""
     cv2.imshow(f"Skin Tone Classifier{title}", image)
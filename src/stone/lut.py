@@ -0,0 +1,207 @@
+import hashlib
+import logging
+import os
+from pathlib import Path
+from typing import Union
+
+import numpy as np
+
+from stone.color import bgr_to_lab, cie2000_hue_differences, delta_e_cie2000
+from stone.palette import Palette, get_palette
+from stone.utils import ArgumentError
+
+LOG = logging.getLogger(__name__)
+
+# Number of bits kept per channel, i.e., a 64x64x64 table by default.
+DEFAULT_LUT_BITS = 6
+# Number of colors whose nearest tone is computed at once while building a table.
+_BUILD_CHUNK_SIZE = 1 << 16
+# A bin is proven from its corners if the margin of its tone is larger than this times the spread of the margin,
+# and the hue differences to the tones spread less than this, in degrees, see `ToneLUT.build`.
+_MARGIN_SPREAD_RATIO = 0.5
+_MAX_HUE_SPREAD = 90
+# The version of the persisted tables, see `ToneLUT.load_or_build`.
+_LUT_VERSION = 2
+
+_loaded_luts = {}
+
+
+def default_lut_dir() -> Path:
+    """
+    The directory where the lookup tables are persisted.
+    It can be changed with the `STONE_LUT_DIR` environment variable, defaults to `~/.cache/stone/lut`.
+    :return:
+    """
+    return Path(os.environ.get("STONE_LUT_DIR") or Path.home() / ".cache" / "stone" / "lut")
+
+
+class ToneLUT:
+    """
+    A nearest-tone lookup table over the quantized RGB cube of one palette.
+
+    Item `[b, g, r]` of the table is the index of the palette tone closest (in CIEDE2000) to
+    every color of the quantized bin, up to the first colors of the next bins,
+    so a fractional color, e.g., a dominant color, that is floored into the bin is covered too.
+    Bins whose colors do not share the same tone, i.e., on the boundary between two tones,
+    are marked as `AMBIGUOUS`, so the caller can fall back to the exact calculation for them.
+    Every other bin gives the same tone as the exact calculation, see `build`.
+    """
+
+    AMBIGUOUS = 255
+
+    def __init__(self, table: np.ndarray, bits: int):
+        self.table = table
+        self.bits = bits
+        self.shift = 8 - bits
+
+    @classmethod
+    def build(cls, palette: Palette, bits: int = DEFAULT_LUT_BITS) -> "ToneLUT":
+        """
+        Build the table of the palette.
+        The tone of a bin is proven from its corners if, against every other tone, the margin of the nearest tone
+        at each corner is larger than half the spread of the margin between the corners,
+        i.e., the difference of the distances, which is smooth across a bin, does not come close to changing sign.
+        The other bins whose corners agree are checked color by color against the tones that are not excluded so.
+        Bins across which the CIEDE2000 hues of the colors and a tone become opposite are ambiguous,
+        as the distance to the tone jumps there, see `stone.color.cie2000_hue_differences`.
+        :param palette: The compiled palette.
+        :param bits: The number of bits kept per channel, from 1 to 8.
+        :return:
+        """
+        if not 1 <= bits <= 8:
+            raise ArgumentError(f"Invalid number of bits for the tone lookup table: {bits}, it should be in [1, 8].")
+        if len(palette) >= cls.AMBIGUOUS:
+            raise ArgumentError(f"The tone lookup table supports palettes with up to {cls.AMBIGUOUS - 1} tones.")
+        n_bins = 1 << bits
+        step = 1 << (8 - bits)
+        # The corners of the bins, shared by the neighboring bins; the last ones are clamped to the cube
+        corners = np.minimum(np.arange(0, 256 + step, step), 255)
+        # The bins are built in slabs along the first axis, which bounds the memory of the distances
+        slab = max(1, _BUILD_CHUNK_SIZE // len(corners) ** 2)
+        table = np.empty((n_bins,) * 3, dtype=np.uint8)
+        for start in range(0, n_bins, slab):
+            stop = min(start + slab, n_bins)
+            table[start:stop] = _build_slab(palette, corners[start : stop + 1], corners, step, cls.AMBIGUOUS)
+        return cls(table, bits)
+
+    @classmethod
+    def load_or_build(cls, palette: Palette, bits: int = DEFAULT_LUT_BITS, directory: Union[str, Path] = None):
+        """
+        Load the table of the palette from disk as a read-only memory map, building and saving it first if needed.
+        :param palette: The compiled palette.
+        :param bits: The number of bits kept per channel.
+        :param directory: Where the tables are persisted, defaults to `default_lut_dir()`.
+        :return:
+        """
+        directory = Path(directory) if directory else default_lut_dir()
+        digest = hashlib.sha1(",".join(palette.hex).encode()).hexdigest()[:16]
+        # The version is bumped whenever the way the tables are built changes, so stale tables are rebuilt
+        filename = directory / f"tones-v{_LUT_VERSION}-{digest}-{bits}bit.npy"
+        if not filename.exists():
+            LOG.info(f"Building the tone lookup table {filename}")
+            lut = cls.build(palette, bits)
+            try:
+                directory.mkdir(parents=True, exist_ok=True)
+                # Write to a temporary file first, so concurrent workers never read a partial table
+                tmp_filename = filename.with_suffix(f".{os.getpid()}.tmp")
+                with open(tmp_filename, "wb") as f:
+                    np.save(f, lut.table)
+                os.replace(tmp_filename, filename)
+            except OSError as e:
+                LOG.warning(f"Failed to save the tone lookup table {filename}: {e}")
+                return lut
+        return cls(np.load(filename, mmap_mode="r"), bits)
+
+    def lookup(self, bgr_colors) -> np.ndarray:
+        """
+        Look up the nearest tone indices of the colors.
+        :param bgr_colors: An (n, 3) array of BGR colors in [0, 255], e.g., the dominant colors.
+        :return: An (n,) array of tone indices, `AMBIGUOUS` for colors close to the boundary between tones.
+        """
+        bgr = np.clip(np.floor(np.asarray(bgr_colors, dtype=np.float64)), 0, 255).astype(np.uint8).reshape(-1, 3)
+        bgr >>= self.shift
+        return self.table[bgr[:, 0], bgr[:, 1], bgr[:, 2]]
+
+
+def _build_slab(palette: Palette, b_corners, corners, step: int, ambiguous: int) -> np.ndarray:
+    """
+    Build the part of the table whose bins lie between the first and last of `b_corners` along the first axis.
+    See `ToneLUT.build`.
+    """
+    b, g, r = np.meshgrid(b_corners, corners, corners, indexing="ij")
+    lab = bgr_to_lab(np.stack([b.ravel(), g.ravel(), r.ravel()], axis=-1))
+    distances = delta_e_cie2000(lab, palette.lab).reshape(b.shape + (len(palette),))
+    # The hue differences to the tones moved away from 180 degrees, where the distances jump, to 0 and 360 degrees
+    hues = np.mod(cie2000_hue_differences(lab, palette.lab) + 180, 360).reshape(distances.shape)
+    shape = tuple(n - 1 for n in b.shape)
+    nearest = np.argmin(distances[: shape[0], : shape[1], : shape[2]], axis=-1)[..., np.newaxis]
+    # The margins of the nearest tone of the first corner against every tone, and the hues, over the corners of each bin
+    min_margins, min_hues = np.full(shape + (len(palette),), np.inf), np.full(shape + (len(palette),), np.inf)
+    max_margins, max_hues = np.full(shape + (len(palette),), -np.inf), np.full(shape + (len(palette),), -np.inf)
+    for db, dg, dr in np.ndindex(2, 2, 2):
+        corner = (slice(db, db + shape[0]), slice(dg, dg + shape[1]), slice(dr, dr + shape[2]))
+        margins = distances[corner] - np.take_along_axis(distances[corner], nearest, axis=-1)
+        np.minimum(min_margins, margins, out=min_margins)
+        np.maximum(max_margins, margins, out=max_margins)
+        np.minimum(min_hues, hues[corner], out=min_hues)
+        np.maximum(max_hues, hues[corner], out=max_hues)
+    is_nearest = np.arange(len(palette)) == nearest
+    # The distances to a tone are smooth across a bin unless the hues wrap around, or spread around the gray axis
+    smooth = max_hues - min_hues < _MAX_HUE_SPREAD
+    excluded = smooth & (min_margins > _MARGIN_SPREAD_RATIO * (max_margins - min_margins))
+    # A non-positive margin at any corner makes the bin ambiguous, so does a jump of the distances inside the bin,
+    # as the tone regions between the jumps of two tones of similar hues can be thinner than one intensity level
+    agreed = np.all(smooth & ((min_margins > 0) | is_nearest), axis=-1)
+    proven = agreed & np.all(excluded | is_nearest, axis=-1)
+    table = np.where(proven, nearest[..., 0], ambiguous).astype(np.uint8)
+
+    unproven = agreed & ~proven
+    if np.any(unproven):
+        indices = np.nonzero(unproven)
+        lows = np.stack([b_corners[indices[0]], corners[indices[1]], corners[indices[2]]], axis=-1)
+        table[unproven] = _check_bins(palette, lows, ~excluded[unproven], step, ambiguous)
+    return table
+
+
+def _check_bins(palette: Palette, lows: np.ndarray, candidates: np.ndarray, step: int, ambiguous: int) -> np.ndarray:
+    """
+    Find the tone of bins by computing the nearest tone of all their colors.
+    :param lows: An (n, 3) array of the lowest BGR corner of each bin.
+    :param candidates: An (n, m) boolean array of the tones that may be the nearest to the colors of each bin.
+    :return: An (n,) array of the tone of each bin, or `ambiguous` if its colors have different tones.
+    """
+    offsets = np.stack(np.meshgrid(*[np.arange(step + 1)] * 3, indexing="ij"), axis=-1).reshape(-1, 3)
+    colors = np.minimum(lows[:, np.newaxis] + offsets, 255)
+    # The colors as 24-bit integers, as the neighboring bins share their faces
+    keys = (colors[..., 0] << 16) | (colors[..., 1] << 8) | colors[..., 2]
+    min_distances = np.full(keys.shape, np.inf)
+    tones = np.zeros(keys.shape, dtype=np.uint8)
+    # The tones are visited in order, so ties are resolved like `np.argmin`
+    for tone in range(len(palette)):
+        bins = candidates[:, tone]
+        unique, inverse = np.unique(keys[bins], return_inverse=True)
+        bgr = np.stack([unique >> 16, (unique >> 8) & 0xFF, unique & 0xFF], axis=-1)
+        tone_distances = np.empty(len(bgr))
+        for start in range(0, len(bgr), _BUILD_CHUNK_SIZE):
+            lab = bgr_to_lab(bgr[start : start + _BUILD_CHUNK_SIZE])
+            tone_distances[start : start + len(lab)] = delta_e_cie2000(lab, palette.lab[tone])[:, 0]
+        tone_distances = tone_distances[inverse.ravel()].reshape(-1, keys.shape[1])
+        closer = tone_distances < min_distances[bins]
+        min_distances[bins] = np.where(closer, tone_distances, min_distances[bins])
+        tones[bins] = np.where(closer, tone, tones[bins])
+    return np.where(np.all(tones == tones[:, :1], axis=1), tones[:, 0], ambiguous)
+
+
+def get_tone_lut(palette, bits: int = DEFAULT_LUT_BITS, directory: Union[str, Path] = None) -> ToneLUT:
+    """
+    Return the lookup table of the palette, loading it at most once per process.
+    :param palette: A `Palette` or anything accepted by `stone.palette.get_palette`.
+    :param bits: The number of bits kept per channel.
+    :param directory: Where the tables are persisted, defaults to `default_lut_dir()`.
+    :return:
+    """
+    palette = get_palette(palette)
+    key = palette.hex, bits
+    if key not in _loaded_luts:
+        _loaded_luts[key] = ToneLUT.load_or_build(palette, bits, directory)
+    return _loaded_luts[key]
@@ -0,0 +1,225 @@
+import dataclasses
+import functools
+import re
+from typing import Tuple, Optional
+
+import numpy as np
+
+from stone.color import hex_to_rgb_array, srgb_to_lab
+from stone.utils import alphabet_id, ArgumentError
+
+DEFAULT_TONE_PALETTE = {
+    # Default skin tone palette
+    "perla": [
+        "#373028",
+        "#422811",
+        "#513b2e",
+        "#6f503c",
+        "#81654f",
+        "#9d7a54",
+        "#bea07e",
+        "#e5c8a6",
+        "#e7c1b8",
+        "#f3dad6",
+        "#fbf2f3",
+    ],
+    # Refer to this paper:
+    # Monk, Ellis. "Monk Skin Tone Scale," 2019. https://skintone.google.
+    "monk": [
+        "#f6ede4",
+        "#f3e7db",
+        "#f7ead0",
+        "#eadaba",
+        "#d7bd96",
+        "#a07e56",
+        "#825c43",
+        "#604134",
+        "#3a312a",
+        "#292420"
+    ],
+    # Refer to this paper:
+    # Ostfeld, M. C., & Yadon, N. (2022). Skin color, power, and politics in America. Russell Sage Foundation.
+    "yadon-ostfeld": [
+        "#36251d",
+        "#48352c",
+        "#614539",
+        "#755848",
+        "#886958",
+        "#9b7966",
+        "#b18972",
+        "#c29c88",
+        "#d4afa3",
+        "#e6c6bf",
+    ],
+    # Refer to this paper:
+    # Proyecto sobre discriminación étnico-racial en México (PRODER). El Colegio de México. https://discriminacion.colmex.mx/encuesta-proder/
+    "proder": [
+        "#654d3e",
+        "#775741",
+        "#876249",
+        "#946c51",
+        "#a0765a",
+        "#a87f64",
+        "#b1886c",
+        "#b69279",
+        "#be9d86",
+        "#c5a691",
+        "#c8ac99",
+    ],
+    # Refer to this paper:
+    # Leigh, A., & Susilo, T. (2009). Is voting skin-deep? Estimating the effect of candidate ballot photographs on election outcomes.
+    # Journal of Economic Psychology, 30(1), 61-70.
+    "bw": [
+        "#FFFFFF",
+        "#F0F0F0",
+        "#E0E0E0",
+        "#D0D0D0",
+        "#C0C0C0",
+        "#B0B0B0",
+        "#A0A0A0",
+        "#909090",
+        "#808080",
+        "#707070",
+        "#606060",
+        "#505050",
+        "#404040",
+        "#303030",
+        "#202020",
+        "#101010",
+        "#000000",
+    ],
+}
+
+TONE_ALIAS = {
+    "monk": ["mst", "google"],
+    "yadon-ostfeld": ["yo", "ostfeld", "yadon"],
+    "bw": ["black-white"],
+}
+
+
+def build_full_palette():
+    return {alias: palette for name, palette in DEFAULT_TONE_PALETTE.items() for alias in [name] + TONE_ALIAS.get(name, [])}
+
+
+def default_tone_labels(tone_palette, prefix: str = ""):
+    prefix = prefix or ""
+    return [f"{prefix}{alphabet_id(i)}" for i in range(len(tone_palette))]
+
+
+@functools.lru_cache(maxsize=128)  # Python 3.2+
+def normalize_color(color):
+    hex_color_pattern = re.compile(r"^#([A-Fa-f0-9]{6}|[A-Fa-f0-9]{3})$")
+    decimal_color_pattern = re.compile(
+        r"^(25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)"
+        r",\s*(25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)"
+        r",\s*(25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)$"
+    )
+    if decimal_color_pattern.match(color):
+        r, g, b = map(int, color.split(","))
+        color = "#{:02X}{:02X}{:02X}".format(r, g, b)
+        return color
+    if hex_color_pattern.match(color):
+        return color.upper()
+    raise ArgumentError(f"Invalid color code: {color}")
+
+
+# @functools.lru_cache(maxsize=128)  # Python 3.2+
+def normalize_palette(palette):
+    return [normalize_color(color) for color in palette]
+
+
+def _read_only(array: np.ndarray) -> np.ndarray:
+    array.flags.writeable = False
+    return array
+
+
+@dataclasses.dataclass(frozen=True, eq=False)
+class Palette:
+    """
+    An immutable, compiled skin tone palette.
+
+    It keeps the tones as RGB hex strings together with their BGR and Lab coordinates,
+    so the colors are parsed and converted only once instead of on every classification.
+    Indexing and iterating a palette yield the hex strings, like the plain list it replaces.
+    """
+
+    hex: Tuple[str, ...]
+    bgr: np.ndarray
+    lab: np.ndarray
+    labels: Tuple[str, ...]
+    name: Optional[str] = None
+
+    @classmethod
+    def compile(cls, colors, labels=None, name=None) -> "Palette":
+        """
+        Compile a palette from normalized RGB hex strings.
+        Prefer `get_palette`, which caches the compiled palettes.
+        :param colors: The tones as RGB hex strings, e.g., "#373028" or "#ABC".
+        :param labels: The tone labels, defaults to the uppercase alphabet list.
+        :param name: The name of a built-in palette.
+        :return:
+        """
+        rgb = hex_to_rgb_array(colors)
+        hex_colors = tuple("#%02X%02X%02X" % tuple(c) for c in rgb)
+        bgr = _read_only(np.ascontiguousarray(rgb[:, ::-1]))
+        lab = _read_only(srgb_to_lab(rgb))
+        palette = cls(hex_colors, bgr, lab, tuple(default_tone_labels(hex_colors)), name)
+        return palette.with_labels(labels) if labels else palette
+
+    def with_labels(self, labels) -> "Palette":
+        """
+        Return a palette with the same tones and the given labels; the color arrays are shared.
+        :param labels:
+        :return:
+        """
+        labels = tuple(labels)
+        if labels == self.labels:
+            return self
+        if len(labels) != len(self):
+            raise ArgumentError("Argument -p/--palette and -l/--labels must have the same length.")
+        return dataclasses.replace(self, labels=labels)
+
+    def __len__(self):
+        return len(self.hex)
+
+    def __getitem__(self, index):
+        return self.hex[index]
+
+    def __iter__(self):
+        return iter(self.hex)
+
+
+# Built-in palettes, compiled once at import time, indexed by their names and aliases.
+BUILTIN_PALETTES = {
+    alias: palette
+    for name, colors in DEFAULT_TONE_PALETTE.items()
+    for palette in [Palette.compile(colors, name=name)]
+    for alias in [name] + TONE_ALIAS.get(name, [])
+}
+
+
+@functools.lru_cache(maxsize=128)
+def _compile_palette(colors: Tuple[str, ...]) -> Palette:
+    return Palette.compile(colors)
+
+
+def get_palette(palette, labels=None, prefix: str = "") -> Palette:
+    """
+    Resolve a skin tone palette into a compiled `Palette`.
+    Built-in palettes are precompiled; custom palettes are cached by their normalized colors.
+    :param palette: A `Palette`, the name (or alias) of a built-in palette,
+           or a list of RGB hex values leading by "#" or RGB values separated by comma(,).
+    :param labels: The tone labels, defaults to the uppercase alphabet list leading by `prefix`.
+    :param prefix: The prefix of the default labels, e.g., "C" for color images and "B" for black/white images.
+    :return:
+    """
+    if isinstance(palette, Palette):
+        return palette.with_labels(labels) if labels else palette
+    if isinstance(palette, str):
+        name = palette.lower()
+        if name not in BUILTIN_PALETTES:
+            raise ArgumentError(f"Invalid `tone_palette`: {palette}, valid choices are: {BUILTIN_PALETTES.keys()}")
+        compiled = BUILTIN_PALETTES[name]
+    else:
+        compiled = _compile_palette(tuple(normalize_palette(palette)))
+    return compiled.with_labels(labels or default_tone_labels(compiled, prefix))
@@ -0,0 +1,127 @@
+import logging
+import os
+from typing import Deque, List, Tuple, Optional
+
+from stone.utils import is_url
+
+LOG = logging.getLogger(__name__)
+
+# The expected processing time of a chunk in seconds
+DEFAULT_TARGET_SECONDS = 0.25
+DEFAULT_MAX_CHUNK_SIZE = 32
+# The weight of the past observations when a new one arrives
+_DECAY = 0.9
+
+
+class ChunkScheduler:
+    """
+    Group a stream of images into chunks that take about `target_seconds` to process.
+
+    The cost of an image is modeled as `overhead + rate * file size` and both terms are fitted (by least squares,
+    forgetting old observations) from the processing times of the finished chunks,
+    so cheap images are batched to amortize the inter-process overhead while large ones are sent alone.
+    Only a few chunks per worker are queued at any time and idle workers take the next chunk from the shared queue,
+    so no worker waits behind a long list of assigned images.
+    When the inputs run out, the remaining images are split into smaller chunks over all workers
+    to avoid a straggler at the end of the run.
+    """
+
+    def __init__(
+        self,
+        n_workers: int,
+        target_seconds: float = DEFAULT_TARGET_SECONDS,
+        max_chunk_size: int = DEFAULT_MAX_CHUNK_SIZE,
+    ):
+        """
+        :param n_workers: The number of workers sharing the chunks.
+        :param target_seconds: The expected processing time of a chunk.
+        :param max_chunk_size: The maximum number of images in a chunk.
+        """
+        self.n_workers = max(n_workers, 1)
+        self.target_seconds = target_seconds
+        self.max_chunk_size = max(max_chunk_size, 1)
+        # Decayed sums of the normal equations of `time = overhead * n_images + rate * n_bytes`
+        self._nn = self._ns = self._ss = self._tn = self._ts = 0.0
+        self._total_bytes = self._total_known = 0
+        self.overhead: Optional[float] = None
+        self.rate = 0.0
+
+    @staticmethod
+    def file_size(filename_or_url) -> Optional[int]:
+        """
+        :return: The size of a local file in bytes, or None if it is unknown, e.g., for URLs.
+        """
+        if isinstance(filename_or_url, str) and is_url(filename_or_url):
+            return None
+        try:
+            return os.stat(filename_or_url).st_size
+        except (OSError, TypeError, ValueError):
+            return None
+
+    def _bytes(self, size: Optional[int]) -> float:
+        if size is not None:
+            return size
+        # Assume an image of unknown size has the average size
+        return self._total_bytes / self._total_known if self._total_known else 0.0
+
+    def estimate(self, size: Optional[int]) -> Optional[float]:
+        """
+        Estimate the processing time of an image.
+        :param size: The file size of the image, see `file_size`.
+        :return: The estimated time in seconds, or None before any chunk is observed.
+        """
+        if self.overhead is None:
+            return None
+        return self.overhead + self.rate * self._bytes(size)
+
+    def observe(self, sizes: List[Optional[int]], seconds: float):
+        """
+        Update the cost model with the processing time of a finished chunk.
+        :param sizes: The file sizes of the images in the chunk.
+        :param seconds: The time spent processing the chunk in the worker.
+        :return:
+        """
+        known = [size for size in sizes if size is not None]
+        self._total_bytes += sum(known)
+        self._total_known += len(known)
+        n = len(sizes)
+        s = sum(self._bytes(size) for size in sizes)
+
+        self._nn = _DECAY * self._nn + n * n
+        self._ns = _DECAY * self._ns + n * s
+        self._ss = _DECAY * self._ss + s * s
+        self._tn = _DECAY * self._tn + seconds * n
+        self._ts = _DECAY * self._ts + seconds * s
+
+        det = self._nn * self._ss - self._ns * self._ns
+        overhead = rate = -1.0
+        if det > 1e-9 * self._nn * self._ss:
+            overhead = (self._tn * self._ss - self._ts * self._ns) / det
+            rate = (self._nn * self._ts - self._ns * self._tn) / det
+        if overhead < 0 or rate < 0:
+            # The sizes do not explain the times (e.g., they are all the same), use the average time per image
+            overhead, rate = self._tn / self._nn, 0.0
+        self.overhead, self.rate = overhead, rate
+
+    def cut(self, pending: Deque[Tuple[object, Optional[int]]], exhausted: bool) -> List[Tuple[object, Optional[int]]]:
+        """
+        Cut the next chunk from the front of the pending images.
+        Chunks are cut only when a worker needs more work, so they benefit from the latest observations.
+        :param pending: The images read from the inputs but not submitted yet, as (input, file size) tuples.
+        :param exhausted: Whether all inputs are read, i.e., `pending` holds all the remaining images.
+        :return: The chunk, as (input, file size) tuples.
+        """
+        budget = self.target_seconds
+        if exhausted and self.overhead is not None:
+            # Spread the remaining work evenly over the workers
+            remaining = sum(self.estimate(size) for _, size in pending)
+            budget = min(budget, remaining / self.n_workers)
+
+        chunk, cost = [], 0.0
+        while pending and len(chunk) < self.max_chunk_size:
+            estimate = self.estimate(pending[0][1])
+            if chunk and (estimate is None or cost + estimate > budget):
+                break
+            chunk.append(pending.popleft())
+            cost += estimate or 0.0
+        return chunk
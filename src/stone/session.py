@@ -0,0 +1,361 @@
+import logging
+from pathlib import Path
+from typing import Union, Literal, List
+
+import cv2
+import numpy as np
+
+from stone.cache import ResultCache, DEFAULT_CACHE_SIZE, content_hash, params_hash
+from stone.detector import DEFAULT_FACE_DETECTOR, get_face_detector
+from stone.dominant import (
+    DEFAULT_DOMINANT_COLOR_METHOD,
+    DEFAULT_KMEANS_ATTEMPTS,
+    DEFAULT_KMEANS_MAX_ITER,
+    DEFAULT_SEED,
+    get_dominant_color_extractor,
+)
+from stone.image import (
+    BW_SAMPLE_SIZE,
+    BW_MAX_SPREAD,
+    BW_MIN_FRACTION,
+    load_image,
+    read_image_file,
+    decode_image,
+    is_black_white,
+    process_image,
+    classify as classify_skin,
+    save_report_images,
+)
+from stone.lut import get_tone_lut
+from stone.palette import Palette, get_palette
+from stone.utils import ArgumentError, __version__, freeze
+from stone.video import DEFAULT_FRAME_STRIDE, DEFAULT_DETECT_INTERVAL, classify_video, is_video
+
+LOG = logging.getLogger(__name__)
+
+
+class Session:
+    """
+    A reusable classifier that keeps the expensive resources warm between images.
+
+    The face detector is loaded once and the skin tone palettes and labels are resolved once,
+    so processing many images with the same settings only pays for the per-image work.
+    A session is not thread-safe; create one per worker process or thread.
+    """
+
+    def __init__(
+        self,
+        image_type: Literal["auto", "color", "bw"] = "auto",
+        tone_palette: Union[List[str], Literal["perla", "yadon-ostfeld", "proder", "bw"]] = "perla",
+        tone_labels: List[str] = None,
+        convert_to_black_white: bool = False,
+        n_dominant_colors=2,
+        new_width=250,
+        scale=1.1,
+        min_nbrs=5,
+        min_size=(90, 90),
+        threshold=0.15,
+        return_report_image=False,
+        use_lut=False,
+        dominant_color_method: Literal["kmeans", "histogram"] = DEFAULT_DOMINANT_COLOR_METHOD,
+        kmeans_attempts=DEFAULT_KMEANS_ATTEMPTS,
+        kmeans_max_iter=DEFAULT_KMEANS_MAX_ITER,
+        seed=DEFAULT_SEED,
+        warm_start=False,
+        frame_stride=DEFAULT_FRAME_STRIDE,
+        detect_interval=DEFAULT_DETECT_INTERVAL,
+        face_detector: str = DEFAULT_FACE_DETECTOR,
+        face_detector_model: Union[str, Path] = None,
+        detect_width=-1,
+        max_face_pixels=-1,
+        reduced_decode=True,
+        report_image_dir: Union[str, Path] = None,
+        cache_dir: Union[str, Path] = None,
+        cache_size: int = DEFAULT_CACHE_SIZE,
+    ):
+        """
+        Create a session. The parameters are the same as `stone.process`.
+        :raise ArgumentError: If the palette, labels, dominant color method, face detector, frame stride or
+               detection interval are invalid.
+        """
+        self.image_type = image_type
+        self.tone_palette = tone_palette
+        self.tone_labels = tone_labels
+        self.convert_to_black_white = convert_to_black_white
+        self.n_dominant_colors = n_dominant_colors
+        self.new_width = new_width
+        self.scale = scale
+        self.min_nbrs = min_nbrs
+        self.min_size = tuple(min_size)
+        self.threshold = threshold
+        self.return_report_image = return_report_image
+        self.use_lut = use_lut
+        self.dominant_color_method = dominant_color_method
+        self.kmeans_attempts = kmeans_attempts
+        self.kmeans_max_iter = kmeans_max_iter
+        self.seed = seed
+        self.warm_start = warm_start
+        self.frame_stride = frame_stride
+        self.detect_interval = detect_interval
+        self.face_detector = face_detector
+        self.face_detector_model = face_detector_model
+        self.detect_width = detect_width
+        self.max_face_pixels = max_face_pixels
+        self.reduced_decode = reduced_decode
+        self.report_image_dir = report_image_dir
+        self.cache = ResultCache(cache_dir, cache_size) if cache_dir else None
+
+        for name, value in [("frame_stride", frame_stride), ("detect_interval", detect_interval)]:
+            if value < 1:
+                raise ArgumentError(f"Invalid {name}: {value}, it should be a positive integer.")
+        get_dominant_color_extractor(dominant_color_method)
+        self.detector = get_face_detector(
+            face_detector, model=face_detector_model, scale_factor=scale, min_neighbors=min_nbrs
+        )
+        self._palettes = {}
+        # Resolve the palettes that are known upfront, so invalid arguments fail fast.
+        if tone_palette:
+            self.palette_for("bw" if image_type == "bw" else "color")
+        self.fingerprint = params_hash(self.cache_params())
+
+    def cache_params(self) -> dict:
+        """
+        The parameters that affect the results, which identify the results in the cache.
+        :return:
+        """
+        return {
+            "version": __version__,
+            "image_type": self.image_type,
+            "tone_palette": freeze(self.tone_palette),
+            "tone_labels": freeze(self.tone_labels),
+            "convert_to_black_white": self.convert_to_black_white,
+            "n_dominant_colors": self.n_dominant_colors,
+            "new_width": self.new_width,
+            "scale": self.scale,
+            "min_nbrs": self.min_nbrs,
+            "min_size": freeze(self.min_size),
+            "threshold": self.threshold,
+            "use_lut": self.use_lut,
+            "dominant_color_method": self.dominant_color_method,
+            "kmeans_attempts": self.kmeans_attempts,
+            "kmeans_max_iter": self.kmeans_max_iter,
+            "seed": self.seed,
+            "warm_start": self.warm_start,
+            "frame_stride": self.frame_stride,
+            "detect_interval": self.detect_interval,
+            "face_detector": self.face_detector,
+            "face_detector_model": None if self.face_detector_model is None else str(self.face_detector_model),
+            "detect_width": self.detect_width,
+            "max_face_pixels": self.max_face_pixels,
+            "reduced_decode": self.reduced_decode,
+            "bw_detection": (BW_SAMPLE_SIZE, BW_MAX_SPREAD, BW_MIN_FRACTION),
+        }
+
+    @property
+    def target_width(self) -> int:
+        """
+        The width passed to the image decoder, so large JPEG images are decoded at a reduced resolution.
+        :return: The width the images are resized to, or -1 if they should be decoded at full resolution.
+        """
+        return self.new_width if self.reduced_decode else -1
+
+    def palette_for(self, image_type: Literal["color", "bw"]) -> Palette:
+        """
+        Resolve the skin tone palette (with its labels) used for the given (decoded) image type.
+        The result is cached, so it is computed at most once per image type.
+        :param image_type: "color" or "bw".
+        :return:
+        """
+        if image_type in self._palettes:
+            return self._palettes[image_type]
+        tone_palette = self.tone_palette
+        if not tone_palette:
+            tone_palette = "bw" if image_type == "bw" else "perla"
+        if len(tone_palette) == 1:
+            tone_palette = tone_palette[0]
+
+        palette = get_palette(tone_palette, self.tone_labels, "C" if image_type == "color" else "B")
+        self._palettes[image_type] = palette
+        return palette
+
+    def image_type_of(self, image: np.ndarray):
+        """
+        :param image: A decoded BGR image.
+        :return: Whether the image is processed as black/white, and the (decoded) image type, "color" or "bw".
+        """
+        if self.image_type != "auto":
+            return self.image_type == "bw", self.image_type
+        is_bw = is_black_white(image)
+        decoded_image_type = "bw" if self.convert_to_black_white or is_bw else "color"
+        return is_bw, decoded_image_type
+
+    def dominant_color_options(self, palette: Palette, init_centers=None) -> dict:
+        """
+        :param palette: The palette of the image.
+        :param init_centers: The colors the k-means starts from, if any, e.g., the colors of the previous video frame.
+               They are expected to be close to the result, so the k-means is run only once.
+        :return: The options of the dominant color extractor, see `stone.image.dominant_colors`.
+        """
+        attempts = self.kmeans_attempts
+        if init_centers is not None:
+            attempts = 1
+        elif self.warm_start:
+            # Start from the palette tones instead of random skin colors
+            init_centers = palette.bgr
+        return dict(
+            attempts=attempts,
+            max_iter=self.kmeans_max_iter,
+            seed=self.seed,
+            init_centers=init_centers,
+        )
+
+    def classify(self, image: np.ndarray):
+        """
+        Classify the skin tone(s) of a decoded BGR image.
+        :param image: The image to classify.
+        :return: A dict with the detected image type, the face records and the report images (if required).
+        """
+        is_bw, decoded_image_type = self.image_type_of(image)
+        palette = self.palette_for(decoded_image_type)
+        lut = get_tone_lut(palette) if self.use_lut else None
+
+        records, report_images = process_image(
+            image,
+            is_bw,
+            self.convert_to_black_white,
+            palette,
+            palette.labels,
+            new_width=self.new_width,
+            n_dominant_colors=self.n_dominant_colors,
+            scaleFactor=self.scale,
+            minNeighbors=self.min_nbrs,
+            minSize=self.min_size,
+            threshold=self.threshold,
+            verbose=self.return_report_image,
+            detector=self.detector,
+            detect_width=self.detect_width,
+            max_face_pixels=self.max_face_pixels,
+            lut=lut,
+            dominant_color_method=self.dominant_color_method,
+            dominant_color_options=self.dominant_color_options(palette),
+        )
+        return {
+            "image_type": decoded_image_type,
+            "faces": records,
+            "report_images": report_images,
+        }
+
+    def classify_face(
+        self, image: np.ndarray, box, is_bw: bool, palette: Palette, init_centers=None, verbose=False, context=None
+    ):
+        """
+        Classify the skin tone of one face of an image that is already resized, e.g., a video frame.
+        :param image: The image.
+        :param box: The face as (x1, y1, x2, y2), or None to classify the skin of the whole image.
+        :param is_bw: See `image_type_of`.
+        :param palette: The palette of the image type, see `palette_for`.
+        :param init_centers: See `dominant_color_options`.
+        :param verbose: Whether to return the report image too.
+        :param context: The `stone.image.ImageContext` of the image, created if not given.
+        :return: The face record (without the face id), and the report image if `verbose`.
+        """
+        record, report_image = classify_skin(
+            image,
+            is_bw,
+            self.convert_to_black_white,
+            palette,
+            palette.labels,
+            self.n_dominant_colors,
+            verbose=verbose,
+            use_face=box is not None,
+            lut=get_tone_lut(palette) if self.use_lut else None,
+            dominant_color_method=self.dominant_color_method,
+            dominant_color_options=self.dominant_color_options(palette, init_centers),
+            face_coord=box,
+            context=context,
+        )
+        return (record, report_image) if verbose else record
+
+    def process(self, filename_or_url: Union[str, Path]):
+        """
+        Load the image from a local file or URL and classify it.
+        Local video files are classified by `process_video`.
+        :param filename_or_url: The filename (in local devices) or URL (in Internet) of the image.
+        :return: The same result as `stone.process`.
+        """
+        if is_video(filename_or_url):
+            return self.process_video(filename_or_url)
+        if self.cache is not None:
+            data, basename, extension = read_image_file(filename_or_url)
+            return self.process_encoded(data, basename, extension)
+        image, basename, extension = load_image(filename_or_url, cv2.IMREAD_COLOR, self.target_width)
+        return self._process_decoded(image, basename, extension)
+
+    def process_encoded(self, data, basename: str, extension: str = ""):
+        """
+        Decode the content of an image file (e.g., downloaded bytes) and classify it.
+        If the session has a cache, the result is looked up by the content first.
+        :param data: The bytes of the encoded image.
+        :param basename: The name of the image without extension, used in the result.
+        :param extension: The extension of the image, used in the result.
+        :return: The same result as `stone.process`.
+        """
+        image_hash = None
+        if self.cache is not None:
+            image_hash = content_hash(data)
+            # The report images are not cached, so they have to be created again
+            cached = None if self.return_report_image else self.cache.get(image_hash, self.fingerprint)
+            if cached is not None:
+                return {
+                    "basename": basename,
+                    "extension": extension,
+                    **cached,
+                    "report_images": {face["face_id"]: None for face in cached["faces"]},
+                }
+
+        image = decode_image(data, cv2.IMREAD_COLOR, f"{basename}{extension}", self.target_width)
+        result = self._process_decoded(image, basename, extension)
+        if image_hash is not None and "message" not in result:
+            self.cache.put(image_hash, self.fingerprint, {"image_type": result["image_type"], "faces": result["faces"]})
+        return result
+
+    def _process_decoded(self, image, basename, extension):
+        if image is None:
+            msg = f"{basename}{extension} is not found or is not a valid image."
+            LOG.error(msg)
+            return {
+                "filename": basename,
+                "message": msg,
+            }
+        result = {
+            "basename": basename,
+            "extension": extension,
+            **self.classify(image),
+        }
+        return self._save_report_images(result)
+
+    def process_video(self, filename: Union[str, Path]):
+        """
+        Classify the faces of a local video file, see `stone.video`.
+        The video is not cached.
+        :param filename:
+        :return: The same result as `stone.process`, with one face record per track and the number of sampled frames.
+        """
+        filename = Path(filename)
+        result = {
+            "basename": filename.stem,
+            "extension": filename.suffix,
+            **classify_video(self, filename),
+        }
+        return self._save_report_images(result)
+
+    def _save_report_images(self, result: dict):
+        if self.return_report_image and self.report_image_dir:
+            result["report_images"] = save_report_images(
+                result["report_images"],
+                self.report_image_dir,
+                result["basename"],
+                result["extension"],
+                result["image_type"],
+            )
+        return result
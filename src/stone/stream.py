@@ -0,0 +1,144 @@
+"""
+Classify a live stream of raw BGR frames, e.g., the output of `ffmpeg -f rawvideo -pix_fmt bgr24 -`.
+
+The frames are read by a background thread into a few preallocated buffers, so reading never allocates memory
+and the next frame is read while the current one is classified.
+If the classification falls behind, the frames that were never picked up are dropped and only the latest is kept,
+so the results stay close to real time.
+"""
+
+import json
+import logging
+import sys
+import threading
+from typing import BinaryIO, Iterator, Tuple, Optional
+
+import numpy as np
+
+from stone.utils import ArgumentError
+
+LOG = logging.getLogger(__name__)
+
+# One buffer is being filled, one holds the latest complete frame and one is being classified
+_N_BUFFERS = 3
+
+
+class FrameReader:
+    """
+    Read fixed-size raw BGR frames from a binary stream in a background thread.
+    Iterate over the reader to get the frames; a frame is only valid until the next one is requested.
+    """
+
+    def __init__(self, stream: BinaryIO, width: int, height: int, drop_stale: bool = True):
+        """
+        :param stream: A binary stream, e.g., `sys.stdin.buffer` or a named pipe opened with `open(path, "rb")`.
+        :param width: The width of the frames in pixels.
+        :param height: The height of the frames in pixels.
+        :param drop_stale: Whether to drop the frames that are not picked up before the next one is read.
+               If False, the reader waits for each frame to be picked up before publishing the next one,
+               so no frame is lost.
+        """
+        if width <= 0 or height <= 0:
+            raise ArgumentError(f"Invalid frame size: {width}x{height}")
+        self.stream = stream
+        self.drop_stale = drop_stale
+        self.n_read = 0
+        self.n_dropped = 0
+        self.error: Optional[BaseException] = None
+        self._buffers = [np.empty((height, width, 3), dtype=np.uint8) for _ in range(_N_BUFFERS)]
+        # The (frame index, buffer index) of the latest complete frame that is not picked up yet
+        self._ready: Optional[Tuple[int, int]] = None
+        self._in_use: Optional[int] = None
+        self._finished = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="stone-frame-reader", daemon=True)
+        self._thread.start()
+
+    def _read_into(self, buffer: np.ndarray) -> bool:
+        """
+        Fill the buffer with the next frame.
+        :return: False if the stream ends before a complete frame.
+        """
+        view = memoryview(buffer).cast("B")
+        pos = 0
+        while pos < len(view):
+            n = self.stream.readinto(view[pos:])
+            if not n:
+                if pos:
+                    LOG.warning(f"Discarded an incomplete frame of {pos} bytes at the end of the stream")
+                return False
+            pos += n
+        return True
+
+    def _run(self):
+        try:
+            while True:
+                with self._condition:
+                    # A buffer that holds neither the latest frame nor the frame being classified
+                    busy = {self._in_use, None if self._ready is None else self._ready[1]}
+                    free = next(i for i in range(_N_BUFFERS) if i not in busy)
+                if not self._read_into(self._buffers[free]):
+                    break
+                with self._condition:
+                    if not self.drop_stale:
+                        self._condition.wait_for(lambda: self._ready is None)
+                    if self._ready is not None:
+                        self.n_dropped += 1
+                    self._ready = (self.n_read, free)
+                    self.n_read += 1
+                    self._condition.notify_all()
+        except BaseException as e:
+            self.error = e
+        finally:
+            with self._condition:
+                self._finished = True
+                self._condition.notify_all()
+
+    def __iter__(self) -> Iterator[Tuple[int, np.ndarray]]:
+        """
+        :return: An iterator of (frame index, frame),
+                 where the index counts all the frames read, including the dropped ones.
+        """
+        while True:
+            with self._condition:
+                self._in_use = None
+                self._condition.notify_all()
+                self._condition.wait_for(lambda: self._ready is not None or self._finished)
+                if self._ready is None:
+                    break
+                index, self._in_use = self._ready
+                self._ready = None
+                self._condition.notify_all()
+            yield index, self._buffers[self._in_use]
+        if self.error is not None:
+            raise self.error
+
+
+def classify_stream(session, stream: BinaryIO, width: int, height: int, output=None, drop_stale: bool = True) -> int:
+    """
+    Classify each frame of a raw BGR stream and write one JSON object per frame, see `FrameReader`.
+    Each object has the frame index, the total number of dropped frames so far, the image type and the face records.
+    :param session: A `stone.Session`, its report images are not written.
+    :param stream: See `FrameReader`.
+    :param width: The width of the frames.
+    :param height: The height of the frames.
+    :param output: A text stream, defaults to `sys.stdout`; it is flushed after each line.
+    :param drop_stale: See `FrameReader`.
+    :return: The number of classified frames.
+    """
+    output = output or sys.stdout
+    reader = FrameReader(stream, width, height, drop_stale)
+    n_frames = 0
+    for index, frame in reader:
+        try:
+            result = session.classify(frame)
+            record = {"frame": index, "dropped": reader.n_dropped, "image_type": result["image_type"]}
+            record["faces"] = result["faces"]
+        except Exception as e:
+            LOG.exception(f"Failed to classify frame {index}")
+            record = {"frame": index, "dropped": reader.n_dropped, "message": f"Error processing frame {index}: {e}"}
+        output.write(json.dumps(record, default=str) + "\n")
+        output.flush()
+        n_frames += 1
+    LOG.info(f"The stream ended: {n_frames} frames classified, {reader.n_dropped} frames dropped.")
+    return n_frames
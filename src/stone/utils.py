@@ -1,5 +1,7 @@
 import argparse
+import csv
 import functools
+import json
 import logging
 import os
 import re
@@ -52,6 +54,17 @@ def alphabet_id(n:int) -> str:
     return prefix + letters[n]
 
 
+def freeze(value):
+    """
+    Convert the (nested) lists of the value into tuples, so it can be hashed and compared.
+    :param value:
+    :return:
+    """
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+    return value
+
+
 def is_url(text):
     return urlparse(text).scheme in ["http", "https"]
 
@@ -69,29 +82,52 @@ def extract_filename_and_extension(url):
     return basename, f".{extension[0]}" if extension else None
 
 
-def build_image_paths(images_paths, recursive=False):
-    filenames, urls = [], []
-    valid_images = ["*.jpg", "*.gif", "*.png", "*.jpeg", "*.webp", "*.tif"]
-    excluded_folders = ["debug", "log"]
+VALID_IMAGES = ["*.jpg", "*.gif", "*.png", "*.jpeg", "*.webp", "*.tif"]
+VALID_VIDEOS = ["*.mp4", "*.avi", "*.mov", "*.mkv", "*.webm", "*.m4v", "*.wmv", "*.mpg", "*.mpeg"]
+EXCLUDED_FOLDERS = ["debug", "log"]
+
+
+def iter_image_paths(images_paths, recursive=False, include_videos=False):
+    """
+    Lazily iterate over the images in the specified paths, without sorting them,
+    so the first images can be processed while huge directories are still being walked.
+    Each image is yielded once, even if it is specified several times, e.g., as a file and within its directory.
+    :param images_paths: Filename(s), directories or URLs.
+    :param recursive: Whether to search images recursively in the specified directories.
+    :param include_videos: Whether to search video files in the specified directories too.
+    :return: An iterator of resolved `Path`s (for local images) and URLs.
+    """
     if isinstance(images_paths, str):
         images_paths = [images_paths]
+    patterns = VALID_IMAGES + VALID_VIDEOS if include_videos else VALID_IMAGES
+    seen = set()
+    for path in _walk_image_paths(images_paths, recursive, patterns):
+        if path not in seen:
+            seen.add(path)
+            yield path
 
+
+def _walk_image_paths(images_paths, recursive, patterns):
     for filename in images_paths:
         if is_url(filename):
-            urls.append(filename)
+            yield filename
             continue
         p = Path(filename)
         if p.is_dir():
-            images = [p.glob(pattern) for pattern in valid_images]
+            for pattern in patterns:
+                yield from (f.resolve() for f in p.glob(pattern))
             if recursive:
-                subfolders = [f for f in p.glob("*/") if f.name not in excluded_folders]
-                images.extend([sp.rglob(pattern) for pattern in valid_images for sp in subfolders])
-
-            filenames.extend(images)
+                for sp in p.glob("*/"):
+                    if sp.name in EXCLUDED_FOLDERS:
+                        continue
+                    for pattern in patterns:
+                        yield from (f.resolve() for f in sp.rglob(pattern))
         elif p.is_file():
-            filenames.append([p])
-    paths = set([f.resolve() for fs in filenames for f in fs] + urls)
-    paths = list(paths)
+            yield p.resolve()
+
+
+def build_image_paths(images_paths, recursive=False, include_videos=False):
+    paths = list(iter_image_paths(images_paths, recursive, include_videos))
     if len(paths) == 0:
         raise FileNotFoundError("No valid images in the specified path.")
     # Sort paths by (first) number extracted from the filename string
@@ -108,6 +144,141 @@ def sort_file(path: Union[str, Path]):
     return (int(nums[0]) if nums else float("inf")), basename
 
 
+def image_name(filename_or_url) -> str:
+    """
+    The name of the image as recorded in the result file, i.e., the filename with extension.
+    :param filename_or_url:
+    :return:
+    """
+    if isinstance(filename_or_url, str) and is_url(filename_or_url):
+        basename, extension = extract_filename_and_extension(filename_or_url)
+        return f"{basename}{extension}"
+    return Path(filename_or_url).name
+
+
+def input_path(filename_or_url) -> str:
+    """
+    The full path of the image as recorded in the result file, which tells apart the images with the same filename.
+    :param filename_or_url:
+    :return: The absolute path of a local file, or the URL.
+    """
+    if isinstance(filename_or_url, str) and is_url(filename_or_url):
+        return filename_or_url
+    return str(Path(filename_or_url).absolute())
+
+
+class ResultRecords:
+    """
+    The records of an existing result file (CSV or JSON Lines), used to resume an interrupted run.
+    """
+
+    IMAGE_TYPES = ("color", "bw")
+
+    def __init__(self, header: list = None, header_line: str = "", truncated: bool = False):
+        """
+        :param header: The header row of a CSV file, None for JSON Lines.
+        :param header_line: The raw header line, kept when the file is rewritten.
+        :param truncated: Whether the last line of the file was incomplete and discarded.
+        """
+        self.header = header
+        self.header_line = header_line
+        self.truncated = truncated
+        self.processed = set()
+        self.failed = set()
+        self._lines = []  # (raw text, is error)
+
+    def add(self, text: str, name: str, is_error: bool, path: str = None):
+        """
+        Add a record.
+        :param text: The raw text of the record in the file.
+        :param name: The filename of a processed image, or the filename (or path) of a failed one.
+        :param is_error: Whether the record is an error.
+        :param path: The full path of the image, see `input_path`,
+               None if the record does not have it, e.g., it was written by an older version.
+        :return:
+        """
+        (self.failed if is_error else self.processed).add(path or name)
+        self._lines.append((text, is_error))
+
+    @classmethod
+    def is_error(cls, row: list) -> bool:
+        """
+        Check whether a CSV row is an error (file, message, path) instead of a face record (file, image type, ...).
+        """
+        return len(row) < 2 or row[1] not in cls.IMAGE_TYPES
+
+    @classmethod
+    def read(cls, filename: Union[str, Path]) -> "ResultRecords":
+        """
+        Read the result file, whose format is detected by its extension.
+        An incomplete last line, e.g., written when the run was killed, is discarded.
+        :param filename:
+        :return:
+        """
+        with open(filename, newline="", encoding="UTF8") as f:
+            text = f.read()
+        truncated = bool(text) and not text.endswith("\n")
+        if truncated:
+            text = text[: text.rfind("\n") + 1]
+        lines = text.splitlines(keepends=True)
+
+        if Path(filename).suffix == ".jsonl":
+            records = cls(truncated=truncated)
+            for line in lines:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if "message" in record:
+                    records.add(line, str(record["filename"]), True, record.get("path"))
+                else:
+                    records.add(line, f"{record['basename']}{record['extension']}", False, record.get("path"))
+            return records
+
+        header_line, *lines = lines or [""]
+        records = cls(next(csv.reader([header_line]), []), header_line, truncated)
+        # The path is the last column of both the face records and the errors
+        has_path = records.header[-1:] == ["path"]
+        reader = csv.reader(lines)
+        start = 0
+        for row in reader:
+            # A quoted field may span several lines
+            line, start = "".join(lines[start : reader.line_num]), reader.line_num
+            if row:
+                path = row[-1] if has_path and len(row) > 2 else None
+                records.add(line, row[0], cls.is_error(row), path or None)
+        return records
+
+    def contains(self, filename_or_url, include_failed: bool = True) -> bool:
+        """
+        Check whether the image is recorded.
+        Images are matched by their full paths, so images with the same filename in different folders are not mixed up.
+        Records without the path, e.g., written by an older version, are matched by the filename.
+        :param filename_or_url:
+        :param include_failed: Whether the images recorded with an error count as recorded.
+        :return:
+        """
+        path, name = input_path(filename_or_url), image_name(filename_or_url)
+        if path in self.processed or name in self.processed:
+            return True
+        if not include_failed:
+            return False
+        # The errors without the path are recorded with either the path as given or the name without extension
+        return any(key in self.failed for key in (path, str(filename_or_url), name, Path(name).stem))
+
+    def write(self, filename: Union[str, Path], include_failed: bool = True):
+        """
+        Rewrite the result file atomically, e.g., to drop the errors that will be retried.
+        :param filename:
+        :param include_failed: Whether to keep the error records.
+        :return:
+        """
+        tmp_filename = f"{filename}.tmp"
+        with open(tmp_filename, "w", newline="", encoding="UTF8") as f:
+            f.write(self.header_line)
+            f.writelines(text for text, is_error in self._lines if include_failed or not is_error)
+        os.replace(tmp_filename, filename)
+
+
 def is_windows():
     return sys.platform in ["win32", "cygwin"]
 
@@ -179,6 +350,37 @@ def build_arguments():
         help="Search images recursively in the specified directory.",
         **kwargs,
     )
+    if not in_gui:
+        files.add_argument(
+            "--stream",
+            nargs="?",
+            const="-",
+            metavar="PIPE",
+            help="Classify a stream of raw BGR frames read from stdin (the default) or a named pipe,\n"
+            "e.g., the output of `ffmpeg -i <input> -f rawvideo -pix_fmt bgr24 -`, instead of images.\n"
+            "One JSON object is written to stdout per frame; requires --frame_size.",
+        )
+        files.add_argument(
+            "--frame_size",
+            type=int,
+            nargs=2,
+            metavar=("WIDTH", "HEIGHT"),
+            help="The size of the frames of --stream in pixels.",
+        )
+        files.add_argument(
+            "--keep_all_frames",
+            action="store_true",
+            help="Whether to classify every frame of --stream.\n"
+            "By default, the frames that arrive while a frame is being classified are dropped except the latest.",
+        )
+    kwargs = dict(metavar="Include Videos") if in_gui else {}
+    files.add_argument(
+        "--include_videos",
+        action="store_true",
+        help="Search video files (e.g., '*.mp4', '*.avi') in the specified directory too.\n"
+        "The faces of a video are tracked over its frames and reported once per track.",
+        **kwargs,
+    )
     if in_gui:
         files.add_argument(
             "--image_files",
@@ -330,6 +532,37 @@ def build_arguments():
         **kwargs,
     )
 
+    kwargs = dict(metavar="Output Format") if in_gui else {}
+    outputs.add_argument(
+        "--output_format",
+        choices=["csv", "jsonl"],
+        default="csv",
+        help="Specify the format of the result file, defaults to 'csv'.\n"
+        "'csv' writes one row per face to 'result.csv', the last column being the path of the image;\n"
+        "'jsonl' writes one JSON object per image to 'result.jsonl'.\n"
+        "The results are written in the order the images finish, not in the order of the inputs.",
+        **kwargs,
+    )
+
+    kwargs = dict(metavar="Resume") if in_gui else {}
+    outputs.add_argument(
+        "--resume",
+        action="store_true",
+        help="Whether to resume an interrupted run.\n"
+        "If true, the images already recorded in '<OUTPUT_DIRECTORY>/result.csv' are skipped\n"
+        "and the new results are appended to it.",
+        **kwargs,
+    )
+
+    kwargs = dict(metavar="Retry Errors") if in_gui else {}
+    outputs.add_argument(
+        "--retry_errors",
+        action="store_true",
+        help="Whether to process the images recorded with an error again when resuming a run.\n"
+        "Their error rows are removed from the result file.",
+        **kwargs,
+    )
+
     kwargs = {"gooey_options": {"show_border": False, "columns": 2}} if in_gui else {}
     advanced = parser.add_argument_group(
         "Advanced Settings",
@@ -411,6 +644,169 @@ def build_arguments():
         **kwargs,
     )
 
+    kwargs = dict(metavar="Use Tone Lookup Table") if in_gui else {}
+    advanced.add_argument(
+        "--use_lut",
+        action="store_true",
+        help="Whether to assign the skin tones with a precomputed nearest-tone lookup table of the palette.\n"
+        "The table is built once per palette and cached in '~/.cache/stone/lut' (or '$STONE_LUT_DIR').",
+        **kwargs,
+    )
+
+    kwargs = dict(metavar="Dominant Color Method") if in_gui else {}
+    advanced.add_argument(
+        "--color_method",
+        choices=["kmeans", "histogram"],
+        default="kmeans",
+        help="Specify how the dominant colors are extracted from the skin pixels, defaults to 'kmeans'.\n"
+        "'kmeans' clusters all the skin pixels;\n"
+        "'histogram' clusters the bins of a color histogram, which is deterministic and much faster on large faces.",
+        **kwargs,
+    )
+
+    kwargs = dict(metavar="K-Means Attempts") if in_gui else {}
+    advanced.add_argument(
+        "--kmeans_attempts",
+        type=int,
+        default=10,
+        help="Specify how many times the k-means of the dominant colors is run from different initial centers.\n"
+        "The most compact result is kept; fewer attempts are faster.",
+        **kwargs,
+    )
+
+    kwargs = dict(metavar="K-Means Iterations") if in_gui else {}
+    advanced.add_argument(
+        "--kmeans_max_iter",
+        type=int,
+        default=10,
+        help="Specify the maximum number of iterations of each k-means run.",
+        **kwargs,
+    )
+
+    kwargs = dict(metavar="Random Seed") if in_gui else {}
+    advanced.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="Specify the seed of the k-means initialization, so the results are reproducible.\n"
+        "A negative value gives different results on each run.",
+        **kwargs,
+    )
+
+    kwargs = dict(metavar="Warm Start from Palette") if in_gui else {}
+    advanced.add_argument(
+        "--warm_start",
+        action="store_true",
+        help="Whether to start the k-means from the tones of the palette instead of random skin colors.",
+        **kwargs,
+    )
+
+    kwargs = dict(metavar="Video Frame Stride") if in_gui else {}
+    advanced.add_argument(
+        "--frame_stride",
+        type=int,
+        default=1,
+        help="For videos, specify that only every N-th frame is classified.",
+        **kwargs,
+    )
+
+    kwargs = dict(metavar="Video Detection Interval") if in_gui else {}
+    advanced.add_argument(
+        "--detect_interval",
+        type=int,
+        default=10,
+        help="For videos, specify that the faces are detected every N classified frames.\n"
+        "In between, the faces are tracked from their last positions, which is much cheaper.",
+        **kwargs,
+    )
+
+    kwargs = dict(metavar="Face Detector") if in_gui else {}
+    advanced.add_argument(
+        "--face_detector",
+        choices=["haar", "yunet"],
+        default="haar",
+        help="Specify the face detector, defaults to 'haar'.\n"
+        "'haar' is the Haar cascade of OpenCV;\n"
+        "'yunet' is a CNN detector, usually faster and more accurate,\n"
+        "which needs its model file, see '--detector_model'.",
+        **kwargs,
+    )
+
+    kwargs = {"widget": "FileChooser", "metavar": "Face Detector Model"} if in_gui else {}
+    advanced.add_argument(
+        "--detector_model",
+        type=str,
+        default=None,
+        help="Specify the model file of the face detector.\n"
+        "Defaults to the builtin Haar cascade, or 'face_detection_yunet_2023mar.onnx' in '~/.cache/stone/models'.",
+        **kwargs,
+    )
+
+    kwargs = dict(metavar="Detection Width") if in_gui else {}
+    advanced.add_argument(
+        "--detect_width",
+        type=int,
+        default=-1,
+        help="Specify the width of the image the faces are detected on, if smaller than '--new_width'.\n"
+        "The faces are still classified on the image resized to '--new_width', defaults to -1 (no extra resize).",
+        **kwargs,
+    )
+
+    kwargs = dict(metavar="Maximum Face Pixels") if in_gui else {}
+    advanced.add_argument(
+        "--max_face_pixels",
+        type=int,
+        default=-1,
+        help="Specify the maximum number of pixels of a face for the classification;\n"
+        "the image is downscaled until the biggest face fits, defaults to -1 (no limit).",
+        **kwargs,
+    )
+
+    kwargs = dict(metavar="Decode in Full Resolution") if in_gui else {}
+    advanced.add_argument(
+        "--full_decode",
+        action="store_true",
+        help="Whether to always decode the images in full resolution.\n"
+        "By default, large JPEG images are decoded at 1/2, 1/4 or 1/8 of their resolution\n"
+        "if it is still larger than the '--new_width', which is much faster.",
+        **kwargs,
+    )
+
+    kwargs = dict(metavar="Disable Result Cache") if in_gui else {}
+    advanced.add_argument(
+        "--no_cache",
+        action="store_true",
+        help="Whether to disable the result cache.\n"
+        "By default, the results are cached by the content of the images and the settings,\n"
+        "so the images processed by previous runs with the same settings are not processed again.",
+        **kwargs,
+    )
+
+    kwargs = (
+        {"gooey_options": {"message": "Select the cache directory"}, "widget": "DirChooser", "metavar": "Cache Directory"}
+        if in_gui
+        else {}
+    )
+    advanced.add_argument(
+        "--cache_dir",
+        help="Specify the directory of the result cache, defaults to '<OUTPUT_DIRECTORY>/cache'.",
+        default=None,
+        **kwargs,
+    )
+
+    kwargs = (
+        {"gooey_options": {"initial_value": 1024, "min": 1, "max": 999999}, "widget": "IntegerField"} if in_gui else {}
+    )
+    advanced.add_argument(
+        "--cache_size",
+        type=int,
+        metavar="Maximum Cache Size (MB)",
+        help="Specify the maximum disk usage of the result cache in megabytes, defaults to 1024.\n"
+        "The least recently used results are evicted when it is exceeded.",
+        default=1024,
+        **kwargs,
+    )
+
     kwargs = {"gooey_options": {"initial_value": 0, "min": 0, "max": 99999}, "widget": "IntegerField"} if in_gui else {}
     advanced.add_argument(
         "--n_workers",
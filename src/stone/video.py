@@ -0,0 +1,278 @@
+"""
+Classify the skin tones of the faces in a video.
+
+The frames are sampled with a stride and the faces are detected only every `detect_interval` sampled frames;
+in between, each face is followed by a cheap template-matching tracker.
+Every face is classified in each sampled frame it appears in, and the records of a face (a track) are aggregated
+into one record, so a video gives one record per person instead of one per frame.
+"""
+
+import logging
+from collections import Counter
+from pathlib import Path
+from typing import Union, Iterator, Tuple, Optional, List
+
+import cv2
+import numpy as np
+
+from stone.image import detect_faces, resize, face_report_image, hex_to_bgr, ImageContext
+
+LOG = logging.getLogger(__name__)
+
+VIDEO_EXTENSIONS = frozenset([".mp4", ".avi", ".mov", ".mkv", ".webm", ".m4v", ".wmv", ".mpg", ".mpeg"])
+DEFAULT_FRAME_STRIDE = 1
+DEFAULT_DETECT_INTERVAL = 10
+# The tracker searches a face within a window extended by this fraction of the face size on each side
+TRACKER_SEARCH_MARGIN = 0.5
+# The tracker loses a face if its best normalized correlation with the template is below this value
+TRACKER_MIN_SCORE = 0.5
+# A detected face continues a tracked one if their boxes overlap by at least this intersection over union
+MATCH_MIN_IOU = 0.3
+
+
+def is_video(filename_or_url) -> bool:
+    """
+    :param filename_or_url:
+    :return: Whether the input is a local video file, judged by its extension.
+    """
+    if not isinstance(filename_or_url, (str, Path)):
+        return False
+    return Path(filename_or_url).suffix.lower() in VIDEO_EXTENSIONS and Path(filename_or_url).is_file()
+
+
+def read_frames(
+    filename: Union[str, Path], frame_stride: int = DEFAULT_FRAME_STRIDE
+) -> Iterator[Tuple[int, np.ndarray]]:
+    """
+    Read every `frame_stride`-th frame of a video; the skipped frames are grabbed without being decoded.
+    :param filename:
+    :param frame_stride:
+    :return: An iterator of (frame index, BGR frame).
+    :raise IOError: If the video cannot be opened.
+    """
+    capture = cv2.VideoCapture(str(filename))
+    if not capture.isOpened():
+        raise IOError(f"{filename} is not found or is not a valid video.")
+    frame_stride = max(frame_stride, 1)
+    try:
+        index = 0
+        while True:
+            if index % frame_stride == 0:
+                ok, frame = capture.read()
+                if not ok:
+                    break
+                yield index, frame
+            elif not capture.grab():
+                break
+            index += 1
+    finally:
+        capture.release()
+
+
+def iou(a, b) -> float:
+    """
+    :param a: A box as (x1, y1, x2, y2).
+    :param b: Another box.
+    :return: The intersection over union of the boxes.
+    """
+    w = min(a[2], b[2]) - max(a[0], b[0])
+    h = min(a[3], b[3]) - max(a[1], b[1])
+    if w <= 0 or h <= 0:
+        return 0.0
+    intersection = w * h
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - intersection
+    return intersection / union
+
+
+class FaceTracker:
+    """
+    Follow a face between detections by matching its appearance at the last detection
+    within a window around its last position (normalized cross-correlation on the gray image).
+    """
+
+    def __init__(self, gray: np.ndarray, box, margin: float = TRACKER_SEARCH_MARGIN, min_score=TRACKER_MIN_SCORE):
+        """
+        :param gray: The gray frame the face was detected in.
+        :param box: The face as (x1, y1, x2, y2).
+        :param margin: See `TRACKER_SEARCH_MARGIN`.
+        :param min_score: See `TRACKER_MIN_SCORE`.
+        """
+        self.margin = margin
+        self.min_score = min_score
+        self.reset(gray, box)
+
+    def reset(self, gray: np.ndarray, box):
+        self.box = tuple(int(v) for v in box)
+        x1, y1, x2, y2 = self.box
+        self.template = gray[y1:y2, x1:x2].copy()
+
+    def update(self, gray: np.ndarray) -> bool:
+        """
+        Find the face in a new frame.
+        :param gray: The gray frame.
+        :return: Whether the face is found, in which case `box` is updated.
+        """
+        x1, y1, x2, y2 = self.box
+        th, tw = self.template.shape[:2]
+        mx, my = int(tw * self.margin), int(th * self.margin)
+        h, w = gray.shape[:2]
+        sx1, sy1 = max(x1 - mx, 0), max(y1 - my, 0)
+        sx2, sy2 = min(x2 + mx, w), min(y2 + my, h)
+        if tw == 0 or th == 0 or sx2 - sx1 < tw or sy2 - sy1 < th:
+            return False
+        scores = cv2.matchTemplate(gray[sy1:sy2, sx1:sx2], self.template, cv2.TM_CCOEFF_NORMED)
+        _, score, _, (dx, dy) = cv2.minMaxLoc(scores)
+        if score < self.min_score:
+            return False
+        self.box = (sx1 + dx, sy1 + dy, sx1 + dx + tw, sy1 + dy + th)
+        return True
+
+
+class Track:
+    """
+    The records of one face over the frames of a video.
+    """
+
+    def __init__(self, track_id):
+        self.track_id = track_id
+        self.tracker: Optional[FaceTracker] = None
+        self.records: List[dict] = []
+        self.frames: List[int] = []
+        # The frame and box of the most accurate record, used for the report image
+        self.best_frame = None
+        self.best_box = None
+        self.best_accuracy = -np.inf
+
+    @property
+    def colors(self):
+        """
+        The dominant colors of the last record in BGR, the k-means of the next frame starts from them.
+        """
+        if not self.records:
+            return None
+        return np.array([hex_to_bgr(item["color"]) for item in self.records[-1]["dominant_colors"]])
+
+    def add(self, frame_index: int, record: dict, frame: np.ndarray, box):
+        if record["accuracy"] > self.best_accuracy:
+            self.best_frame, self.best_box, self.best_accuracy = frame, box, record["accuracy"]
+        self.records.append(record)
+        self.frames.append(frame_index)
+
+    def summary(self) -> dict:
+        """
+        Aggregate the records: the skin tone is the most frequent one,
+        the accuracy is the mean accuracy of the records with that tone
+        and the dominant colors are those of its most accurate record.
+        :return: A face record with the number of frames and the first and last frame index.
+        """
+        votes = Counter(record["tone_label"] for record in self.records)
+        tone_label, _ = votes.most_common(1)[0]
+        records = [record for record in self.records if record["tone_label"] == tone_label]
+        best = max(records, key=lambda record: record["accuracy"])
+        return {
+            "face_id": self.track_id,
+            "dominant_colors": best["dominant_colors"],
+            "skin_tone": best["skin_tone"],
+            "tone_label": tone_label,
+            "accuracy": round(float(np.mean([record["accuracy"] for record in records])), 2),
+            "n_frames": len(self.records),
+            "first_frame": self.frames[0],
+            "last_frame": self.frames[-1],
+        }
+
+
+def classify_video(session, filename: Union[str, Path]) -> dict:
+    """
+    Classify the faces of a video with the settings of a session, see the module documentation.
+    The image type is detected on the first sampled frame.
+    If no face is found in the whole video, the skin of the frames is classified as one track with the id "NA".
+    :param session: A `stone.Session`.
+    :param filename:
+    :return: The image type, the face records of the tracks (see `Track.summary`), the number of sampled frames
+             and the report images of the tracks (their most accurate frames) if required.
+    """
+    tracks, active = [], []
+    no_face = Track("NA")
+    is_bw = decoded_image_type = palette = None
+    n_frames = 0
+    for n_frames, (frame_index, frame) in enumerate(read_frames(filename, session.frame_stride), 1):
+        frame = resize(frame, session.new_width)
+        if palette is None:
+            is_bw, decoded_image_type = session.image_type_of(frame)
+            palette = session.palette_for(decoded_image_type)
+        context = ImageContext(frame, is_bw)
+        gray = context.gray
+
+        if (n_frames - 1) % session.detect_interval == 0:
+            # All faces are detected, each one is followed by its own track
+            boxes = detect_faces(
+                frame,
+                session.scale,
+                session.min_nbrs,
+                session.min_size,
+                False,
+                is_bw,
+                session.threshold,
+                context=context,
+                detector=session.detector,
+            )
+            active = _match_tracks(active, boxes, gray, tracks)
+        else:
+            active = [track for track in active if track.tracker.update(gray)]
+
+        for track in active:
+            box = track.tracker.box
+            record = session.classify_face(frame, box, is_bw, palette, init_centers=track.colors, context=context)
+            track.add(frame_index, record, frame, box)
+        if not tracks:
+            record = session.classify_face(frame, None, is_bw, palette, init_centers=no_face.colors, context=context)
+            no_face.add(frame_index, record, frame, None)
+
+    if n_frames == 0:
+        raise IOError(f"{filename} has no frames.")
+    tracks = tracks or [no_face]
+    report_images = {}
+    for idx, track in enumerate(tracks):
+        report_image = None
+        if session.return_report_image:
+            _, report_image = session.classify_face(track.best_frame, track.best_box, is_bw, palette, verbose=True)
+            if track.best_box is not None:
+                report_image = face_report_image(track.best_box, idx, report_image)
+        report_images[track.track_id] = report_image
+    return {
+        "image_type": decoded_image_type,
+        "faces": [track.summary() for track in tracks],
+        "n_frames": n_frames,
+        "report_images": report_images,
+    }
+
+
+def _match_tracks(active: List[Track], boxes, gray: np.ndarray, tracks: List[Track]) -> List[Track]:
+    """
+    Continue the active tracks with the detected faces that overlap them the most, and start new tracks
+    for the other faces. The tracks without a detected face end.
+    :return: The new active tracks.
+    """
+    boxes = [tuple(int(v) for v in box) for box in boxes]
+    pairs = sorted(
+        ((iou(track.tracker.box, box), t, b) for t, track in enumerate(active) for b, box in enumerate(boxes)),
+        reverse=True,
+    )
+    matched_tracks, matched_boxes, new_active = set(), set(), []
+    for overlap, t, b in pairs:
+        if overlap < MATCH_MIN_IOU:
+            break
+        if t in matched_tracks or b in matched_boxes:
+            continue
+        matched_tracks.add(t)
+        matched_boxes.add(b)
+        active[t].tracker.reset(gray, boxes[b])
+        new_active.append(active[t])
+    for b, box in enumerate(boxes):
+        if b in matched_boxes:
+            continue
+        track = Track(len(tracks) + 1)
+        track.tracker = FaceTracker(gray, box)
+        tracks.append(track)
+        new_active.append(track)
+    return new_active
@@ -0,0 +1,196 @@
+import abc
+import csv
+import io
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Union, List, Optional
+
+from stone.utils import input_path
+
+LOG = logging.getLogger(__name__)
+
+# The buffered text is written to the file when it reaches this number of characters
+DEFAULT_BUFFER_SIZE = 64 * 1024
+# ... or when this number of seconds passed since the last flush
+DEFAULT_FLUSH_INTERVAL = 5.0
+
+
+class ResultWriter(abc.ABC):
+    """
+    Write the results of `stone.process` to a file.
+
+    The file is kept open and the records are buffered in memory.
+    The buffer is flushed when it grows larger than `buffer_size` or `flush_interval` seconds passed since the last flush
+    (checked whenever a result is written), and when the writer is closed.
+    A writer is not thread-safe; use it from the thread that collects the results.
+    Subclasses implement `format`, and `write_header` if the file has a header.
+    """
+
+    extension = ""
+
+    def __init__(
+        self,
+        filename: Union[str, Path],
+        append: bool = False,
+        buffer_size: int = DEFAULT_BUFFER_SIZE,
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+    ):
+        """
+        :param filename:
+        :param append: Whether to append to an existing file instead of overwriting it.
+        :param buffer_size: Flush the buffer when it holds at least this number of characters.
+        :param flush_interval: Flush the buffer when this number of seconds passed since the last flush.
+        """
+        self.filename = filename
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        is_new = not append or not os.path.exists(filename) or os.path.getsize(filename) == 0
+        self._file = open(filename, "a" if append else "w", newline="", encoding="UTF8")
+        self._buffer = io.StringIO()
+        self._last_flush = time.monotonic()
+        if is_new:
+            self.write_header()
+            self.flush()
+
+    def write_header(self):
+        pass
+
+    @abc.abstractmethod
+    def format(self, result: dict, path: str = ""):
+        """
+        Write the records of one result into the buffer.
+        :param result: A result of `stone.process`, or an error with the "filename" and the "message".
+        :param path: The full path of the image, see `stone.utils.input_path`, empty if unknown.
+        :return:
+        """
+
+    def write(self, result: dict, filename_or_url=None):
+        """
+        Buffer the records of one result, flushing the buffer if a threshold is reached.
+        All records of a result are always flushed together.
+        :param result: A result of `stone.process`, or an error with the "filename" and the "message".
+        :param filename_or_url: The input of the result, whose full path is recorded so that `--resume`
+               tells apart the images with the same filename, see `stone.utils.ResultRecords`.
+        :return:
+        """
+        self.format(result, input_path(filename_or_url) if filename_or_url is not None else "")
+        if self._buffer.tell() >= self.buffer_size or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        text = self._buffer.getvalue()
+        if text:
+            self._file.write(text)
+            self._file.flush()
+            self._buffer.seek(0)
+            self._buffer.truncate()
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        if self._file.closed:
+            return
+        self.flush()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class CSVResultWriter(ResultWriter):
+    """
+    Write one row per face, with the columns of `csv_header`, and one (file, message, path) row per failed image.
+    Without `with_path`, the rows have the layout of the files written by older versions, i.e., no path column.
+    """
+
+    extension = ".csv"
+
+    def __init__(self, filename: Union[str, Path], n_dominant_colors: int = 2, with_path: bool = True, **kwargs):
+        """
+        :param filename:
+        :param n_dominant_colors: The number of dominant colors of each face, which determines the columns.
+        :param with_path: Whether to write the trailing path column, disable it to append to an older result file.
+        :param kwargs: The parameters of `ResultWriter`.
+        """
+        self.n_dominant_colors = n_dominant_colors
+        self.with_path = with_path
+        self._writer = None
+        super().__init__(filename, **kwargs)
+
+    def write_header(self):
+        self.writer.writerow(csv_header(self.n_dominant_colors, self.with_path))
+
+    @property
+    def writer(self):
+        if self._writer is None:
+            self._writer = csv.writer(self._buffer, lineterminator="\n")
+        return self._writer
+
+    def format(self, result: dict, path: str = ""):
+        self.writer.writerows(csv_rows(result, path if self.with_path else None))
+
+
+class JSONLinesResultWriter(ResultWriter):
+    """
+    Write one JSON object per image, i.e., the result of `stone.process` and the "path" of the image.
+    The report images are only included if they are saved as files, i.e., as their filenames.
+    """
+
+    extension = ".jsonl"
+
+    def __init__(self, filename: Union[str, Path], n_dominant_colors: int = 2, **kwargs):
+        """
+        :param filename:
+        :param n_dominant_colors: Unused, for compatibility with `CSVResultWriter`.
+        :param kwargs: The parameters of `ResultWriter`.
+        """
+        super().__init__(filename, **kwargs)
+
+    def format(self, result: dict, path: str = ""):
+        record = dict(result)
+        report_images = record.pop("report_images", None)
+        if report_images and all(isinstance(filename, str) for filename in report_images.values()):
+            record["report_images"] = report_images
+        if path:
+            record["path"] = path
+        self._buffer.write(json.dumps(record, default=str) + "\n")
+
+
+RESULT_WRITERS = {
+    "csv": CSVResultWriter,
+    "jsonl": JSONLinesResultWriter,
+}
+
+
+def csv_header(n_dominant_colors: int, with_path: bool = True) -> List[str]:
+    return (
+        ["file", "image type", "face id"]
+        + [column for i in range(n_dominant_colors) for column in (f"dominant {i + 1}", f"percent {i + 1}")]
+        + ["skin tone", "tone label", "accuracy(0-100)"]
+        + (["path"] if with_path else [])
+    )
+
+
+def csv_rows(result: dict, path: Optional[str] = "") -> List[list]:
+    """
+    Convert a result of `stone.process` into the CSV rows, see `CSVResultWriter`.
+    :param result:
+    :param path: The full path of the image, the last column of every row. None omits the column.
+    :return:
+    """
+    extra = [] if path is None else [path]
+    if "message" in result:
+        return [[result["filename"], result["message"], *extra]]
+    rows = []
+    for face in result["faces"]:
+        row = [f"{result['basename']}{result['extension']}", result["image_type"], face["face_id"]]
+        for item in face["dominant_colors"]:
+            row.extend([item["color"], item["percent"]])
+        row.extend([face["skin_tone"], face["tone_label"], face["accuracy"], *extra])
+        rows.append(row)
+    return rows
@@ -0,0 +1,80 @@
+import asyncio
+import functools
+import tempfile
+import threading
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+from pathlib import Path
+
+from stone import aiter_process, aprocess, aprocess_many
+from stone.utils import ArgumentError
+from tests.test_api import create_image
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class TestAio(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.image_dir = Path(self.tmp_dir.name)
+        self.images = [str(create_image(self.image_dir / f"img_{i}.png", seed=i)) for i in range(3)]
+
+        handler = functools.partial(QuietHandler, directory=self.tmp_dir.name)
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmp_dir.cleanup()
+
+    def test_aprocess_file_and_url(self):
+        result = asyncio.run(aprocess(self.images[0], image_type="color"))
+        self.assertEqual(result["basename"], "img_0")
+        self.assertEqual(len(result["faces"]), 1)
+
+        from_url = asyncio.run(aprocess(f"{self.base_url}/img_0.png", image_type="color"))
+        self.assertEqual(from_url["basename"], "img_0")
+        self.assertEqual(from_url["extension"], ".png")
+        self.assertEqual(from_url["faces"], result["faces"])
+
+    def test_aprocess_many_keeps_input_order(self):
+        inputs = [f"{self.base_url}/img_2.png", f"{self.base_url}/missing.png", self.images[0], self.images[1]]
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            results = asyncio.run(aprocess_many(inputs, max_concurrency=3, executor=executor, image_type="color"))
+        self.assertEqual(len(results), len(inputs))
+        self.assertEqual(results[0]["basename"], "img_2")
+        self.assertIn("message", results[1])
+        self.assertEqual(results[2]["basename"], "img_0")
+        self.assertEqual(results[3]["basename"], "img_1")
+
+    def test_aiter_process_consumes_inputs_on_demand(self):
+        consumed = []
+
+        def inputs():
+            for image in self.images * 3:
+                consumed.append(image)
+                yield image
+
+        async def collect():
+            results = []
+            async for image, result in aiter_process(inputs(), max_concurrency=2, image_type="color"):
+                # Never more images in flight than the maximum concurrency
+                self.assertLessEqual(len(consumed) - len(results), 2)
+                results.append((image, result))
+            return results
+
+        results = asyncio.run(collect())
+        self.assertEqual(len(results), len(self.images) * 3)
+        self.assertEqual(sorted(image for image, _ in results), sorted(self.images * 3))
+        for image, result in results:
+            self.assertEqual(result["basename"], Path(image).stem)
+
+    def test_aprocess_many_validates_arguments(self):
+        with self.assertRaises(ArgumentError):
+            asyncio.run(aprocess_many(self.images, tone_palette="unknown"))
@@ -0,0 +1,101 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from stone import Session, process, process_batch, iter_process
+from stone.utils import ArgumentError
+
+
+def create_image(filename, width=320, height=240, seed=0):
+    """
+    Create a synthetic image with a skin-colored ellipse on a plain background.
+    """
+    rng = np.random.default_rng(seed)
+    image = np.full((height, width, 3), (200, 180, 160), dtype=np.uint8)
+    cv2.ellipse(image, (width // 2, height // 2), (width // 5, height // 3), 0, 0, 360, (120, 150, 200), -1)
+    noise = rng.integers(-10, 10, size=image.shape)
+    image = np.clip(image.astype(int) + noise, 0, 255).astype(np.uint8)
+    cv2.imwrite(str(filename), image)
+    return filename
+
+
+class TestApi(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.image_dir = Path(self.tmp_dir.name)
+        self.images = [str(create_image(self.image_dir / f"img_{i}.png", seed=i)) for i in range(3)]
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_session_process(self):
+        session = Session(image_type="color", tone_palette="perla")
+        result = session.process(self.images[0])
+        self.assertEqual(result["basename"], "img_0")
+        self.assertEqual(result["extension"], ".png")
+        self.assertEqual(result["image_type"], "color")
+        self.assertEqual(len(result["faces"]), 1)
+        self.assertIn(result["faces"][0]["skin_tone"], session.palette_for("color").hex)
+
+    def test_process_reuses_session(self):
+        result = process(self.images[0], image_type="color")
+        self.assertEqual(result["basename"], "img_0")
+
+    def test_report_images_are_saved_by_the_session(self):
+        report_dir = self.image_dir / "debug"
+        results = process_batch(
+            self.images[:2], n_workers=2, image_type="color", return_report_image=True, report_image_dir=report_dir
+        )
+        for result in results:
+            for face_id, filename in result["report_images"].items():
+                self.assertEqual(Path(filename).parent.parent.parent, report_dir)
+                self.assertEqual(Path(filename).name, f"{result['basename']}-{face_id}.png")
+                self.assertIsNotNone(cv2.imread(filename))
+
+    def test_invalid_arguments(self):
+        with self.assertRaises(ArgumentError):
+            Session(tone_palette="unknown")
+        with self.assertRaises(ArgumentError):
+            Session(tone_palette="perla", tone_labels=["A", "B"])
+
+    def test_process_batch_keeps_input_order(self):
+        inputs = [self.images[2], str(self.image_dir / "missing.png"), self.images[0], self.images[1]]
+        for n_workers in [1, 2]:
+            results = process_batch(inputs, n_workers=n_workers, image_type="color")
+            self.assertEqual(len(results), len(inputs))
+            self.assertEqual(results[0]["basename"], "img_2")
+            self.assertIn("message", results[1])
+            self.assertEqual(results[2]["basename"], "img_0")
+            self.assertEqual(results[3]["basename"], "img_1")
+
+    def test_process_batch_validates_arguments_once(self):
+        with self.assertRaises(ArgumentError):
+            process_batch(self.images, tone_palette="unknown")
+
+    def test_iter_process_ordered(self):
+        for n_workers in [1, 2]:
+            results = list(iter_process(iter(self.images), n_workers=n_workers, image_type="color"))
+            self.assertEqual([filename for filename, _ in results], self.images)
+            self.assertEqual([result["basename"] for _, result in results], ["img_0", "img_1", "img_2"])
+
+    def test_iter_process_unordered(self):
+        results = list(iter_process(self.images, n_workers=2, ordered=False, image_type="color"))
+        self.assertEqual(sorted(filename for filename, _ in results), sorted(self.images))
+        for filename, result in results:
+            self.assertEqual(result["basename"], Path(filename).stem)
+
+    def test_iter_process_consumes_inputs_lazily(self):
+        consumed = []
+
+        def inputs():
+            for i in range(20):
+                consumed.append(i)
+                yield self.images[i % len(self.images)]
+
+        results = iter_process(inputs(), n_workers=2, max_in_flight=3, image_type="color")
+        for n_yielded, _ in enumerate(results, start=1):
+            self.assertLessEqual(len(consumed), n_yielded + 3)
+        self.assertEqual(n_yielded, 20)
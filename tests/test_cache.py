@@ -0,0 +1,100 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from stone import Session, process
+from stone.cache import ResultCache, content_hash, disk_usage, params_hash
+from tests.test_api import create_image
+
+
+class TestResultCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.directory = Path(self.tmp_dir.name)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_get_and_put(self):
+        cache = ResultCache(self.directory)
+        image_hash, fingerprint = content_hash(b"image"), params_hash({"n_dominant_colors": 2})
+        self.assertIsNone(cache.get(image_hash, fingerprint))
+        cache.put(image_hash, fingerprint, {"faces": [{"face_id": 1}]})
+        self.assertEqual(cache.get(image_hash, fingerprint), {"faces": [{"face_id": 1}]})
+        self.assertIsNone(cache.get(image_hash, params_hash({"n_dominant_colors": 3})))
+
+    def test_prune_evicts_least_recently_used(self):
+        cache = ResultCache(self.directory, max_bytes=10**9)
+        # In the same shard
+        hashes = [f"ab{i:038x}" for i in range(10)]
+        for i, image_hash in enumerate(hashes):
+            cache.put(image_hash, "params", {"data": "x" * 100})
+            # Make the access times distinct
+            path = cache._path(image_hash, "params")
+            os.utime(path, (time.time() - 100 + i, time.time() - 100 + i))
+        cache.get(hashes[0], "params")
+
+        # The disk usage, not the size of the files, is counted, i.e., about 5 entries per shard
+        usage = disk_usage(os.stat(cache._path(hashes[0], "params")))
+        self.assertGreaterEqual(usage, 100)
+        cache.max_bytes = usage * 5 * 256
+        self.assertEqual(cache.prune(), 6)
+        self.assertIsNotNone(cache.get(hashes[0], "params"))
+        self.assertIsNotNone(cache.get(hashes[-1], "params"))
+        self.assertIsNone(cache.get(hashes[1], "params"))
+
+    def test_put_prunes_its_shard_only(self):
+        cache = ResultCache(self.directory, max_bytes=10**9)
+        other = "cd" + "0" * 38
+        cache.put(other, "params", {"data": "x" * 100})
+        cache.max_bytes = 256
+        with mock.patch.object(cache, "_prune_shard", wraps=cache._prune_shard) as prune_shard:
+            cache.put("ab" + "0" * 38, "params", {"data": "x" * 100})
+            prune_shard.assert_called_once_with("ab")
+        self.assertIsNone(cache.get("ab" + "0" * 38, "params"))
+        self.assertIsNotNone(cache.get(other, "params"))
+
+
+class TestSessionCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.directory = Path(self.tmp_dir.name)
+        self.image = str(create_image(self.directory / "img.png"))
+        self.cache_dir = self.directory / "cache"
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_results_are_reused_by_content(self):
+        session = Session(image_type="color", cache_dir=self.cache_dir)
+        first = session.process(self.image)
+        copy = shutil.copy(self.image, self.directory / "copy.png")
+        with mock.patch.object(Session, "classify") as classify:
+            second = Session(image_type="color", cache_dir=self.cache_dir).process(copy)
+            classify.assert_not_called()
+        self.assertEqual(second["basename"], "copy")
+        self.assertEqual(second["faces"], first["faces"])
+        self.assertEqual(second["report_images"], first["report_images"])
+
+        with mock.patch.object(Session, "classify", wraps=session.classify) as classify:
+            process(copy, image_type="color", n_dominant_colors=3, cache_dir=self.cache_dir)
+            classify.assert_called_once()
+
+    def test_report_images_bypass_the_cache(self):
+        Session(image_type="color", cache_dir=self.cache_dir).process(self.image)
+        result = Session(image_type="color", cache_dir=self.cache_dir, return_report_image=True).process(self.image)
+        self.assertTrue(all(image is not None for image in result["report_images"].values()))
+
+    def test_invalid_images_are_reported(self):
+        empty = self.directory / "empty.jpg"
+        empty.touch()
+        corrupt = self.directory / "corrupt.jpg"
+        corrupt.write_bytes(b"\xff\xd8\xff\xe0" + b"not a jpeg" * 10)
+        session = Session(image_type="color", cache_dir=self.cache_dir)
+        for file in (empty, corrupt):
+            result = session.process(str(file))
+            self.assertEqual(result["message"], f"{file.name} is not found or is not a valid image.")
@@ -0,0 +1,49 @@
+import unittest
+
+import numpy as np
+
+from stone.color import color_distances, hex_to_rgb_array, srgb_to_lab
+from stone.image import DEFAULT_TONE_PALETTE, skin_tone, default_tone_labels
+
+try:
+    import colormath  # noqa: F401
+
+    has_colormath = True
+except ImportError:
+    has_colormath = False
+
+
+class TestColor(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(42)
+        # Random colors plus the extremes, as the dominant colors are floats from k-means
+        self.colors = np.vstack([rng.uniform(0, 255, size=(30, 3)), [[0, 0, 0], [255, 255, 255], [128, 128, 128]]])
+
+    def test_hex_to_rgb_array(self):
+        expected = np.array([[55, 48, 40], [255, 255, 255], [170, 187, 204]], dtype=np.uint8)
+        np.testing.assert_array_equal(hex_to_rgb_array(["#373028", "#FFFFFF", "#abc"]), expected)
+
+    def test_srgb_to_lab_white_and_black(self):
+        np.testing.assert_allclose(srgb_to_lab([[255, 255, 255], [0, 0, 0]]), [[100, 0, 0], [0, 0, 0]], atol=1e-2)
+
+    def test_distances_shape(self):
+        palette = DEFAULT_TONE_PALETTE["perla"]
+        distances = color_distances(self.colors, palette)
+        self.assertEqual(distances.shape, (len(self.colors), len(palette)))
+
+    @unittest.skipUnless(has_colormath, "colormath is not installed")
+    def test_numpy_matches_colormath(self):
+        for palette in DEFAULT_TONE_PALETTE.values():
+            expected = color_distances(self.colors, palette, backend="colormath")
+            actual = color_distances(self.colors, palette, backend="numpy")
+            np.testing.assert_allclose(actual, expected, rtol=0, atol=1e-9)
+
+    @unittest.skipUnless(has_colormath, "colormath is not installed")
+    def test_skin_tone_matches_colormath(self):
+        palette = DEFAULT_TONE_PALETTE["perla"]
+        labels = default_tone_labels(palette)
+        colors, percents = self.colors[:2], np.array([0.7, 0.3])
+        expected = skin_tone(colors, percents, palette, labels, backend="colormath")
+        actual = skin_tone(colors, percents, palette, labels)
+        self.assertEqual(actual[:3], expected[:3])
+        self.assertAlmostEqual(actual[3], expected[3], places=9)
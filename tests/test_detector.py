@@ -0,0 +1,92 @@
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import cv2
+import numpy as np
+
+from stone import Session
+from stone.detector import (
+    FACE_DETECTORS,
+    FaceDetector,
+    HaarFaceDetector,
+    YuNetFaceDetector,
+    get_face_detector,
+    register_face_detector,
+)
+from stone.image import detect_faces, load_face_cascade
+from stone.utils import ArgumentError
+
+DEMO_IMAGE = Path(__file__).parents[1] / "docs" / "demo.png"
+
+
+class FixedFaceDetector(FaceDetector):
+    def __init__(self, model=None, scale_factor=None, min_neighbors=None):
+        self.box = (100, 120, 300, 320)
+
+    def detect(self, image, gray, min_size=(30, 30), biggest_only=True):
+        return np.array([self.box], dtype=np.int32)
+
+
+class TestFaceDetector(unittest.TestCase):
+    def setUp(self):
+        self.image = cv2.imread(str(DEMO_IMAGE))
+
+    def tearDown(self):
+        FACE_DETECTORS.pop("fixed", None)
+
+    def test_haar_is_the_default(self):
+        cascade = load_face_cascade()
+        expected = detect_faces(self.image, cascade=cascade)
+        actual = detect_faces(self.image, detector=get_face_detector())
+        self.assertIsInstance(get_face_detector(), HaarFaceDetector)
+        self.assertEqual(len(actual), 1)
+        np.testing.assert_array_equal(actual, expected)
+
+    def test_invalid_detector(self):
+        with self.assertRaises(ArgumentError):
+            get_face_detector("unknown")
+        with self.assertRaises(ArgumentError):
+            Session(face_detector="unknown")
+
+    def test_register_detector(self):
+        register_face_detector("fixed", FixedFaceDetector)
+        result = Session(face_detector="fixed", new_width=-1, threshold=0.0).classify(self.image)
+        self.assertEqual(len(result["faces"]), 1)
+        self.assertEqual(result["faces"][0]["face_id"], 1)
+
+    def test_detect_is_abstract(self):
+        class IncompleteFaceDetector(FaceDetector):
+            pass
+
+        with self.assertRaises(TypeError):
+            IncompleteFaceDetector()
+        register_face_detector("incomplete", IncompleteFaceDetector)
+        try:
+            with self.assertRaises(TypeError):
+                Session(face_detector="incomplete")
+        finally:
+            FACE_DETECTORS.pop("incomplete", None)
+
+    def test_yunet_model_is_required(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with self.assertRaises(ArgumentError):
+                YuNetFaceDetector(Path(directory) / "missing.onnx")
+
+    def test_yunet_boxes(self):
+        detections = np.zeros((3, 15), dtype=np.float32)
+        detections[:, :4] = [[10.4, 20.6, 100.2, 110.1], [-5.0, 300.0, 80.0, 90.0], [400.0, 400.0, 20.0, 20.0]]
+        model = mock.Mock()
+        model.detect.return_value = (1, detections)
+        with tempfile.NamedTemporaryFile(suffix=".onnx") as file, mock.patch.object(
+            cv2.FaceDetectorYN, "create", return_value=model
+        ):
+            detector = YuNetFaceDetector(file.name)
+            faces = detector.detect(self.image, None, min_size=(30, 30), biggest_only=False)
+            np.testing.assert_array_equal(faces, [[10, 20, 111, 131], [0, 300, 75, 390]])
+            model.setInputSize.assert_called_once_with((512, 512))
+            faces = detector.detect(self.image, None, min_size=(30, 30), biggest_only=True)
+            np.testing.assert_array_equal(faces, [[10, 20, 111, 131]])
+            model.setInputSize.assert_called_once()
+
@@ -0,0 +1,129 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from stone import Session, process
+from stone.dominant import (
+    histogram_dominant_colors,
+    kmeans_dominant_colors,
+    color_histogram,
+    weighted_kmeans,
+    seed_centers,
+    warm_start_centers,
+)
+from stone.image import dominant_colors
+from stone.utils import ArgumentError
+
+
+def two_colors(n_first, n_second, seed=0):
+    rng = np.random.default_rng(seed)
+    first = rng.normal((60, 90, 160), 4, (n_first, 3))
+    second = rng.normal((150, 170, 210), 4, (n_second, 3))
+    return np.clip(np.vstack([first, second]), 1, 255).astype(np.uint8)
+
+
+class TestDominantColors(unittest.TestCase):
+    def test_histogram_agrees_with_kmeans(self):
+        pixels = two_colors(7000, 3000)
+        colors, percents = histogram_dominant_colors(pixels, 2)
+        expected_colors, expected_percents = kmeans_dominant_colors(pixels, 2)
+        np.testing.assert_allclose(colors, expected_colors, atol=0.5)
+        np.testing.assert_allclose(percents, expected_percents, atol=1e-3)
+        np.testing.assert_allclose(percents, [0.7, 0.3])
+        self.assertEqual(colors.dtype, np.float32)
+
+    def test_histogram_is_deterministic(self):
+        pixels = two_colors(5000, 5000, seed=1)
+        first = histogram_dominant_colors(pixels, 3)
+        for _ in range(3):
+            colors, percents = histogram_dominant_colors(pixels[::-1].copy(), 3)
+            np.testing.assert_array_equal(colors, first[0])
+            np.testing.assert_array_equal(percents, first[1])
+
+    def test_pixel_budget(self):
+        pixels = two_colors(600_000, 400_000)
+        colors, percents = histogram_dominant_colors(pixels, 2, pixel_budget=10_000)
+        np.testing.assert_allclose(percents, [0.6, 0.4], atol=1e-3)
+        np.testing.assert_allclose(colors[0], (60, 90, 160), atol=1)
+
+    def test_color_histogram(self):
+        pixels = np.array([[0, 0, 0], [7, 7, 7], [8, 0, 0], [255, 255, 255]], dtype=np.uint8)
+        bin_colors, counts = color_histogram(pixels, bits=5)
+        np.testing.assert_array_equal(counts, [2, 1, 1])
+        np.testing.assert_array_equal(bin_colors, [[3.5, 3.5, 3.5], [8, 0, 0], [255, 255, 255]])
+
+    def test_weighted_kmeans_with_few_points(self):
+        centers, labels = weighted_kmeans(np.array([[10.0, 10, 10]]), np.array([5]), 3)
+        np.testing.assert_array_equal(centers, [[10, 10, 10]])
+        np.testing.assert_array_equal(labels, [0])
+
+    def test_dominant_colors_of_a_skin_image(self):
+        image = np.zeros((100, 100, 3), dtype=np.uint8)
+        image[:50] = (60, 90, 160)
+        image[50:80] = (150, 170, 210)
+        colors, percents = dominant_colors(image, False, 2, method="histogram")
+        np.testing.assert_allclose(colors, [(60, 90, 160), (150, 170, 210)])
+        np.testing.assert_allclose(percents, [0.625, 0.375])
+        with self.assertRaises(ValueError):
+            dominant_colors(np.zeros_like(image), False, 2, method="histogram")
+
+    def test_invalid_method(self):
+        with self.assertRaises(ArgumentError):
+            Session(dominant_color_method="median")
+
+
+class TestKMeans(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(2)
+        # Three overlapping colors, so the result depends on the initial centers
+        self.pixels = np.clip(rng.normal((120, 140, 180), 30, (20000, 3)), 1, 255).astype(np.uint8)
+
+    def test_seed_makes_results_reproducible(self):
+        first = kmeans_dominant_colors(self.pixels, 3, seed=7)
+        for _ in range(3):
+            colors, percents = kmeans_dominant_colors(self.pixels, 3, seed=7)
+            np.testing.assert_array_equal(colors, first[0])
+            np.testing.assert_array_equal(percents, first[1])
+
+    def test_attempts_and_iterations(self):
+        colors, percents = kmeans_dominant_colors(two_colors(7000, 3000), 2, attempts=1, max_iter=3)
+        np.testing.assert_allclose(percents, [0.7, 0.3])
+        np.testing.assert_allclose(colors, [(60, 90, 160), (150, 170, 210)], atol=1)
+
+    def test_warm_start(self):
+        pixels = two_colors(7000, 3000)
+        # Far from the colors, the nearest points still separate the clusters
+        init_centers = [(0, 0, 0), (140, 160, 200), (255, 255, 255)]
+        for extract in [kmeans_dominant_colors, histogram_dominant_colors]:
+            colors, percents = extract(pixels, 2, attempts=1, init_centers=init_centers)
+            np.testing.assert_allclose(percents, [0.7, 0.3])
+            np.testing.assert_allclose(colors, [(60, 90, 160), (150, 170, 210)], atol=1)
+
+    def test_warm_start_centers(self):
+        points = two_colors(7000, 3000).astype(np.float64)
+        init_centers = [(150, 170, 210), (250, 0, 0), (60, 90, 160)]
+        np.testing.assert_array_equal(
+            warm_start_centers(points, None, init_centers, 2), [(150, 170, 210), (60, 90, 160)]
+        )
+        centers = warm_start_centers(points, None, init_centers[:1], 2, np.random.default_rng(0))
+        self.assertEqual(centers.shape, (2, 3))
+        np.testing.assert_array_equal(centers[0], (150, 170, 210))
+
+    def test_seed_centers(self):
+        points = np.array([[0.0, 0, 0], [1, 1, 1], [100, 100, 100]])
+        np.testing.assert_array_equal(seed_centers(points, [1, 5, 1], 2), [[1, 1, 1], [100, 100, 100]])
+        self.assertEqual(seed_centers(points, None, 3, np.random.default_rng(0)).shape, (3, 3))
+
+    def test_session_options(self):
+        image = np.zeros((200, 200, 3), dtype=np.uint8)
+        image[:] = np.clip(np.random.default_rng(3).normal((120, 150, 200), 20, (200, 200, 3)), 0, 255)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = str(Path(tmp_dir) / "skin.png")
+            cv2.imwrite(filename, image)
+            first = process(filename, image_type="color", kmeans_attempts=2, seed=1)
+            self.assertEqual(process(filename, image_type="color", kmeans_attempts=2, seed=1)["faces"], first["faces"])
+            result = process(filename, image_type="color", kmeans_attempts=1, warm_start=True)
+            self.assertEqual(len(result["faces"][0]["dominant_colors"]), 2)
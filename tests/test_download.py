@@ -0,0 +1,110 @@
+import threading
+import time
+import unittest
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import cv2
+import numpy as np
+
+from stone import download
+from stone.api import init_worker
+from stone.download import Downloader, DownloadError
+from stone.image import decode_image
+
+IMAGE = cv2.imencode(".png", np.full((20, 30, 3), (10, 20, 30), dtype=np.uint8))[1].tobytes()
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    failures = {}
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.server.connections.add(self.client_address)
+        self.server.requests.append(self.path)
+        if self.path.startswith("/flaky") and self.server.requests.count(self.path) <= 2:
+            return self.reply(503, b"busy")
+        if self.path == "/slow":
+            time.sleep(0.5)
+        if self.path == "/missing":
+            return self.reply(404, b"not found")
+        if self.path == "/chunked":
+            self.send_response(200)
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for start in range(0, len(IMAGE), 100):
+                chunk = IMAGE[start : start + 100]
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+            self.wfile.write(b"0\r\n\r\n")
+            return
+        self.reply(200, IMAGE)
+
+    def reply(self, status, body):
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class TestDownloader(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.connections = set()
+        self.server.requests = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.downloader = Downloader(timeout=0.2, retries=2, backoff_factor=0.01)
+
+    def tearDown(self):
+        self.downloader.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_download_and_decode(self):
+        for path in ["/image.png", "/chunked"]:
+            content = self.downloader.download(self.base_url + path)
+            self.assertEqual(content.tobytes(), IMAGE)
+            self.assertEqual(decode_image(content).shape, (20, 30, 3))
+
+    def test_connections_are_reused(self):
+        for i in range(5):
+            self.downloader.download(f"{self.base_url}/image_{i}.png")
+        self.assertEqual(len(self.server.connections), 1)
+
+    def test_retries(self):
+        content = self.downloader.download(self.base_url + "/flaky.png")
+        self.assertEqual(content.tobytes(), IMAGE)
+        self.assertEqual(self.server.requests.count("/flaky.png"), 3)
+        with self.assertRaises(DownloadError):
+            Downloader(retries=1, backoff_factor=0).download(self.base_url + "/flaky_again.png")
+
+    def test_errors(self):
+        with self.assertRaises(FileNotFoundError):
+            self.downloader.download(self.base_url + "/missing")
+        with self.assertRaises(DownloadError):
+            self.downloader.download(self.base_url + "/slow")
+        with self.assertRaises(DownloadError):
+            Downloader(max_bytes=10).download(self.base_url + "/image.png")
+        with self.assertRaises(DownloadError):
+            Downloader(max_bytes=10).download(self.base_url + "/chunked")
+
+
+class TestConfigure(unittest.TestCase):
+    def tearDown(self):
+        download.configure()
+
+    def test_options_are_passed_to_workers(self):
+        download.configure(timeout=10, retries=5)
+        options = download.get_options()
+        self.assertEqual(options, {"timeout": 10, "retries": 5})
+        self.assertEqual(download.get_downloader().retries, 5)
+
+        # A worker started without the parent's memory, e.g., spawned, is configured by its initializer
+        download.configure()
+        self.assertEqual(download.get_downloader().retries, download.DEFAULT_RETRIES)
+        init_worker({"image_type": "color"}, options)
+        self.assertEqual(download.get_options(), options)
+        self.assertEqual(download.get_downloader().retries, 5)
+
@@ -0,0 +1,219 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from stone.image import (
+    jpeg_size,
+    reduced_decode_flags,
+    load_image,
+    decode_image,
+    is_black_white,
+    classify,
+    mask_face,
+    otsu_threshold,
+    ImageContext,
+    process_image,
+    scale_boxes,
+    detect_skin_in_color,
+    detect_skin_in_bw,
+    is_face,
+)
+from stone.palette import get_palette
+from stone.utils import ArgumentError
+
+
+class TestReducedDecode(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.directory = Path(self.tmp_dir.name)
+        rng = np.random.default_rng(0)
+        self.image = cv2.resize(rng.integers(0, 255, (30, 40, 3), dtype=np.uint8), (2000, 1500))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def encode(self, extension, *params):
+        return cv2.imencode(extension, self.image, params)[1]
+
+    def test_jpeg_size(self):
+        self.assertEqual(jpeg_size(self.encode(".jpg")), (2000, 1500))
+        self.assertEqual(jpeg_size(self.encode(".jpg", cv2.IMWRITE_JPEG_PROGRESSIVE, 1)), (2000, 1500))
+        self.assertIsNone(jpeg_size(self.encode(".png")))
+        self.assertIsNone(jpeg_size(self.encode(".jpg")[:100]))
+
+    def test_reduced_decode_flags(self):
+        header = self.encode(".jpg")
+        self.assertEqual(reduced_decode_flags(header, 150), cv2.IMREAD_REDUCED_COLOR_8)
+        self.assertEqual(reduced_decode_flags(header, 250), cv2.IMREAD_REDUCED_COLOR_4)
+        self.assertEqual(reduced_decode_flags(header, 700), cv2.IMREAD_REDUCED_COLOR_2)
+        self.assertEqual(reduced_decode_flags(header, 1000), cv2.IMREAD_COLOR)
+        self.assertEqual(reduced_decode_flags(header, -1), cv2.IMREAD_COLOR)
+        self.assertEqual(reduced_decode_flags(self.encode(".png"), 250), cv2.IMREAD_COLOR)
+
+    def test_load_image_at_reduced_resolution(self):
+        filename = self.directory / "large.jpg"
+        self.encode(".jpg").tofile(filename)
+        image, *_ = load_image(str(filename), target_width=250)
+        self.assertEqual(image.shape, (375, 500, 3))
+        image, *_ = load_image(str(filename))
+        self.assertEqual(image.shape, (1500, 2000, 3))
+        self.assertEqual(decode_image(self.encode(".jpg"), target_width=250).shape, (375, 500, 3))
+
+
+class TestIsBlackWhite(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        gray = rng.integers(0, 255, (600, 800), dtype=np.uint8)
+        self.gray = cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
+        self.color = rng.integers(0, 255, (600, 800, 3), dtype=np.uint8)
+
+    def test_gray_images(self):
+        self.assertTrue(is_black_white(self.gray))
+        self.assertTrue(is_black_white(self.gray[..., 0]))
+        # JPEG artifacts leave small differences between the channels
+        noise = np.random.default_rng(1).integers(0, 8, self.gray.shape, dtype=np.uint8)
+        self.assertTrue(is_black_white(self.gray + noise))
+
+    def test_color_images(self):
+        self.assertFalse(is_black_white(self.color))
+        self.assertFalse(is_black_white(np.full((50, 50, 3), (40, 120, 200), dtype=np.uint8)))
+        # A color subject on a large gray background
+        image = self.gray.copy()
+        image[:, :200] = self.color[:, :200]
+        self.assertFalse(is_black_white(image))
+        self.assertTrue(is_black_white(image, threshold=0.7))
+        # A number of pixels, as it used to be, is rejected
+        with self.assertRaises(ArgumentError):
+            is_black_white(image, threshold=192)
+
+    def test_large_image_is_subsampled(self):
+        image = cv2.resize(self.color, (6000, 4000), interpolation=cv2.INTER_NEAREST)
+        self.assertFalse(is_black_white(image))
+        image[:] = 128
+        self.assertTrue(is_black_white(image))
+
+
+class TestFaceRoi(unittest.TestCase):
+    def setUp(self):
+        self.image = cv2.imread(str(Path(__file__).parents[1] / "docs" / "demo.png"))
+        self.palette = get_palette("perla")
+        self.bw_palette = get_palette("bw")
+
+    def test_otsu_threshold(self):
+        rng = np.random.default_rng(0)
+        for _ in range(50):
+            gray = rng.normal(rng.uniform(30, 220), rng.uniform(5, 60), (60, 80)).clip(0, 255).astype(np.uint8)
+            gray[: rng.integers(0, 60)] = 0
+            expected, _ = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+            self.assertEqual(otsu_threshold(np.bincount(gray.ravel(), minlength=256)), expected)
+
+    def test_same_as_masked_image(self):
+        h, w = self.image.shape[:2]
+        boxes = [(w // 4, h // 5, w // 2, h // 2), (0, 0, w // 3, h // 3), (w // 2, h // 2, w, h), (0, 0, w, h)]
+        for box in boxes:
+            for is_bw, palette in [(False, self.palette), (True, self.bw_palette)]:
+                with self.subTest(box=box, is_bw=is_bw):
+                    expected = classify(
+                        mask_face(self.image, box),
+                        is_bw,
+                        is_bw,
+                        palette,
+                        palette.labels,
+                        verbose=True,
+                        report_image=self.image,
+                    )
+                    actual = classify(self.image, is_bw, is_bw, palette, palette.labels, verbose=True, face_coord=box)
+                    self.assertEqual(actual[0], expected[0])
+                    np.testing.assert_array_equal(actual[1], expected[1])
+
+
+class TestImageContext(unittest.TestCase):
+    def setUp(self):
+        self.image = cv2.imread(str(Path(__file__).parents[1] / "docs" / "demo.png"))
+        h, w = self.image.shape[:2]
+        self.box = (w // 4, h // 5, w // 2, h // 2)
+
+    def test_planes_are_computed_once(self):
+        context = ImageContext(self.image, False)
+        self.assertIs(context.gray, context.gray)
+        self.assertIs(context.skin_mask, context.skin_mask)
+        np.testing.assert_array_equal(context.gray, cv2.cvtColor(self.image, cv2.COLOR_BGR2GRAY))
+
+    def test_same_skin_as_detectors(self):
+        x1, y1, x2, y2 = self.box
+        crop = self.image[y1:y2, x1:x2]
+        for is_bw, detect_skin in [(False, detect_skin_in_color), (True, detect_skin_in_bw)]:
+            with self.subTest(is_bw=is_bw):
+                context = ImageContext(self.image, is_bw)
+                for actual, expected in [
+                    (context.detect_skin(), detect_skin(self.image)),
+                    (context.detect_skin(self.box, masked=False), detect_skin(crop)),
+                ]:
+                    np.testing.assert_array_equal(actual[0], expected[0])
+                    np.testing.assert_array_equal(actual[1], expected[1])
+
+    def test_skin_ratios(self):
+        context = ImageContext(self.image, False)
+        h, w = self.image.shape[:2]
+        boxes = [self.box, (0, 0, w, h), (10, 20, 10, 40)]
+        expected = [
+            cv2.countNonZero(context.skin_mask[y1:y2, x1:x2]) / max((x2 - x1) * (y2 - y1), 1)
+            for x1, y1, x2, y2 in boxes
+        ]
+        np.testing.assert_allclose(context.skin_ratios(boxes), expected)
+        self.assertEqual(context.skin_ratios(np.empty((0, 4), dtype=np.int32)).shape, (0,))
+
+    def test_skin_ratios_in_bw(self):
+        # A gray face on a bright background, which is dark, i.e., not skin, for the threshold of the entire image
+        rng = np.random.default_rng(0)
+        image = np.full((300, 300, 3), 230, dtype=np.uint8)
+        image[100:200, 100:200] = rng.normal(120, 10, (100, 100, 1)).clip(0, 255).astype(np.uint8)
+        context = ImageContext(image, True)
+        h, w = image.shape[:2]
+        boxes = [(100, 100, 200, 200), (90, 90, 210, 210), (0, 0, w, h)]
+        expected = []
+        for x1, y1, x2, y2 in boxes:
+            _, skin_mask = detect_skin_in_bw(image[y1:y2, x1:x2])
+            expected.append(cv2.countNonZero(skin_mask) / skin_mask.size)
+        np.testing.assert_allclose(context.skin_ratios(boxes), expected)
+        self.assertGreater(context.skin_ratios(boxes[:1])[0], 0.3)
+        self.assertTrue(is_face(boxes[0], image, True, context=context))
+        self.assertEqual(context.skin_ratios([(10, 20, 10, 40)]).tolist(), [0.0])
+
+
+class TestTwoResolutions(unittest.TestCase):
+    def setUp(self):
+        image = cv2.imread(str(Path(__file__).parents[1] / "docs" / "demo.png"))
+        self.image = cv2.resize(image, (1024, 1024))
+        self.palette = get_palette("perla")
+
+    def process(self, **kwargs):
+        return process_image(
+            self.image, False, False, self.palette, self.palette.labels, minSize=(180, 180), verbose=True, **kwargs
+        )
+
+    def test_scale_boxes(self):
+        boxes = scale_boxes([(10, 21, 30, 41)], (100, 200), (50, 100))
+        np.testing.assert_array_equal(boxes, [(5, 10, 15, 21)])
+        np.testing.assert_array_equal(scale_boxes([(0, 0, 200, 100)], (100, 200), (33, 66)), [(0, 0, 66, 33)])
+        self.assertEqual(scale_boxes([], (100, 200), (50, 100)), [])
+
+    def test_detect_on_small_image(self):
+        records, report_images = self.process()
+        small_records, small_report_images = self.process(detect_width=256)
+        self.assertEqual(len(small_records), 1)
+        self.assertEqual(small_records[0]["face_id"], 1)
+        # The boxes differ slightly, so the tones may be neighbors
+        tone_ids = [list(self.palette.labels).index(record["tone_label"]) for record in (records[0], small_records[0])]
+        self.assertLessEqual(abs(tone_ids[0] - tone_ids[1]), 1)
+        self.assertEqual(small_report_images[1].shape, report_images[1].shape)
+
+    def test_max_face_pixels(self):
+        _, report_images = self.process()
+        records, budget_report_images = self.process(detect_width=256, max_face_pixels=100 * 100)
+        self.assertEqual(records[0]["face_id"], 1)
+        # The report is drawn on the classification image, which is downscaled
+        self.assertLess(budget_report_images[1].shape[0], report_images[1].shape[0] / 2)
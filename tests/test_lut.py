@@ -0,0 +1,57 @@
+import tempfile
+import unittest
+
+import numpy as np
+
+from stone.color import bgr_to_lab, delta_e_cie2000
+from stone.image import skin_tone
+from stone.lut import ToneLUT
+from stone.palette import get_palette
+
+
+class TestToneLUT(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.palette = get_palette("perla")
+        cls.lut = ToneLUT.build(cls.palette)
+
+    def setUp(self):
+        self.colors = np.random.default_rng(0).uniform(0, 255, size=(200, 3))
+
+    def test_lookup_matches_exact_tones(self):
+        rng = np.random.default_rng(0)
+        # Both 8-bit colors and fractional ones, like the dominant colors
+        colors = np.concatenate([rng.integers(0, 256, size=(100000, 3)), rng.uniform(0, 255, size=(100000, 3))])
+        tone_ids = self.lut.lookup(colors)
+        hits = tone_ids != ToneLUT.AMBIGUOUS
+        self.assertGreater(hits.mean(), 0.75)
+        # The exact nearest tones, as computed by `skin_tone` for a single color
+        expected = np.argmin(delta_e_cie2000(bgr_to_lab(colors[hits]), self.palette.lab), axis=1)
+        np.testing.assert_array_equal(tone_ids[hits], expected)
+        for color in colors[hits][:20]:
+            self.assertEqual(skin_tone(color[np.newaxis], [1.0], self.palette)[0], self.lut.lookup(color)[0])
+
+    def test_hue_jumps_are_ambiguous(self):
+        # The tone regions of these colors, around the opposite of the hues of two tones, are thinner than one level
+        palette = get_palette("proder")
+        lut = ToneLUT.build(palette)
+        colors = np.array([[170.81, 154.83, 126.39], [176.2, 143.95, 73.74], [168.75, 157.9, 139.4]])
+        expected = np.argmin(delta_e_cie2000(bgr_to_lab(colors), palette.lab), axis=1)
+        tone_ids = lut.lookup(colors)
+        self.assertTrue(np.all((tone_ids == expected) | (tone_ids == ToneLUT.AMBIGUOUS)))
+
+    def test_skin_tone_with_lut(self):
+        for color in self.colors[:50]:
+            colors = np.array([color, color * 0.9])
+            expected = skin_tone(colors, [0.6, 0.4], self.palette)
+            actual = skin_tone(colors, [0.6, 0.4], self.palette, lut=self.lut)
+            self.assertEqual(actual[:3], expected[:3])
+            self.assertAlmostEqual(actual[3], expected[3])
+
+    def test_load_or_build_persists_the_table(self):
+        with tempfile.TemporaryDirectory() as directory:
+            built = ToneLUT.load_or_build(self.palette, bits=3, directory=directory)
+            loaded = ToneLUT.load_or_build(self.palette, bits=3, directory=directory)
+            self.assertIsInstance(loaded.table, np.memmap)
+            np.testing.assert_array_equal(loaded.table, built.table)
+            del built, loaded
@@ -0,0 +1,61 @@
+import csv
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+from stone.utils import iter_image_paths
+from stone.writer import csv_header
+from tests.test_api import create_image
+
+
+def run_cli(*args):
+    env = {**os.environ, "STONE_UPGRADE_FLAG": "1"}
+    return subprocess.run([sys.executable, "-m", "stone", *args], env=env, capture_output=True, text=True, timeout=300)
+
+
+class TestCommandLine(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.directory = Path(self.tmp_dir.name)
+        self.images = self.directory / "images"
+        self.images.mkdir()
+        for i in range(2):
+            create_image(self.images / f"img_{i}.png", seed=i)
+        self.output = self.directory / "output"
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_overlapping_inputs_are_processed_once(self):
+        image = self.images / "img_0.png"
+        inputs = [str(self.images), str(image), str(image)]
+        self.assertEqual(sorted(iter_image_paths(inputs)), sorted(p.resolve() for p in self.images.iterdir()))
+
+        process = run_cli("-i", *inputs, "-o", str(self.output), "--n_workers", "1", "--no_cache")
+        self.assertEqual(process.returncode, 0, process.stderr)
+        with open(self.output / "result.csv", newline="", encoding="UTF8") as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual(sorted(row["file"] for row in rows), ["img_0.png", "img_1.png"])
+        self.assertIn("2/2", process.stderr)
+
+    def test_resume_without_path_column(self):
+        self.output.mkdir()
+        header = csv_header(2, with_path=False)
+        legacy_row = ["img_0.png", "color", "1", "#C99676", "0.67", "#805341", "0.33", "#9D7A54", "CF", "86.27"]
+        with open(self.output / "result.csv", "w", newline="", encoding="UTF8") as f:
+            csv.writer(f, lineterminator="\n").writerows([header, legacy_row])
+
+        process = run_cli("-i", str(self.images), "-o", str(self.output), "--n_workers", "1", "--no_cache", "--resume")
+        self.assertEqual(process.returncode, 0, process.stderr)
+        with open(self.output / "result.csv", newline="", encoding="UTF8") as f:
+            rows = list(csv.reader(f))
+        self.assertEqual(rows[:2], [header, legacy_row])
+        self.assertEqual([row[0] for row in rows[2:]], ["img_1.png"])
+        self.assertTrue(all(len(row) == len(header) for row in rows))
+
+
+if __name__ == "__main__":
+    unittest.main()
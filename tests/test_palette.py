@@ -0,0 +1,45 @@
+import unittest
+
+import numpy as np
+
+from stone.palette import BUILTIN_PALETTES, DEFAULT_TONE_PALETTE, get_palette
+from stone.utils import ArgumentError
+
+
+class TestPalette(unittest.TestCase):
+    def test_builtin_palettes_are_precompiled(self):
+        palette = get_palette("perla")
+        self.assertIs(palette, BUILTIN_PALETTES["perla"])
+        self.assertEqual(list(palette), [c.upper() for c in DEFAULT_TONE_PALETTE["perla"]])
+        self.assertEqual(palette.bgr.shape, (len(palette), 3))
+        self.assertEqual(palette.lab.shape, (len(palette), 3))
+        np.testing.assert_array_equal(palette.bgr[0], [0x28, 0x30, 0x37])
+
+    def test_aliases(self):
+        self.assertIs(get_palette("MST"), BUILTIN_PALETTES["monk"])
+
+    def test_custom_palettes_are_cached(self):
+        first = get_palette(["#373028", "255,255,255"])
+        second = get_palette(["#373028", "#ffffff"])
+        self.assertIs(first.lab, second.lab)
+        self.assertEqual(first.hex, ("#373028", "#FFFFFF"))
+
+    def test_labels(self):
+        palette = get_palette("bw", prefix="B")
+        self.assertEqual(palette.labels[:2], ("BA", "BB"))
+        self.assertIs(palette.bgr, BUILTIN_PALETTES["bw"].bgr)
+        with self.assertRaises(ArgumentError):
+            get_palette("perla", labels=["A", "B"])
+
+    def test_immutable(self):
+        palette = get_palette("perla")
+        with self.assertRaises(Exception):
+            palette.labels = ("A",)
+        with self.assertRaises(ValueError):
+            palette.bgr[0] = 0
+
+    def test_invalid_palette(self):
+        with self.assertRaises(ArgumentError):
+            get_palette("unknown")
+        with self.assertRaises(ArgumentError):
+            get_palette(["#12345"])
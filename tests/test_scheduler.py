@@ -0,0 +1,49 @@
+import collections
+import unittest
+
+from stone.scheduler import ChunkScheduler
+
+
+def simulate(scheduler: ChunkScheduler, sizes, overhead=0.01, rate=1e-7):
+    """
+    Cut all images into chunks, observing the time of each chunk from a linear cost model.
+    """
+    pending = collections.deque((f"img_{i}.jpg", size) for i, size in enumerate(sizes))
+    chunks = []
+    while pending:
+        chunk = scheduler.cut(pending, exhausted=True)
+        scheduler.observe([size for _, size in chunk], sum(overhead + rate * size for _, size in chunk))
+        chunks.append(chunk)
+    return chunks
+
+
+class TestChunkScheduler(unittest.TestCase):
+    def test_fits_the_cost_model(self):
+        scheduler = ChunkScheduler(n_workers=4)
+        simulate(scheduler, [10_000 * (i % 7 + 1) for i in range(196)])
+        self.assertAlmostEqual(scheduler.overhead, 0.01, places=6)
+        self.assertAlmostEqual(scheduler.rate, 1e-7, places=12)
+        self.assertAlmostEqual(scheduler.estimate(None), 0.01 + 1e-7 * 40_000, places=6)
+
+    def test_chunk_sizes_follow_the_cost(self):
+        scheduler = ChunkScheduler(n_workers=2, target_seconds=0.1, max_chunk_size=64)
+        self.assertEqual(len(scheduler.cut(collections.deque([("a.jpg", 100), ("b.jpg", 100)]), False)), 1)
+        simulate(scheduler, [1000] * 10 + [10_000_000] * 2)
+
+        small = collections.deque(("small.jpg", 1000) for _ in range(100))
+        self.assertEqual(len(scheduler.cut(small, exhausted=False)), 9)
+        large = collections.deque(("large.tif", 10_000_000) for _ in range(5))
+        self.assertEqual(len(scheduler.cut(large, exhausted=False)), 1)
+
+    def test_tail_is_spread_over_the_workers(self):
+        scheduler = ChunkScheduler(n_workers=4, target_seconds=1.0)
+        simulate(scheduler, [1000] * 20, overhead=0.01, rate=0)
+        pending = collections.deque(("img.jpg", 1000) for _ in range(40))
+        self.assertEqual(len(scheduler.cut(pending, exhausted=False)), 32)
+        pending = collections.deque(("img.jpg", 1000) for _ in range(40))
+        self.assertEqual(len(scheduler.cut(pending, exhausted=True)), 10)
+
+    def test_file_size(self):
+        self.assertIsNone(ChunkScheduler.file_size("https://example.com/a.jpg"))
+        self.assertIsNone(ChunkScheduler.file_size("/not/a/file.jpg"))
+        self.assertGreater(ChunkScheduler.file_size(__file__), 0)
@@ -0,0 +1,82 @@
+import threading
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from stone import Session, api
+from stone.api import get_session
+from stone.utils import ArgumentError, freeze
+
+
+class TestSession(unittest.TestCase):
+    def setUp(self):
+        self.color = np.full((50, 50, 3), (40, 120, 200), dtype=np.uint8)
+        self.gray = np.full((50, 50, 3), 128, dtype=np.uint8)
+
+    def test_invalid_palette(self):
+        with self.assertRaises(ArgumentError):
+            Session(tone_palette="unknown")
+        with self.assertRaises(ArgumentError):
+            Session(tone_palette=["#12345"])
+        with self.assertRaises(ArgumentError):
+            Session(tone_palette="perla", tone_labels=["A", "B"])
+
+    def test_invalid_face_detector(self):
+        with self.assertRaises(ArgumentError):
+            Session(face_detector="unknown")
+
+    def test_params_are_frozen(self):
+        self.assertEqual(freeze([[1, 2], (3, [4])]), ((1, 2), (3, (4,))))
+        self.assertEqual(freeze("perla"), "perla")
+        session = Session(min_size=[90, 90], tone_palette=["#373028", "#422811"])
+        self.assertEqual(session.min_size, (90, 90))
+        # Lists and tuples are the same parameters
+        same = Session(min_size=(90, 90), tone_palette=("#373028", "#422811"))
+        self.assertEqual(session.fingerprint, same.fingerprint)
+        self.assertNotEqual(session.fingerprint, Session(min_size=(90, 90)).fingerprint)
+
+    def test_image_type_of(self):
+        self.assertEqual(Session(image_type="auto").image_type_of(self.color), (False, "color"))
+        self.assertEqual(Session(image_type="auto").image_type_of(self.gray), (True, "bw"))
+        self.assertEqual(Session(image_type="auto", convert_to_black_white=True).image_type_of(self.color)[1], "bw")
+
+    def test_image_type_is_only_detected_in_auto(self):
+        with mock.patch("stone.session.is_black_white") as is_black_white:
+            self.assertEqual(Session(image_type="color").image_type_of(self.gray), (False, "color"))
+            self.assertEqual(Session(image_type="bw").image_type_of(self.color), (True, "bw"))
+            is_black_white.assert_not_called()
+
+
+class TestGetSession(unittest.TestCase):
+    def setUp(self):
+        api._local.__dict__.pop("session", None)
+
+    def test_session_is_reused(self):
+        params = {"image_type": "color", "tone_palette": ["#373028", "#422811"], "min_size": [90, 90]}
+        session = get_session(**params)
+        self.assertIs(get_session(image_type="color", tone_palette=("#373028", "#422811"), min_size=(90, 90)), session)
+        other = get_session(image_type="color", n_dominant_colors=3)
+        self.assertIsNot(other, session)
+        self.assertEqual(other.n_dominant_colors, 3)
+        # Only the last session is kept
+        self.assertIsNot(get_session(**params), session)
+
+    def test_session_per_thread(self):
+        session = get_session(image_type="color")
+        sessions = []
+        thread = threading.Thread(target=lambda: sessions.append(get_session(image_type="color")))
+        thread.start()
+        thread.join()
+        self.assertIsNot(sessions[0], session)
+        self.assertIs(get_session(image_type="color"), session)
+
+    def test_invalid_params_are_not_reused(self):
+        session = get_session(image_type="color")
+        with self.assertRaises(ArgumentError):
+            get_session(image_type="color", face_detector="unknown")
+        self.assertIs(get_session(image_type="color"), session)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+import io
+import json
+import time
+import unittest
+
+import numpy as np
+
+from stone import Session
+from stone.stream import FrameReader, classify_stream
+from stone.utils import ArgumentError
+
+
+def raw_frames(n_frames, width=8, height=6):
+    frames = [np.full((height, width, 3), (i, 2 * i, 3 * i), dtype=np.uint8) for i in range(n_frames)]
+    return frames, b"".join(frame.tobytes() for frame in frames)
+
+
+class TestFrameReader(unittest.TestCase):
+    def test_all_frames_are_read(self):
+        frames, data = raw_frames(10)
+        reader = FrameReader(io.BytesIO(data + b"\x00" * 7), 8, 6, drop_stale=False)
+        read = [(index, frame.copy()) for index, frame in reader]
+        self.assertEqual([index for index, _ in read], list(range(10)))
+        for (_, frame), expected in zip(read, frames):
+            np.testing.assert_array_equal(frame, expected)
+        self.assertEqual(reader.n_dropped, 0)
+
+    def test_stale_frames_are_dropped(self):
+        frames, data = raw_frames(50)
+        reader = FrameReader(io.BytesIO(data), 8, 6)
+        read = []
+        for index, frame in reader:
+            # Classifying is slower than reading
+            time.sleep(0.01)
+            np.testing.assert_array_equal(frame, frames[index])
+            read.append(index)
+        self.assertLess(len(read), 50)
+        self.assertEqual(read[-1], 49)
+        self.assertEqual(read, sorted(read))
+        self.assertEqual(reader.n_dropped, 50 - len(read))
+
+    def test_invalid_frame_size(self):
+        with self.assertRaises(ArgumentError):
+            FrameReader(io.BytesIO(b""), 0, 6)
+
+
+class TestClassifyStream(unittest.TestCase):
+    def test_one_json_line_per_frame(self):
+        rng = np.random.default_rng(0)
+        frames = rng.normal((120, 150, 200), 20, (3, 60, 80, 3)).clip(0, 255).astype(np.uint8)
+        output = io.StringIO()
+        session = Session(image_type="color", new_width=-1)
+        n_frames = classify_stream(session, io.BytesIO(frames.tobytes()), 80, 60, output, drop_stale=False)
+        self.assertEqual(n_frames, 3)
+        records = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual([record["frame"] for record in records], [0, 1, 2])
+        self.assertTrue(all(record["image_type"] == "color" and record["faces"] for record in records))
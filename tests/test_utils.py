@@ -1,8 +1,9 @@
+import tempfile
 import unittest
 from pathlib import Path
 
 from stone.image import default_tone_labels
-from stone.utils import build_image_paths, resolve_labels, alphabet_id
+from stone.utils import build_image_paths, resolve_labels, alphabet_id, ResultRecords
 
 
 class TestUtils(unittest.TestCase):
@@ -142,5 +143,71 @@ class TestUtils(unittest.TestCase):
         )
 
 
+class TestResultRecords(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.filename = Path(self.tmp_dir.name) / "result.csv"
+        self.filename.write_text(
+            "file,image type,face id,skin tone,path\n"
+            "a.jpg,color,1,#FFFFFF,/dir1/a.jpg\n"
+            "a.jpg,color,2,#000000,/dir1/a.jpg\n"
+            "e.jpg,color,1,#FFFFFF,https://example.com/e.jpg?size=1\n"
+            "/images/b.png,Error processing image /images/b.png: broken,/images/b.png\n"
+            "c,c.gif is not found or is not a valid image.,/images/c.gif\n"
+            "d.jpg,bw,NA,#FF",
+            encoding="UTF8",
+        )
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_read(self):
+        records = ResultRecords.read(self.filename)
+        self.assertEqual(records.header, ["file", "image type", "face id", "skin tone", "path"])
+        self.assertTrue(records.truncated)
+        self.assertEqual(records.processed, {"/dir1/a.jpg", "https://example.com/e.jpg?size=1"})
+        self.assertEqual(records.failed, {"/images/b.png", "/images/c.gif"})
+
+    def test_contains(self):
+        records = ResultRecords.read(self.filename)
+        self.assertTrue(records.contains("/dir1/a.jpg"))
+        self.assertTrue(records.contains(Path("/dir1/a.jpg")))
+        # The same filename in another folder is a different image
+        self.assertFalse(records.contains("/dir2/a.jpg"))
+        self.assertTrue(records.contains("https://example.com/e.jpg?size=1"))
+        self.assertFalse(records.contains("https://example.com/e.jpg?size=2"))
+        self.assertTrue(records.contains("/images/b.png"))
+        self.assertTrue(records.contains("/images/c.gif"))
+        self.assertFalse(records.contains("/other/c.gif"))
+        self.assertFalse(records.contains("/images/b.png", include_failed=False))
+        self.assertFalse(records.contains("/images/d.jpg"))
+
+    def test_contains_without_paths(self):
+        # Written by an older version, without the path column
+        self.filename.write_text(
+            "file,image type,face id,skin tone\n"
+            "a.jpg,color,1,#FFFFFF\n"
+            "/images/b.png,Error processing image /images/b.png: broken\n"
+            "c,c.gif is not found or is not a valid image.\n",
+            encoding="UTF8",
+        )
+        records = ResultRecords.read(self.filename)
+        self.assertEqual(records.processed, {"a.jpg"})
+        self.assertTrue(records.contains("/other/a.jpg"))
+        self.assertTrue(records.contains("/images/b.png"))
+        self.assertTrue(records.contains("/images/c.gif"))
+        self.assertFalse(records.contains("/images/d.jpg"))
+
+    def test_write_without_errors(self):
+        ResultRecords.read(self.filename).write(self.filename, include_failed=False)
+        self.assertEqual(
+            self.filename.read_text(encoding="UTF8"),
+            "file,image type,face id,skin tone,path\n"
+            "a.jpg,color,1,#FFFFFF,/dir1/a.jpg\n"
+            "a.jpg,color,2,#000000,/dir1/a.jpg\n"
+            "e.jpg,color,1,#FFFFFF,https://example.com/e.jpg?size=1\n",
+        )
+
+
 if __name__ == "__main__":
     unittest.main()
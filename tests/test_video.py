@@ -0,0 +1,123 @@
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import cv2
+import numpy as np
+
+from stone import Session, process
+from stone.utils import ArgumentError, iter_image_paths
+from stone.video import FaceTracker, iou, is_video, read_frames
+
+
+def write_video(filename, frames, fps=25):
+    h, w = frames[0].shape[:2]
+    writer = cv2.VideoWriter(str(filename), cv2.VideoWriter_fourcc(*"MJPG"), fps, (w, h))
+    for frame in frames:
+        writer.write(frame)
+    writer.release()
+    return filename
+
+
+def moving_patch_frames(n_frames, step=3):
+    rng = np.random.default_rng(0)
+    patch = cv2.resize(rng.integers(0, 255, (8, 8, 3), dtype=np.uint8), (60, 60), interpolation=cv2.INTER_NEAREST)
+    frames = []
+    for i in range(n_frames):
+        frame = np.full((240, 320, 3), 30, dtype=np.uint8)
+        frame[90 : 90 + 60, 20 + i * step : 80 + i * step] = patch
+        frames.append(frame)
+    return frames
+
+
+def two_patch_frames(n_frames, step=3):
+    """
+    Two different patches moving in opposite directions, e.g., two people in an interview.
+    """
+    rng = np.random.default_rng(1)
+    patches = [
+        cv2.resize(rng.integers(0, 255, (8, 8, 3), dtype=np.uint8), (60, 60), interpolation=cv2.INTER_NEAREST)
+        for _ in range(2)
+    ]
+    frames = []
+    for i in range(n_frames):
+        frame = np.full((240, 320, 3), 30, dtype=np.uint8)
+        frame[30:90, 20 + i * step : 80 + i * step] = patches[0]
+        frame[150:210, 240 - i * step : 300 - i * step] = patches[1]
+        frames.append(frame)
+    return frames
+
+
+class TestVideo(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.directory = Path(self.tmp_dir.name)
+        self.video = write_video(self.directory / "clip.avi", moving_patch_frames(20))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_read_frames(self):
+        self.assertTrue(is_video(self.video))
+        self.assertFalse(is_video(self.directory / "missing.avi"))
+        indices = [index for index, _ in read_frames(self.video, frame_stride=3)]
+        self.assertEqual(indices, [0, 3, 6, 9, 12, 15, 18])
+        with self.assertRaises(IOError):
+            list(read_frames(self.directory / "missing.avi"))
+
+    def test_tracker_follows_the_face(self):
+        frames = [cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) for frame in moving_patch_frames(10)]
+        tracker = FaceTracker(frames[0], (20, 90, 80, 150))
+        for i, frame in enumerate(frames[1:], 1):
+            self.assertTrue(tracker.update(frame))
+            self.assertEqual(tracker.box, (20 + i * 3, 90, 80 + i * 3, 150))
+        self.assertFalse(tracker.update(np.full_like(frames[0], 30)))
+
+    def test_iou(self):
+        self.assertEqual(iou((0, 0, 10, 10), (0, 0, 10, 10)), 1)
+        self.assertAlmostEqual(iou((0, 0, 10, 10), (5, 0, 15, 10)), 1 / 3)
+        self.assertEqual(iou((0, 0, 10, 10), (20, 20, 30, 30)), 0)
+
+    def test_invalid_intervals(self):
+        for params in [dict(frame_stride=0), dict(detect_interval=0), dict(detect_interval=-1)]:
+            with self.subTest(**params), self.assertRaises(ArgumentError):
+                Session(**params)
+
+    def test_each_face_has_its_own_track(self):
+        video = write_video(self.directory / "two.avi", two_patch_frames(20))
+        session = Session(image_type="color", new_width=-1, detect_interval=5)
+        with mock.patch("stone.video.detect_faces") as detect_faces:
+            detect_faces.side_effect = [
+                [np.array([20 + i * 3, 30, 80 + i * 3, 90]), np.array([240 - i * 3, 150, 300 - i * 3, 210])]
+                for i in (0, 5, 10, 15)
+            ]
+            result = session.process(str(video))
+        # All faces are requested from the detector, not only the biggest one
+        self.assertFalse(detect_faces.call_args.args[4])
+        self.assertEqual([face["face_id"] for face in result["faces"]], [1, 2])
+        self.assertEqual([face["n_frames"] for face in result["faces"]], [20, 20])
+
+    def test_faces_are_detected_every_interval_and_tracked(self):
+        session = Session(image_type="color", new_width=-1, detect_interval=5, return_report_image=True)
+        with mock.patch("stone.video.detect_faces") as detect_faces:
+            detect_faces.side_effect = [[np.array([20 + i * 3, 90, 80 + i * 3, 150])] for i in (0, 5, 10, 15)]
+            result = session.process(str(self.video))
+        self.assertEqual(detect_faces.call_count, 4)
+        self.assertEqual(result["n_frames"], 20)
+        # The first detection starts a track; the next ones overlap it enough to continue it
+        self.assertEqual(len(result["faces"]), 1)
+        face = result["faces"][0]
+        self.assertEqual((face["face_id"], face["n_frames"], face["first_frame"], face["last_frame"]), (1, 20, 0, 19))
+        self.assertEqual(len(face["dominant_colors"]), 2)
+        self.assertEqual(result["report_images"][1].shape[2], 3)
+
+    def test_video_without_faces(self):
+        result = process(str(self.video), frame_stride=2)
+        self.assertEqual(result["basename"], "clip")
+        self.assertEqual(result["n_frames"], 10)
+        self.assertEqual([(face["face_id"], face["n_frames"]) for face in result["faces"]], [("NA", 10)])
+
+    def test_videos_are_searched_on_demand(self):
+        self.assertEqual(list(iter_image_paths(str(self.directory))), [])
+        self.assertEqual(list(iter_image_paths(str(self.directory), include_videos=True)), [self.video.resolve()])
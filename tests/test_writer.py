@@ -0,0 +1,112 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from stone.utils import ResultRecords
+from stone.writer import CSVResultWriter, JSONLinesResultWriter, ResultWriter
+
+RESULT = {
+    "basename": "smith, john",
+    "extension": ".jpg",
+    "image_type": "color",
+    "faces": [
+        {
+            "face_id": 1,
+            "dominant_colors": [{"color": "#C99676", "percent": "0.67"}, {"color": "#805341", "percent": "0.33"}],
+            "skin_tone": "#9D7A54",
+            "tone_label": "CF",
+            "accuracy": 86.27,
+        },
+    ],
+    "report_images": {1: None},
+}
+ERROR = {"filename": "/images/a.jpg", "message": 'Error processing image /images/a.jpg: "broken",\ntruncated'}
+
+
+class TestResultWriter(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.directory = Path(self.tmp_dir.name)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_csv_quotes_values(self):
+        filename = self.directory / "result.csv"
+        with CSVResultWriter(filename) as writer:
+            writer.write(RESULT, "/images/smith, john.jpg")
+            writer.write(ERROR, "/images/a.jpg")
+            writer.write(RESULT)
+        records = ResultRecords.read(filename)
+        self.assertEqual(records.header[:4], ["file", "image type", "face id", "dominant 1"])
+        self.assertEqual(records.header[-1], "path")
+        # The result written without the input is recorded by its filename
+        self.assertEqual(records.processed, {"/images/smith, john.jpg", "smith, john.jpg"})
+        self.assertEqual(records.failed, {"/images/a.jpg"})
+
+        records.write(filename, include_failed=False)
+        self.assertEqual(ResultRecords.read(filename).failed, set())
+
+    def test_buffering(self):
+        filename = self.directory / "result.csv"
+        writer = CSVResultWriter(filename, buffer_size=1000, flush_interval=60)
+        header = filename.read_text()
+        writer.write(RESULT)
+        self.assertEqual(filename.read_text(), header)
+        for _ in range(20):
+            writer.write(RESULT)
+        self.assertGreater(len(filename.read_text()), len(header))
+        writer.close()
+        self.assertEqual(len(filename.read_text().splitlines()), 22)
+
+        writer = CSVResultWriter(filename, buffer_size=1000, flush_interval=0)
+        writer.write(RESULT)
+        self.assertEqual(len(filename.read_text().splitlines()), 2)
+        writer.close()
+
+    def test_append(self):
+        filename = self.directory / "result.csv"
+        with CSVResultWriter(filename) as writer:
+            writer.write(RESULT)
+        with CSVResultWriter(filename, append=True) as writer:
+            writer.write(ERROR)
+        lines = filename.read_text().splitlines()
+        self.assertEqual(sum(line.startswith("file,") for line in lines), 1)
+
+    def test_format_is_abstract(self):
+        class IncompleteWriter(ResultWriter):
+            extension = ".txt"
+
+        filename = self.directory / "result.txt"
+        with self.assertRaises(TypeError):
+            IncompleteWriter(filename)
+        self.assertFalse(filename.exists())
+
+    def test_without_path(self):
+        filename = self.directory / "result.csv"
+        with CSVResultWriter(filename, with_path=False) as writer:
+            writer.write(RESULT, "/images/smith, john.jpg")
+            writer.write(ERROR, "/images/a.jpg")
+        records = ResultRecords.read(filename)
+        self.assertEqual(records.header[-1], "accuracy(0-100)")
+        # Matched by the filename, as the records of older versions
+        self.assertEqual(records.processed, {"smith, john.jpg"})
+        self.assertTrue(records.contains("/other/smith, john.jpg"))
+        self.assertTrue(records.contains("/images/a.jpg"))
+
+    def test_json_lines(self):
+        filename = self.directory / "result.jsonl"
+        with JSONLinesResultWriter(filename) as writer:
+            writer.write(RESULT, "/images/smith, john.jpg")
+            writer.write(ERROR, "/images/a.jpg")
+        lines = filename.read_text().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(json.loads(lines[0])["faces"], RESULT["faces"])
+        self.assertNotIn("report_images", json.loads(lines[0]))
+        self.assertEqual(json.loads(lines[0])["path"], "/images/smith, john.jpg")
+
+        records = ResultRecords.read(filename)
+        self.assertTrue(records.contains("/images/smith, john.jpg"))
+        self.assertFalse(records.contains("/other/smith, john.jpg"))
+        self.assertTrue(records.contains("/images/a.jpg"))